@@ -1,9 +1,8 @@
 from __future__ import annotations
 
 import os
-import random
 from enum import Enum
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 import networkx as nx
 import pickle
 
@@ -11,6 +10,17 @@ from matplotlib import pyplot as plt
 
 from threading import Lock
 
+from .RandomStream import RNG, resolve_rng
+
+if TYPE_CHECKING:
+    from .CFGAnalysis import CFGAnalysis
+    from .CFGCorpus import CFGCorpus
+    from .CFGValidator import CFGViolation
+    from .CoverageSelector import CoverageReport
+    from .FrozenCFG import FrozenCFG
+    from .PathEvaluator import ExpectedPaths
+    from .StructuredCFG import StructuredCFG
+
 # Lock for thread safety when saving images
 save_lock = Lock()
 
@@ -19,9 +29,12 @@ class CFGFormat(Enum):
     NX_MULTI_DIGRAPH = 1,
     GRAPH_ML = 2
     PNG = 3
+    CORPUS = 4  # many CFGs in one compact binary file, c.f. CFGCorpus
 
 # MINOR TODO: refactor to use DiGraph internally, a better fit
 
+_ABSENT = object()  # placeholder for the value of a node attribute the node doesn't have
+
 class CFG:
     """
     A simple interface for nx.MultiDiGraph, abstracting its implementation details
@@ -45,6 +58,7 @@ class CFG:
             raise ValueError("Don't include both a graph and filename in the parameters")
 
         self.graph = nx.MultiDiGraph()
+        self._version = 0
 
         if graph:
             # TODO: Ensure graph has no node attributes, except possibly EntryBlock
@@ -57,6 +71,29 @@ class CFG:
         elif filepath:
             self.load(filepath)
 
+    @classmethod
+    def _lazily_from_corpus(cls, corpus: 'CFGCorpus', ix: int) -> 'CFG':
+        """CFG for graph ix of the corpus, whose nx graph is only decoded on first access"""
+        cfg = cls()
+        del cfg.graph
+        cfg._corpus_record = (corpus, ix)
+        return cfg
+
+    def __getattr__(self, name):
+        # NB: only called if normal lookup fails, i.e. for the graph of a CFG lazily loaded from a corpus
+        if name == 'graph' and '_corpus_record' in self.__dict__:
+            corpus, ix = self.__dict__.pop('_corpus_record')
+            self.graph = corpus.graph(ix)
+            return self.graph
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __getstate__(self):
+        return {'graph': self.graph}  # NB: decodes a lazily loaded graph, rather than pickling the corpus
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._version = 0  # NB: pickles of older versions have no version
+
     def __eq__(self, other):
         if not isinstance(other, CFG):
             return False
@@ -100,23 +137,39 @@ class CFG:
                 pickle.dump(self.graph, file)
         elif fmt == CFGFormat.PNG:
             self._save_image(filepath)
+        elif fmt == CFGFormat.CORPUS:
+            from .CFGCorpus import CFGCorpusWriter
+            with CFGCorpusWriter(filepath) as writer:
+                writer.append(self)
         else:
             raise ValueError('Unsupported CFGFormat')
 
-    def load(self, filepath: str, fmt: CFGFormat = CFGFormat.CFG, load_as_wasm_friendly_cfg: bool = True) -> 'CFG':
-        """Loads a graph from a file in the specified format."""
+    def load(self, filepath: str, fmt: CFGFormat = CFGFormat.CFG, load_as_wasm_friendly_cfg: bool = True,
+             index: int = 0) -> 'CFG':
+        """Loads a graph from a file in the specified format.
+        index: for CFGFormat.CORPUS, which graph in the corpus. It's decoded lazily, on first use"""
 
-        if fmt not in {CFGFormat.NX_MULTI_DIGRAPH, CFGFormat.CFG, CFGFormat.ALLOY}:
+        if fmt not in {CFGFormat.NX_MULTI_DIGRAPH, CFGFormat.CFG, CFGFormat.GRAPH_ML, CFGFormat.CORPUS}:
             raise TypeError("Unsupported CFGFormat")
 
+        self._drop_node_index()  # NB: the graph is about to be replaced
+        self._mutated()
         if fmt == CFGFormat.GRAPH_ML:
             self.graph = nx.read_graphml(filepath)
             return self
+        elif fmt == CFGFormat.CORPUS:
+            from .CFGCorpus import CFGCorpus
+            self.__dict__.pop('graph', None)
+            self._corpus_record = (CFGCorpus(filepath), index)
+            return self
         else:
             with open(filepath, 'rb') as file:
                 cfg = pickle.load(file)
 
-        self._load_cfg(cfg)
+        if fmt == CFGFormat.NX_MULTI_DIGRAPH:
+            self.graph = cfg
+        else:
+            self._load_cfg(cfg)
 
         return self
 
@@ -124,10 +177,68 @@ class CFG:
         self.graph = cfg_graph.graph
         # Add additional attributes from CFG graph if it becomes necessary
 
-    # GETTERS
+    @property
+    def version(self) -> tuple:
+        """Changes whenever the graph does, so anything derived from the graph can be cached against it. Mutating
+        methods (add_edge, update_node_attribute, ...) bump it; node and edge counts catch most direct nx edits"""
+        if '_corpus_record' in self.__dict__:
+            return self._version,  # NB: not decoded yet, so can't have been edited
+        return self._version, self.graph.number_of_nodes(), self.graph.number_of_edges()
+
+    def _mutated(self) -> None:
+        self._version += 1
+
+    def freeze(self) -> 'FrozenCFG':
+        """Return an immutable, array-backed snapshot of the CFG for hot read-only use (path simulation, codegen).
+        The snapshot is cached until the CFG next changes (c.f. version). NB: it doesn't track those changes"""
+        from .FrozenCFG import FrozenCFG
+        version = self.version
+        cached = self.__dict__.get('_frozen')
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        if '_corpus_record' in self.__dict__:
+            corpus, ix = self._corpus_record
+            frozen = corpus.freeze(ix)  # NB: straight from the corpus, so the nx graph is never built
+        else:
+            frozen = FrozenCFG(self)
+        self._frozen = (version, frozen)
+        return frozen
+
+    def analysis(self) -> 'CFGAnalysis':
+        """Structural analyses of the CFG's current version (dominators, enclosing loops, ...), c.f. CFGAnalysis"""
+        return self.freeze().analysis()
+
+    def structure(self, nests_switch_cases: bool = False) -> 'StructuredCFG':
+        """The structured control flow tree of the CFG's current version, c.f. StructuredCFG"""
+        return self.freeze().structure(nests_switch_cases)
+
+    def validate(self) -> list['CFGViolation']:
+        """Every way the CFG breaks the structured control flow invariants the code builders assume (none if it's
+        valid), c.f. CFGValidator. Cheap enough to call on every generated or hand-edited CFG before building code"""
+        from .CFGValidator import CFGViolation
+
+        violations = []
+        merge_headers, entry_blocks = self._node_index()
+        if len(entry_blocks) != 1:
+            violations.append(CFGViolation(tuple(sorted(entry_blocks)), f"{len(entry_blocks)} entry blocks, not 1"))
+        for merge_block, headers in merge_headers.items():
+            if merge_block not in self.graph:
+                violations.append(CFGViolation((*sorted(headers), merge_block), "merge block isn't in the CFG"))
+        if violations:
+            return violations  # NB: can't freeze (so analyse) the CFG as is
+
+        return self.freeze().validate()
+
+    def canonical_form(self) -> bytes:
+        """c.f. FrozenCFG.canonical_form"""
+        return self.freeze().canonical_form()
+
+    def fingerprint(self) -> str:
+        """c.f. FrozenCFG.fingerprint. Unlike hash(cfg), equal for CFGs that only differ in block numbering"""
+        return self.freeze().fingerprint()
 
-    def graph(self) -> nx.MultiDiGraph:
-        return self.graph
+    # GETTERS
 
     # ... nodes ...
 
@@ -156,7 +267,7 @@ class CFG:
 
     def is_merge_block(self, block: int):
         """Return if block is a merge for any (header) node(s)"""
-        return any(self.graph.nodes[n].get("Merge") == block for n in self.nodes())
+        return block in self._node_index()[0]
 
     def out_edges_destinations(self, block) -> list[int]:
         return [e[1] for e in self.out_edges(block)]
@@ -170,17 +281,18 @@ class CFG:
         return len(self.graph.out_edges(block)) == 0
 
     def entry_node(self) -> int:
-        nodes = self.nodes(data=True)
-        for n, data in nodes:
-            if 'EntryBlock' in data:
-                return n  # return the key of the node
-        raise ValueError("EntryBlock not found")
+        entry_blocks = self._node_index()[1]
+        if len(entry_blocks) == 1:
+            return next(iter(entry_blocks))
+        if not entry_blocks:
+            raise ValueError("EntryBlock not found")
+        return next(n for n in self.nodes() if n in entry_blocks)  # NB: if several, the first in node order
 
     def ancestors(self, node: int):
-        return nx.ancestors(self.graph, node)
+        return set(self.analysis().ancestors(node))
 
     def descendants(self, node: int):
-        return nx.descendants(self.graph, node)
+        return set(self.analysis().descendants(node))
 
     def node_attributes(self, node):
         if node not in self.graph:
@@ -191,6 +303,43 @@ class CFG:
             attrs.append(f"{attr}: {value}")
         return attrs
 
+    # ... reverse indices ...
+
+    def _node_index(self) -> tuple[dict[int, set[int]], set[int]]:
+        """(merge block -> its header(s), entry block(s)). Built on first use, then kept in sync by the node
+        attribute methods, so is_merge_block and entry_node don't scan every node"""
+        if '_merge_headers' not in self.__dict__:
+            self._merge_headers, self._entry_blocks = {}, set()
+            for block, attrs in self.graph.nodes(data=True):
+                if 'Merge' in attrs:
+                    self._reindex_node_attribute(block, 'Merge', _ABSENT, attrs['Merge'])
+                if 'EntryBlock' in attrs:
+                    self._reindex_node_attribute(block, 'EntryBlock', _ABSENT, attrs['EntryBlock'])
+        return self._merge_headers, self._entry_blocks
+
+    def _reindex_node_attribute(self, node, attr_label: str, old_value, new_value) -> None:
+        """Update the reverse indices for a change in a node attribute (_ABSENT: the node hasn't/won't have it)"""
+        if '_merge_headers' not in self.__dict__:
+            return  # NB: not built yet, so will be built from the graph as is
+        if attr_label == 'Merge':
+            if old_value is not _ABSENT:
+                headers = self._merge_headers[old_value]
+                headers.discard(node)
+                if not headers:
+                    del self._merge_headers[old_value]
+            if new_value is not _ABSENT:
+                self._merge_headers.setdefault(new_value, set()).add(node)
+        elif attr_label == 'EntryBlock':
+            if new_value is _ABSENT:
+                self._entry_blocks.discard(node)
+            else:
+                self._entry_blocks.add(node)
+
+    def _drop_node_index(self) -> None:
+        """For changes the indices aren't updated for (e.g. adding or removing nodes). Rebuilt on next use"""
+        self.__dict__.pop('_merge_headers', None)
+        self.__dict__.pop('_entry_blocks', None)
+
     def add_node_attribute(self, node, attr_label: str, value: bool | int):
         if node not in self.graph.nodes:
             raise RuntimeError(f"Node {node} does not exist in the graph")
@@ -198,6 +347,8 @@ class CFG:
             raise RuntimeError(f"{attr_label} already in CFG node")
 
         self.graph.nodes[node][attr_label] = value
+        self._reindex_node_attribute(node, attr_label, _ABSENT, value)
+        self._mutated()
 
     def remove_node_attribute(self, node, attr_label: str):
 
@@ -207,7 +358,8 @@ class CFG:
         if attr_label not in self.graph.nodes[node]:
             raise RuntimeError(f"Attribute {attr_label} does not exist in node {node}")
 
-        del self.graph.nodes[node][attr_label]
+        self._reindex_node_attribute(node, attr_label, self.graph.nodes[node].pop(attr_label), _ABSENT)
+        self._mutated()
 
     def _add_edge_attribute(self, edge, attr_label: str, value: bool | int):
         if edge not in self.graph.edges:
@@ -218,6 +370,7 @@ class CFG:
             edge = (*edge, 0)
 
         self.graph.edges[edge][attr_label] = value
+        self._mutated()
 
     def update_node_attribute(self, node, attr_label: str, value: bool | int):
         if node not in self.graph.nodes:
@@ -225,7 +378,9 @@ class CFG:
         if attr_label not in self.graph.nodes[node]:
             raise RuntimeError(f"Can't update {attr_label}: not in CFG node")
 
+        self._reindex_node_attribute(node, attr_label, self.graph.nodes[node][attr_label], value)
         self.graph.nodes[node][attr_label] = value
+        self._mutated()
 
     def update_edge_attribute(self, edge, attr_label: str, value: bool | int):
         if edge not in self.graph.edges:
@@ -234,6 +389,7 @@ class CFG:
             raise RuntimeError(f"Can't update {attr_label}: not in CFG edge")
 
         self.graph.edges[edge][attr_label] = value
+        self._mutated()
 
     # ... edges ...
 
@@ -271,8 +427,9 @@ class CFG:
 
     # VALIDATE
 
-    def is_reachable(self, source: int, destination: int) -> bool:
-        return nx.algorithms.has_path(self.graph, source, destination)
+    def is_reachable(self, source: int, destination: int, avoiding: int = None) -> bool:
+        """avoiding: a block the path mustn't pass through, c.f. CFGAnalysis.is_reachable"""
+        return self.analysis().is_reachable(source, destination, avoiding)
 
     # MANIPULATION
 
@@ -290,6 +447,9 @@ class CFG:
         (Excerpt from networkx's add_node function)
         """
         self.graph.add_node(node_to_add, **attr)
+        if attr:
+            self._drop_node_index()
+        self._mutated()
 
     def add_nodes(self, nodes_to_add: list[int], **attr):
         """
@@ -310,13 +470,17 @@ class CFG:
         (Excerpt from networkx's add_nodes function)
         """
         self.graph.add_nodes_from(nodes_to_add, **attr)
+        self._drop_node_index()  # NB: nodes_to_add may carry attributes
+        self._mutated()
 
     def add_successors(self, children: list[int], node: int):
         for child in children:
             self.graph.add_edge(node, child)  # NB: automatically adds child node if not in graph
+        self._mutated()
 
     def add_edge(self, u: int, v: int, key=None, **attr):
         """c.f. MultiDiGraph's add_edge()"""
+        self._mutated()
         return self.graph.add_edge(u, v, key, **attr)
 
     def remove_edge(self, u: int, v: int, key=None):
@@ -335,6 +499,7 @@ class CFG:
         (Excerpt from MultiDiGraph's docstring)
         """
         self.graph.remove_edge(u, v, key)
+        self._mutated()
 
     def remove_edges_from(self, ebunch: list):
         """Wrapper function
@@ -346,10 +511,13 @@ class CFG:
                 - 4-tuples (u, v, key, data) where data is ignored.
         """
         self.graph.remove_edges_from(ebunch)
+        self._mutated()
 
     def remove_nodes_from(self, nodes):
         """Wrapper function c.f. NetworkX's remove_nodes_from for details"""
         self.graph.remove_nodes_from(nodes)
+        self._drop_node_index()
+        self._mutated()
 
     def edge_index_to_dst_block(self, src_block: int, edge_ix: int):
 
@@ -363,47 +531,68 @@ class CFG:
 
         raise IndexError("Index out of range")
 
-    def generate_valid_input_directions(self, seed: int = None, max_length: int = 64) -> list[int]:
+    def distances_to_exit(self) -> dict[int, int]:
+        """c.f. FrozenCFG.distances_to_exit"""
+        return self.freeze().distances_to_exit()
 
-        # TODO: add param to return n distinct valid_input_directions as list[list[int]]
-        if seed is None:
-            seed = random.randint(0, 2 ** 32 - 1)
-        random.seed(seed)
-
-        MAX_ATTEMPTS = 16
+    def generate_valid_input_directions(self, seed: int = None, max_length: int = 64, rng: RNG = None) -> list[int]:
+        """
+        Random walk from the entry block to an exit. At each branch, only edges from which an exit is still reachable
+        within the remaining max_length directions are taken, so a single walk always succeeds.
+        seed, rng: c.f. resolve_rng. NB: the global `random` module is never reseeded, only drawn from if neither's
+            given
+        """
 
-        for _ in range(MAX_ATTEMPTS):
+        rng = resolve_rng(seed, rng)
 
-            directions: list[int] = []
-            current_node = self.entry_node()
+        distances = self.distances_to_exit()
+        unreachable = float('inf')
 
-            length_remaining = max_length
+        directions: list[int] = []
+        current_node = self.entry_node()
 
-            while length_remaining > 0:
+        if distances.get(current_node, unreachable) > max_length:
+            raise RuntimeError(f'Failed to generate input directions of max length {max_length}. '
+                               'Check CFG end nodes are always reachable or increase max_length parameter')
 
-                if self.is_end_node(current_node):
-                    break
-                elif self.out_degree(current_node) == 1:
-                    edge_index = 0
-                    # no choice made so it doesn't require a direction
-                else:
-                    edge_index = random.randint(0, self.out_degree(current_node) - 1)
-                    directions.append(edge_index)
-                    length_remaining -= 1
+        length_remaining = max_length
 
-                dst = self.edge_index_to_dst_block(current_node, edge_index)
-                current_node = dst
+        while not self.is_end_node(current_node):
 
-            # if directions results in full path, return
-            if self.is_end_node(current_node):
-                return directions
+            if self.out_degree(current_node) == 1:
+                edge_index = 0
+                # no choice made so it doesn't require a direction
             else:
-                continue
+                edge_indices = [ix for ix in range(self.out_degree(current_node))
+                                if distances.get(self.edge_index_to_dst_block(current_node, ix),
+                                                 unreachable) < length_remaining]
+                edge_index = edge_indices[rng.randint(0, len(edge_indices) - 1)]
+                directions.append(edge_index)
+                length_remaining -= 1
 
-        # TODO: replace ATTEMPTS with if we are not at exit node by max_length, find and follow shortest path to exit
+            current_node = self.edge_index_to_dst_block(current_node, edge_index)
+
+        return directions
+
+    def generate_input_directions_of_length(self, min_length: int, max_length: int = None,
+                                            seed: int = None, rng: RNG = None) -> list[int]:
+        """c.f. FrozenCFG.generate_input_directions_of_length"""
+        return self.freeze().generate_input_directions_of_length(min_length, max_length, seed, rng)
 
-        raise RuntimeError(f'Failed to generate input directions of max length {max_length}. '
-                           'Check CFG end nodes are always reachable or increase max_length parameter')
+    def generate_covering_input_directions(self, seed: int = None, max_length: int = 512,
+                                           no_of_samples: int = 32,
+                                           rng: RNG = None) -> tuple[list[list[int]], 'CoverageReport']:
+        """c.f. FrozenCFG.generate_covering_input_directions"""
+        return self.freeze().generate_covering_input_directions(seed, max_length, no_of_samples, rng)
+
+    def count_valid_input_directions(self, max_length: int = 64) -> int:
+        """c.f. FrozenCFG.count_valid_input_directions"""
+        return self.freeze().count_valid_input_directions(max_length)
+
+    def generate_n_valid_input_directions(self, n: int, seed: int = None, max_length: int = 64,
+                                          rng: RNG = None) -> list[list[int]]:
+        """c.f. FrozenCFG.generate_n_valid_input_directions"""
+        return self.freeze().generate_n_valid_input_directions(n, seed, max_length, rng)
 
     def expected_output_path(self, input_directions: list[int]) -> list[int]:
 
@@ -432,6 +621,10 @@ class CFG:
 
         return path
 
+    def expected_output_paths(self, directions, lengths=None) -> 'ExpectedPaths':
+        """Batch version of `expected_output_path`. c.f. FrozenCFG.expected_output_paths"""
+        return self.freeze().expected_output_paths(directions, lengths)
+
     def is_multi_edge(self, edge):
         if not edge:
             return False
@@ -471,7 +664,7 @@ class CFG:
         return is_br
 
     def contains_merge_instruction(self, block):
-        return self.graph.nodes[block].get("Merge") != []
+        return "Merge" in self.graph.nodes[block]
 
     def merge_block(self, block):
         if not self.contains_merge_instruction(block):
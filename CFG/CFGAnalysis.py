@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+from .ReachabilityIndex import ReachabilityIndex
+
+if TYPE_CHECKING:
+    from .FrozenCFG import FrozenCFG
+
+
+class CFGAnalysis:
+    """
+    Structural facts about a CFG that code building keeps asking for: (post)dominators, the merge -> header(s) map,
+    the loops enclosing each block (i.e. the loop-nesting forest) and reachability (c.f. ReachabilityIndex). Each is
+    computed on first use, then kept.
+
+    Get one via `cfg.analysis()`. A CFG's analysis is tied to its version, so it's shared until the CFG is mutated
+    (add_edge, remove_edge, add/update/remove_node_attribute, ...), then recomputed on next use. A FrozenCFG never
+    changes, so has one analysis for life.
+
+    Loops are structured constructs: the loop of header h is every block dominated by h but not by h's merge block.
+    """
+
+    def __init__(self, cfg: 'FrozenCFG'):
+        self._cfg = cfg
+        self._successors = [list(cfg._successor_ixs(ix)) for ix in range(len(cfg))]
+        self._predecessors = None
+        self._idoms = None
+        self._post_idoms = None
+        self._merge_to_headers = None
+        self._dom_intervals = None
+        self._post_dom_intervals = None
+        self._enclosing_loops = None
+        self._loop_bodies = None
+        self._loop_body_blocks = {}
+        self._reachability_indices = {}
+        self._loop_reachability_indices = {}
+        self._reverse_reachability = None
+        self._descendants = {}
+        self._ancestors = {}
+
+    # HELPERS
+
+    @staticmethod
+    def _immediate_dominators(root: int, successors: list[list[int]],
+                              predecessors: list[list[int]]) -> dict[int, int]:
+        """
+        Immediate dominator of every node reachable from root (root maps to itself), over dense ixs.
+        c.f. Cooper, Harvey & Kennedy, "A Simple, Fast Dominance Algorithm"
+        """
+        postorder = []
+        seen = {root}
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(node)
+
+        po_number = [-1] * len(successors)
+        for i, node in enumerate(postorder):
+            po_number[node] = i
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while po_number[a] < po_number[b]:
+                    a = idoms[a]
+                while po_number[b] < po_number[a]:
+                    b = idoms[b]
+            return a
+
+        idoms = {root: root}
+        changed = True
+        while changed:
+            changed = False
+            for node in reversed(postorder[:-1]):  # NB: reverse postorder, less the root
+                new_idom = None
+                for pred in predecessors[node]:
+                    if pred in idoms:  # NB: i.e. processed, so reachable
+                        new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if idoms.get(node) != new_idom:
+                    idoms[node] = new_idom
+                    changed = True
+        return idoms
+
+    def _ix_predecessors(self) -> list[list[int]]:
+        if self._predecessors is None:
+            self._predecessors = [[] for _ in self._successors]
+            for src, dsts in enumerate(self._successors):
+                for dst in dsts:
+                    self._predecessors[dst].append(src)
+        return self._predecessors
+
+    def _ix_idoms(self) -> dict[int, int]:
+        if self._idoms is None:
+            entry = self._cfg._entry
+            self._idoms = {} if entry is None else self._immediate_dominators(entry, self._successors,
+                                                                              self._ix_predecessors())
+        return self._idoms
+
+    def _ix_post_idoms(self) -> dict[int, int]:
+        if self._post_idoms is None:
+            n = len(self._successors)
+            exits = [ix for ix in range(n) if not self._successors[ix]]
+            # NB: on the reversed CFG, w/ a virtual exit (n) after every exit
+            self._post_idoms = self._immediate_dominators(n, self._ix_predecessors() + [exits],
+                                                          [dsts or [n] for dsts in self._successors] + [[]])
+            del self._post_idoms[n]
+        return self._post_idoms
+
+    def _ix_merge_to_headers(self) -> dict[int, list[int]]:
+        if self._merge_to_headers is None:
+            self._merge_to_headers = {}
+            for header, merge in enumerate(self._cfg._merge):
+                if merge != self._cfg._NO_BLOCK:
+                    self._merge_to_headers.setdefault(merge, []).append(header)
+        return self._merge_to_headers
+
+    @staticmethod
+    def _children(idoms: dict[int, int]) -> dict[int, list[int]]:
+        children = {ix: [] for ix in idoms}
+        for ix, idom in idoms.items():
+            if ix != idom:
+                children[idom].append(ix)
+        return children
+
+    @classmethod
+    def _tree_intervals(cls, idoms: dict[int, int], root: int) -> dict[int, tuple[int, int]]:
+        """Pre-order no. of each node of a (post)dominator tree, and the highest in its subtree, so a dominates b iff
+        b's interval is within a's: an O(1) test"""
+        children = cls._children(idoms)
+        intervals = {}
+        clock = 0
+        stack = [(root, False)] if idoms else []
+        while stack:
+            ix, is_done = stack.pop()
+            if is_done:
+                intervals[ix] = (intervals[ix], clock - 1)
+                continue
+            intervals[ix] = clock
+            clock += 1
+            stack.append((ix, True))
+            stack.extend((child, False) for child in children[ix])
+        return intervals
+
+    def _walk_dominator_tree(self):
+        """One DFS of the dominator tree, tracking which loops are open (i.e. enclose the block)"""
+        idoms = self._ix_idoms()
+        children = self._children(idoms)
+        merge_to_headers = self._ix_merge_to_headers()
+        is_loop_header = [bool(flags & self._cfg.LOOP_HEADER) for flags in self._cfg._flags]
+
+        self._enclosing_loops = {}
+        self._loop_bodies = {ix: [] for ix in idoms if is_loop_header[ix]}
+        stack = [(self._cfg._entry, ())] if idoms else []
+        while stack:
+            ix, outer = stack.pop()
+
+            # a loop ends where its merge block is, i.e. the merge and anything it dominates is outside it
+            closed = merge_to_headers.get(ix)
+            if closed:
+                outer = tuple(header for header in outer if header not in closed)
+            self._enclosing_loops[ix] = outer
+            for header in outer:
+                self._loop_bodies[header].append(ix)
+
+            inner = outer + (ix,) if is_loop_header[ix] else outer
+            stack.extend((child, inner) for child in children[ix])
+
+    # DOMINATORS
+
+    def immediate_dominator(self, block: int) -> Optional[int]:
+        """None for the entry, and for blocks unreachable from it"""
+        ix = self._cfg._ix(block)
+        idom = self._ix_idoms().get(ix)
+        return None if idom is None or idom == ix else self._cfg._ids[idom]
+
+    def dominates(self, a: int, b: int) -> bool:
+        """Whether every path from the entry to b passes through a (NB: a block dominates itself)"""
+        if self._dom_intervals is None:
+            self._dom_intervals = self._tree_intervals(self._ix_idoms(), self._cfg._entry)
+        return self._within(self._dom_intervals, a, b)
+
+    def immediate_post_dominator(self, block: int) -> Optional[int]:
+        """None for exits, and for blocks that can't reach one"""
+        post_idom = self._ix_post_idoms().get(self._cfg._ix(block))
+        return None if post_idom is None or post_idom == len(self._cfg) else self._cfg._ids[post_idom]
+
+    def post_dominates(self, a: int, b: int) -> bool:
+        """Whether every path from b to an exit passes through a (NB: a block post-dominates itself)"""
+        if self._post_dom_intervals is None:
+            post_idoms = dict(self._ix_post_idoms())
+            post_idoms[len(self._cfg)] = len(self._cfg)  # NB: the virtual exit, c.f. _ix_post_idoms
+            self._post_dom_intervals = self._tree_intervals(post_idoms, len(self._cfg))
+        return self._within(self._post_dom_intervals, a, b)
+
+    def _within(self, intervals: dict[int, tuple[int, int]], a: int, b: int) -> bool:
+        a_interval, b_interval = intervals.get(self._cfg._ix(a)), intervals.get(self._cfg._ix(b))
+        if a_interval is None or b_interval is None:
+            return False
+        return a_interval[0] <= b_interval[0] and b_interval[1] <= a_interval[1]
+
+    # MERGES AND LOOPS
+
+    def headers_of(self, merge_block: int) -> list[int]:
+        """The header(s) whose merge block is merge_block"""
+        headers = self._ix_merge_to_headers().get(self._cfg._ix(merge_block), [])
+        return [self._cfg._ids[header] for header in headers]
+
+    def merge_blocks(self) -> set[int]:
+        return {self._cfg._ids[merge] for merge in self._ix_merge_to_headers()}
+
+    def enclosing_loops(self, block: int) -> tuple[int, ...]:
+        """Headers of the loops enclosing block, from outer to innermost (excluding block's own loop, if a header)"""
+        if self._enclosing_loops is None:
+            self._walk_dominator_tree()
+        return tuple(self._cfg._ids[header] for header in self._enclosing_loops.get(self._cfg._ix(block), ()))
+
+    def enclosing_loops_inclusive(self, block: int) -> tuple[int, ...]:
+        """c.f. enclosing_loops, but if block is a loop header, its own loop is included (last)"""
+        loops = self.enclosing_loops(block)
+        return loops + (block,) if self._cfg.is_loop_header(block) else loops
+
+    def loop_nesting_forest(self) -> dict[int, Optional[int]]:
+        """For each loop header (reachable from the entry), the header of the loop directly enclosing its loop"""
+        if self._loop_bodies is None:
+            self._walk_dominator_tree()
+        ids = self._cfg._ids
+        return {ids[header]: (ids[self._enclosing_loops[header][-1]] if self._enclosing_loops[header] else None)
+                for header in self._loop_bodies}
+
+    def blocks_in_loop(self, header: int) -> frozenset[int]:
+        """Every block the loop of header encloses (i.e. block s.t. header in enclosing_loops(block))"""
+        if self._loop_bodies is None:
+            self._walk_dominator_tree()
+        ix = self._cfg._ix(header)
+        if ix not in self._loop_body_blocks:
+            self._loop_body_blocks[ix] = frozenset(self._cfg._ids[block] for block in self._loop_bodies.get(ix, ()))
+        return self._loop_body_blocks[ix]
+
+    # REACHABILITY
+
+    def _reachability(self, avoiding: Optional[int] = None) -> ReachabilityIndex:
+        """Closure of the CFG or, if avoiding is a block (ix), of the CFG w/ that block's out edges removed"""
+        if avoiding not in self._reachability_indices:
+            successors = self._successors
+            if avoiding is not None:
+                successors = successors.copy()
+                successors[avoiding] = []
+            self._reachability_indices[avoiding] = ReachabilityIndex(successors)
+        return self._reachability_indices[avoiding]
+
+    def _loop_reachability(self, header: int) -> Optional[tuple[dict[int, int], ReachabilityIndex]]:
+        """
+        Closure of just the body of header's (ix) loop, w/ the local ix of each body block. Within the body, paths
+        that avoid the header never leave it, so this answers avoiding-header queries for a fraction of the cost of a
+        whole-CFG closure. None if the body can be entered other than via the header (not so in a structured CFG)
+        """
+        if header not in self._loop_reachability_indices:
+            if self._loop_bodies is None:
+                self._walk_dominator_tree()
+            body = self._loop_bodies.get(header, [])
+            local = {ix: local_ix for local_ix, ix in enumerate(body)}
+            predecessors = self._ix_predecessors()
+            if all(src in local or src == header for ix in body for src in predecessors[ix]):
+                index = ReachabilityIndex([[local[dst] for dst in self._successors[ix] if dst in local]
+                                           for ix in body])
+                self._loop_reachability_indices[header] = local, index
+            else:
+                self._loop_reachability_indices[header] = None
+        return self._loop_reachability_indices[header]
+
+    def _reaches_avoiding(self, src: int, dst: int, avoiding: int) -> bool:
+        if self._cfg._flags[avoiding] & self._cfg.LOOP_HEADER:
+            loop = self._loop_reachability(avoiding)
+            if loop is not None and src in loop[0] and dst in loop[0]:
+                return loop[1].reaches(loop[0][src], loop[0][dst])
+        return self._reachability(avoiding).reaches(src, dst)
+
+    def descendants(self, block: int) -> frozenset[int]:
+        ix = self._cfg._ix(block)
+        if ix not in self._descendants:
+            reached = self._reachability().reachable_from(ix)
+            self._descendants[ix] = frozenset(self._cfg._ids[dst] for dst in reached if dst != ix)
+        return self._descendants[ix]
+
+    def ancestors(self, block: int) -> frozenset[int]:
+        ix = self._cfg._ix(block)
+        if ix not in self._ancestors:
+            if self._reverse_reachability is None:
+                self._reverse_reachability = ReachabilityIndex(self._ix_predecessors())
+            reached = self._reverse_reachability.reachable_from(ix)
+            self._ancestors[ix] = frozenset(self._cfg._ids[src] for src in reached if src != ix)
+        return self._ancestors[ix]
+
+    def is_reachable(self, source: int, destination: int, avoiding: Optional[int] = None) -> bool:
+        """
+        Whether there's a path from source to destination. O(1) once the closure's built.
+        avoiding: a block (e.g. a loop header) the path mustn't pass through. It may still start or end there
+        """
+        if source == destination:
+            return True
+        src, dst = self._cfg._ix(source), self._cfg._ix(destination)
+        if avoiding is None:
+            return self._reachability().reaches(src, dst)
+
+        avoiding = self._cfg._ix(avoiding)
+        if src == avoiding:
+            return any(succ == dst or self._reaches_avoiding(succ, dst, avoiding) for succ in self._successors[src])
+        return self._reaches_avoiding(src, dst, avoiding)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from typing import TYPE_CHECKING
+
+import networkx as nx
+import numpy as np
+
+from .CFG import CFG
+
+if TYPE_CHECKING:
+    from .FrozenCFG import FrozenCFG
+
+
+class CFGCorpus:
+    """
+    Read-only view of many CFGs packed into one file (CFGFormat.CORPUS), memory-mapped so graph i is decoded w/o
+    reading, let alone parsing, any of the others.
+
+    File layout (little-endian):
+        header      magic b'CFGC', version: u32, no. of graphs: u64, index offset: u64
+        records     one per graph, each 8-byte aligned (see below)
+        index       u64[no. of graphs + 1]: file offset of each record, then the end of the last one
+
+    Record for a graph w/ n blocks and m edges (blocks referred to by their position in `ids`):
+        n: i32, m: i32, entry: i32 (-1 if none), pad: i32
+        ids: i32[n]             block IDs
+        merge: i32[n]           merge block of each header (-1 if none)
+        src, dst: i32[m]        edges, in nx edge order (so out edge order, i.e. branch direction, is kept)
+        multi: i32[m]           MultiEdge count (0 if the edge isn't a multi-edge)
+        flags: u8[n]            role bitfield (see _ROLES)
+    """
+
+    MAGIC = b'CFGC'
+    VERSION = 1
+    DEFAULT_FILENAME = 'graphs.cfgc'
+
+    _HEADER = struct.Struct('<4sIQQ')
+    _RECORD_HEADER = struct.Struct('<iiii')
+    _ROLES = ('EntryBlock', 'SelectionHeader', 'LoopHeader', 'SwitchBlock', 'BreakBlock', 'ContinueBlock')
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, index_offset = self._HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{filepath} isn't a v{self.VERSION} CFG corpus")
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=index_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {'filepath': self.filepath}  # NB: mmaps can't be pickled
+
+    def __setstate__(self, state):
+        self.__init__(state['filepath'])
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, ix: int) -> CFG:
+        """Graph ix, decoded lazily: its nx graph is only built on first use (and `freeze()` doesn't need it)"""
+        if not 0 <= ix < len(self):
+            raise IndexError("CFG index out of range")
+        return CFG._lazily_from_corpus(self, ix)
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def close(self):
+        self._offsets = None  # NB: release the buffer export before closing the mmap
+        self._mmap.close()
+        self._file.close()
+
+    # DECODING
+
+    def _record(self, ix: int) -> tuple:
+        """(entry, ids, merge, src, dst, multi, flags) for graph ix, as zero-copy views on the mmap"""
+        offset = int(self._offsets[ix])
+        n, m, entry, _ = self._RECORD_HEADER.unpack_from(self._mmap, offset)
+        offset += self._RECORD_HEADER.size
+
+        arrays = []
+        for dtype, count in (('<i4', n), ('<i4', n), ('<i4', m), ('<i4', m), ('<i4', m), ('u1', n)):
+            arrays.append(np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset))
+            offset += arrays[-1].nbytes
+        return (entry, *arrays)
+
+    def graph(self, ix: int) -> nx.MultiDiGraph:
+        entry, ids, merge, src, dst, multi, flags = self._record(ix)
+        ids = ids.tolist()
+
+        graph = nx.MultiDiGraph()
+        for block, block_flags, merge_ix in zip(ids, flags.tolist(), merge.tolist()):
+            attrs = {role: True for bit, role in enumerate(self._ROLES) if block_flags >> bit & 1}
+            if merge_ix != -1:
+                attrs['Merge'] = ids[merge_ix]
+            graph.add_node(block, **attrs)
+        for u, v, count in zip(src.tolist(), dst.tolist(), multi.tolist()):
+            if count:
+                graph.add_edge(ids[u], ids[v], MultiEdge=count)
+            else:
+                graph.add_edge(ids[u], ids[v])
+        return graph
+
+    def freeze(self, ix: int) -> 'FrozenCFG':
+        """Graph ix as a FrozenCFG, built straight from the record's arrays (no nx graph)"""
+        from .FrozenCFG import FrozenCFG
+
+        entry, ids, merge, src, dst, multi, flags = self._record(ix)
+        roles = {role: (flags >> bit & 1).astype(bool).tolist() for bit, role in enumerate(self._ROLES)}
+        return FrozenCFG.from_arrays(ids=ids.tolist(), entry=entry, src=src.tolist(), dst=dst.tolist(),
+                                     counts=np.maximum(multi, 1).tolist(), merge=merge.tolist(),
+                                     selection_header=roles['SelectionHeader'], loop_header=roles['LoopHeader'],
+                                     switch_block=roles['SwitchBlock'], break_block=roles['BreakBlock'],
+                                     continue_block=roles['ContinueBlock'])
+
+
+class CFGCorpusWriter:
+    """Packs CFGs, one at a time, into a corpus file (see CFGCorpus). The index is written on close"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, 'wb')
+        self._offsets = []
+        self._file.write(b'\0' * CFGCorpus._HEADER.size)  # NB: filled in on close, once the count is known
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, cfg: CFG) -> int:
+        """Add cfg to the corpus. Return its index"""
+        ids = list(cfg.nodes())
+        index = {block: ix for ix, block in enumerate(ids)}
+
+        flags = np.zeros(len(ids), dtype='u1')
+        merge = np.full(len(ids), -1, dtype='<i4')
+        entry = -1
+        for ix, (block, attrs) in enumerate(cfg.nodes(data=True)):
+            for attr, value in attrs.items():
+                if attr == 'Merge':
+                    merge[ix] = index[value]
+                elif attr in CFGCorpus._ROLES and value is True:
+                    flags[ix] |= 1 << CFGCorpus._ROLES.index(attr)
+                else:
+                    raise ValueError(f"Can't store attribute {attr}={value!r} of block {block} in a CFG corpus")
+            if 'EntryBlock' in attrs:
+                entry = ix
+
+        edges = list(cfg.graph.edges(data=True))
+        for _, _, attrs in edges:
+            if set(attrs) - {'MultiEdge'}:
+                raise ValueError(f"Can't store edge attributes {attrs} in a CFG corpus")
+        src = np.fromiter((index[u] for u, _, _ in edges), dtype='<i4', count=len(edges))
+        dst = np.fromiter((index[v] for _, v, _ in edges), dtype='<i4', count=len(edges))
+        multi = np.fromiter((attrs.get('MultiEdge', 0) for _, _, attrs in edges), dtype='<i4', count=len(edges))
+
+        self._offsets.append(self._file.tell())
+        self._file.write(CFGCorpus._RECORD_HEADER.pack(len(ids), len(edges), entry, 0))
+        for arr in (np.asarray(ids, dtype='<i4'), merge, src, dst, multi, flags):
+            self._file.write(arr.tobytes())
+        self._file.write(b'\0' * (-self._file.tell() % 8))
+
+        return len(self._offsets) - 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.asarray(self._offsets + [index_offset], dtype='<u8').tobytes())
+        self._file.seek(0)
+        self._file.write(CFGCorpus._HEADER.pack(CFGCorpus.MAGIC, CFGCorpus.VERSION, len(self._offsets), index_offset))
+        self._file.close()
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import functools
 import logging
 import pickle
 import queue
-import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import timedelta, datetime
+from typing import Iterator, Optional
 
 from CFG import CFG
+from CFG.CFG import CFGFormat
+from CFG.CFGCorpus import CFGCorpus, CFGCorpusWriter
+from CFG.FingerprintIndex import FingerprintIndex
+from CFG.RandomStream import RNG, RandomStream, resolve_rng
 import networkx as nx
 
 from languages import Language
@@ -20,13 +28,17 @@ class BlockData:
     outer_merge (int | None): The outer merge block identifier, if any.
     outer_header (int | None): The outer header block identifier, if any.
     current_depth (int): The current depth of the block in the control flow graph.
+    in_switch (bool): Whether the block is in a switch inside the outer header's loop, so a `break` would leave the
+        switch rather than the loop.
     """
 
-    def __init__(self, block: int, outer_merge: int | None, outer_header: int | None, current_depth: int):
+    def __init__(self, block: int, outer_merge: int | None, outer_header: int | None, current_depth: int,
+                 in_switch: bool = False):
         self._block = block
         self._outer_merge = outer_merge
         self._outer_header = outer_header
         self._current_depth = current_depth
+        self._in_switch = in_switch
 
     def __iter__(self):
         yield self._block
@@ -46,6 +58,9 @@ class BlockData:
     def current_depth(self):
         return self._current_depth
 
+    def in_switch(self):
+        return self._in_switch
+
 
 # NB: I have intentionally not make a `RelatedBlocks` parent class.
 # "Premature inheritance is the root of all evil" -- not Knuth
@@ -140,24 +155,29 @@ class GeneratorConfig:
                                continue_=True)
 
     @staticmethod
-    def random(language: Language) -> 'GeneratorConfig':
-        """Return random GeneratorConfig. Choose one attr to definitely set to True so cfg can always be created"""
+    def random(language: Language, rng: RNG = None) -> 'GeneratorConfig':
+        """
+        Return random GeneratorConfig. Choose one attr to definitely set to True so cfg can always be created.
+        rng: c.f. resolve_rng
+        """
+
+        rng = resolve_rng(rng=rng)
 
         flags = [False] * 4
 
-        chosen_index = random.choice(range(4))
+        chosen_index = rng.choice(range(4))
         flags[chosen_index] = True
 
-        flags = [flag or random.choice([True, False]) for flag in flags]
+        flags = [flag or rng.choice([True, False]) for flag in flags]
 
         return GeneratorConfig(
             basic=flags[0],
             loop=flags[1],
             selection=flags[2],
-            switch_fallthrough=random.choice([language.allows_switch_fallthrough, False]),
+            switch_fallthrough=rng.choice([language.allows_switch_fallthrough, False]),
             switch_default=flags[3],
-            break_=random.choice([True, False]),
-            continue_=random.choice([True, False])
+            break_=rng.choice([True, False]),
+            continue_=rng.choice([True, False])
         )
 
     def no_constructs_allowed(self) -> bool:
@@ -165,10 +185,85 @@ class GeneratorConfig:
                         self.allow_switch_default])
 
 
+class _CFGSink:
+    """Where generate_cfgs_method_* save graphs: a pickle per graph, or a single corpus file (CFGFormat.CORPUS)"""
+
+    def __init__(self, target_filepath: str, fmt: CFGFormat):
+        if fmt not in {CFGFormat.CFG, CFGFormat.CORPUS}:
+            raise ValueError("Generated CFGs can only be saved as CFGFormat.CFG or CFGFormat.CORPUS")
+        self._target_filepath = target_filepath
+        self._corpus_writer = CFGCorpusWriter(f'{target_filepath}/{CFGCorpus.DEFAULT_FILENAME}') \
+            if fmt == CFGFormat.CORPUS else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._corpus_writer is not None:
+            self._corpus_writer.close()
+
+    @staticmethod
+    def check_valid(i: int, cfg: CFG):
+        violations = cfg.validate()  # NB: cheap, c.f. CFGValidator, so catch a bad graph before anything compiles it
+        if violations:
+            raise RuntimeError(f"Generated an invalid CFG (graph {i}): " + '; '.join(map(str, violations)))
+
+    def save(self, i: int, cfg: CFG, is_validated: bool = False):
+        if not is_validated:
+            self.check_valid(i, cfg)
+        if self._corpus_writer is not None:
+            assert len(self._corpus_writer) == i  # NB: graph i is the corpus' i-th record
+            self._corpus_writer.append(cfg)
+        else:
+            with open(f'{self._target_filepath}/graph_{i}.pickle', "wb") as f:
+                pickle.dump(cfg, f)
+
+
+class _CompactCFGBuilder:
+    """
+    A CFG under construction as plain lists (successors and node attributes per block ID), so that growing it is
+    O(1) per edge rather than a trip through networkx. `to_cfg` converts it once it's done
+    """
+
+    def __init__(self):
+        self.successors: list[list[int]] = [[], []]  # NB: block IDs start at 1, so ix 0 is unused
+        self.attributes: list[dict] = [{}, {'EntryBlock': True}]
+        self.in_degrees: list[int] = [0, 0]
+
+    def __len__(self):
+        return len(self.successors) - 1
+
+    def add_block(self) -> int:
+        self.successors.append([])
+        self.attributes.append({})
+        self.in_degrees.append(0)
+        return len(self.successors) - 1
+
+    def add_edge(self, src: int, dst: int) -> None:
+        self.successors[src].append(dst)
+        self.in_degrees[dst] += 1
+
+    def redirect(self, block: int, dst: int) -> None:
+        """Replace the out edges of `block` w/ one to `dst`"""
+        for old_dst in self.successors[block]:
+            self.in_degrees[old_dst] -= 1
+        self.successors[block] = []
+        self.add_edge(block, dst)
+
+    def to_cfg(self) -> CFG:
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from((block, self.attributes[block]) for block in range(1, len(self.successors)))
+        graph.add_edges_from((block, dst) for block in range(1, len(self.successors))
+                             for dst in self.successors[block])
+        return CFG(graph=graph)
+
+
 class CFGGenerator:
 
-    def __init__(self, generator_config=None):
+    def __init__(self, generator_config=None, rng: RNG = None):
+        """rng: where every random decision is drawn from (c.f. resolve_rng), so graphs only depend on its seed"""
         self._generator_config = generator_config
+        self._rng = resolve_rng(rng=rng)
         self._next_id = 2
         self._cfg = CFG(graph=CFGGenerator._empty_graph(1), entry_block=1)
         self.visited_blocks = set()
@@ -231,7 +326,7 @@ class CFGGenerator:
         elif not self.get_cfg().is_loop_header(block_data.outer_header()):
             merge_with_outer = False
         else:
-            merge_with_outer = random.choice([block_data.outer_merge(), False])
+            merge_with_outer = self._rng.choice([block_data.outer_merge(), False])
 
         return block_data.outer_merge() if merge_with_outer else self._get_id()
 
@@ -318,7 +413,7 @@ class CFGGenerator:
             self._cfg.add_edge(block, cases[ix])
 
             if self._generator_config.allow_switch_fallthrough:
-                fallthrough = random.choice([True, False])
+                fallthrough = self._rng.choice([True, False])
             else:
                 fallthrough = False
 
@@ -382,13 +477,17 @@ class CFGGenerator:
         if len(self._allowed_construct_functions) == 0:
             return None
 
-        choice = random.choice(self._allowed_construct_functions)
+        choice = self._rng.choice(self._allowed_construct_functions)
         if choice == self._make_switch:
-            return choice(block_data, random.randint(min_successors, max_successors))
+            return choice(block_data, self._rng.randint(min_successors, max_successors))
         else:
             return choice(block_data)
 
-    def generate(self, depth, min_successors, max_successors):
+    def generate(self, depth, min_successors, max_successors, break_continue_probability: float = 0.5):
+        """
+        break_continue_probability: chance that a block inside a loop body becomes a break/continue, if allowed and it
+            can (c.f. _add_break_or_continue). Decided for each block once it's final, so there's no second pass
+        """
 
         self._reset()
 
@@ -407,159 +506,422 @@ class CFGGenerator:
                 for nb in next_blocks:
                     if nb in self.visited_blocks:
                         continue
+                    # NB: a loop's body is in the loop (and no switch inside it), a switch's cases are in the switch,
+                    #  and everything else is wherever the header is
+                    is_loop_body = isinstance(next_blocks, RelatedBlocksLoop) and nb == next_blocks.true_block()
+                    is_case = isinstance(next_blocks, RelatedBlocksSwitch) and nb != next_blocks.merge_block()
                     blocks.put(BlockData(block=nb,
                                          outer_merge=block_data.outer_merge(),
-                                         outer_header=block_data.outer_header(),
-                                         current_depth=block_data.current_depth() + 1))
+                                         outer_header=block_data.block() if is_loop_body
+                                         else block_data.outer_header(),
+                                         current_depth=block_data.current_depth() + 1,
+                                         in_switch=not is_loop_body and (is_case or block_data.in_switch())))
+            elif break_continue_probability > self._rng.random():
+                self._add_break_or_continue(block_data)  # NB: too deep to be expanded, so the block's final
 
         self._remove_all_self_loops()  # TODO: don't *think* this is needed now, it's harmless so keep until can know
-        self._add_breaks_and_continues(insert_probability=1)
 
         return self.get_cfg()
 
+    def generate_of_size(self, no_of_blocks: int, max_depth: Optional[int] = None,
+                         min_successors: int = 3, max_successors: int = 5,
+                         break_continue_probability: float = 0.5) -> CFG:
+        """
+        Generate a CFG of exactly `no_of_blocks` blocks, in time linear in that (10^5 blocks take seconds).
+
+        Starting from a single block, a random unexpanded block is repeatedly replaced by a random allowed construct
+        that still fits, w/ the block's successors moved to the construct's merge block. Constructs' inner blocks are
+        one level deeper than their header; none is nested deeper than `max_depth` (if given), and once a construct
+        doesn't fit (either way) a basic block is used, so the count is always hit. Once it is, the blocks left
+        unexpanded can become breaks/continues, as in `generate`.
+
+        Unlike `generate`, the graph is built in a _CompactCFGBuilder, only becoming a CFG at the end.
+        """
+
+        if no_of_blocks < 1:
+            raise ValueError("A CFG needs at least 1 block")
+
+        config, rng = self._generator_config, self._rng
+        allow_switch = config.allow_switch_default or config.allow_switch_fallthrough
+        min_switch_cost = max(min_successors, 2) + 1
+
+        builder = _CompactCFGBuilder()
+        succs, attrs = builder.successors, builder.attributes
+        frontier = [(1, 0, None, False)]  # NB: (block, depth, innermost loop header, in_switch) of unexpanded blocks
+
+        while len(builder) < no_of_blocks:
+
+            # pick an unexpanded block at random (swap-remove, so O(1))
+            ix = rng.randrange(len(frontier))
+            frontier[ix], frontier[-1] = frontier[-1], frontier[ix]
+            block, depth, loop_header, in_switch = frontier.pop()
+
+            remaining = no_of_blocks - len(builder)
+            can_nest = max_depth is None or depth < max_depth
+            choices = [construct for construct, is_allowed, cost in (('selection', config.allow_selection, 3),
+                                                                      ('loop', config.allow_loop, 2),
+                                                                      ('switch', allow_switch, min_switch_cost),
+                                                                      ('basic', config.allow_basic, 1))
+                       if is_allowed and (cost <= remaining) and (can_nest or construct == 'basic')]
+            construct = rng.choice(choices) if choices else 'basic'
+
+            if construct == 'basic':
+                new_block = builder.add_block()
+                succs[new_block], succs[block] = succs[block], []
+                builder.add_edge(block, new_block)
+                frontier.append((new_block, depth, loop_header, in_switch))
+                continue
+
+            if construct == 'selection':
+                inner_blocks = [builder.add_block(), builder.add_block()]
+                merge_block = builder.add_block()
+                for inner_block in inner_blocks:
+                    builder.add_edge(inner_block, merge_block)
+            elif construct == 'loop':
+                merge_block = builder.add_block()
+                true_block = builder.add_block()
+                builder.add_edge(true_block, block)
+                inner_blocks = [merge_block, true_block]  # NB: a loop header's out edges are [merge, body]
+                attrs[block]['LoopHeader'] = True
+            else:
+                min_branches = min_switch_cost - 1  # NB: it fits, so min_branches <= remaining - 1
+                no_of_branches = rng.randint(min_branches, max(min_branches, min(max_successors, remaining - 1)))
+                inner_blocks = [builder.add_block() for _ in range(no_of_branches)]  # NB: cases, then default
+                merge_block = builder.add_block()
+                for case_ix, case in enumerate(inner_blocks):
+                    is_default = case_ix == len(inner_blocks) - 1
+                    fallthrough = not is_default and config.allow_switch_fallthrough and rng.choice([True, False])
+                    builder.add_edge(case, inner_blocks[case_ix + 1] if fallthrough else merge_block)
+                attrs[block]['SwitchBlock'] = True
+
+            succs[merge_block], succs[block] = succs[block], []
+            for inner_block in inner_blocks:
+                builder.add_edge(block, inner_block)
+            attrs[block]['SelectionHeader'] = True
+            attrs[block]['Merge'] = merge_block
+
+            for inner_block in inner_blocks:
+                if construct == 'loop' and inner_block == true_block:
+                    frontier.append((inner_block, depth + 1, block, False))
+                elif inner_block != merge_block:
+                    frontier.append((inner_block, depth + 1, loop_header, in_switch or construct == 'switch'))
+            frontier.append((merge_block, depth, loop_header, in_switch))
+
+        # what's left unexpanded is final, so can become a break/continue (c.f. _add_break_or_continue)
+        for block, _, loop_header, in_switch in frontier:
+            if loop_header is None or len(succs[block]) != 1 or break_continue_probability <= rng.random():
+                continue
+            dst = succs[block][0]
+            if builder.in_degrees[dst] < 2 or 'LoopHeader' in attrs[dst]:
+                continue
+            targets = [(attr, target) for attr, is_allowed, target in (
+                ('BreakBlock', config.allow_break and not in_switch, attrs[loop_header]['Merge']),
+                ('ContinueBlock', config.allow_continue, loop_header)) if is_allowed and target != dst]
+            if targets:
+                attr, target = rng.choice(targets)
+                builder.redirect(block, target)
+                attrs[block][attr] = True
+
+        self._cfg = builder.to_cfg()
+        return self._cfg
+
     # -----------------------------------------------------------------------------------------------------------------
 
     def _remove_all_self_loops(self):
         """There is a rare bug that causes unintended self loops to be created.
         This fn removes them until the root cause can be addressed"""
         for n in self.get_cfg().nodes():
-            while (n, n) in self.get_cfg().graph.edges(n):
+            while (n, n) in self.get_cfg().out_edges(n):
                 self.get_cfg().remove_edge(n, n)
 
     def _add_continue(self, block, loop_header):
-        edges = list(self.get_cfg().graph.edges(nbunch=block))
-        self.get_cfg().graph.remove_edges_from(ebunch=edges)
+        edges = list(self.get_cfg().out_edges(block))
+        self.get_cfg().remove_edges_from(ebunch=edges)
         self.get_cfg().add_edge(block, loop_header)
         self.get_cfg().add_node_attribute(block, 'ContinueBlock', True)
 
     def _add_break(self, block, loop_header):
         merge_block = self.get_cfg().merge_block(loop_header)
-        edges = list(self.get_cfg().graph.edges(nbunch=block))
-        self.get_cfg().graph.remove_edges_from(ebunch=edges)
+        edges = list(self.get_cfg().out_edges(block))
+        self.get_cfg().remove_edges_from(ebunch=edges)
         self.get_cfg().add_edge(block, merge_block)
         self.get_cfg().add_node_attribute(block, 'BreakBlock', True)
 
-    def _add_breaks_and_continues(self, insert_probability: float):
-
-        if not self._is_allowed_break_or_continue:
-            return self
-
-        loop_headers = [block for block in self.get_cfg().nodes() if self.get_cfg().is_loop_header(block)]
-
-        if len(loop_headers) == 0:
-            return self
-
-        for header in loop_headers:
-
-            visited = set()
-
-            def is_sole_inblock_for_a_dst_block(block):  # dst block(s) all have multiple blocks pointing to it
-                return all(len(self.get_cfg().in_edges_nx_count(dst_)) > 1
-                           for dst_ in self.get_cfg().out_edges_destinations(block))
-
-            def out_dst_equals_loop_header(block):
-                """true iff out_degree = 1 and the dst = loop header"""
-                if self.get_cfg().out_degree(block) != 1:
-                    return False
-                return self.get_cfg().out_edges_destinations(block)[0] == header
-
-            # calc all blocks in true branch before the merge block (or another loop header)
-
-            true_branch_block = self.get_cfg().out_edges_destinations(header)[1]
-
-            q = queue.Queue()
-            q.put(true_branch_block)
-
-            while not q.empty():
-
-                current_block = q.get()
-
-                if current_block in visited \
-                        or self.get_cfg().merge_block(header) == current_block \
-                        or self.get_cfg().is_loop_header(current_block) \
-                        or (not self.get_cfg().is_end_node(current_block)
-                            and self.get_cfg().out_edges_destinations(current_block)[0] != header):
-                    continue
-
-                visited.add(current_block)
+    def _add_break_or_continue(self, block_data: BlockData):
+        """
+        Make block_data's block a break or continue of its innermost loop (block_data.outer_header), if allowed and
+        if it can be: i.e. it's basic (so one out edge), its successor isn't a loop header and has another in edge (so
+        stays reachable), and it doesn't already go where the break/continue would. NB: no breaks from inside a switch,
+        where the code's `break` would only leave the switch
+        """
 
-                if not (is_sole_inblock_for_a_dst_block(current_block)
-                        or self.get_cfg().is_header_block(current_block)
-                        or out_dst_equals_loop_header(current_block)):
+        header = block_data.outer_header()
+        block = block_data.block()
 
-                    # do thing with that block, e.g. add break or continue
-                    if insert_probability > random.random():
-                        br_or_cnt = random.choice(self._allowed_break_continue_functions)
-                        br_or_cnt(current_block, header)
+        if header is None or not self._is_allowed_break_or_continue or self.get_cfg().out_degree(block) != 1:
+            return
 
-                # add its successors
-                for dst in self.get_cfg().out_edges_destinations(current_block):
-                    if dst not in visited:
-                        q.put(dst)
+        dst = self.get_cfg().out_edges_destinations(block)[0]
+        if self.get_cfg().in_degree(dst) < 2 or self.get_cfg().is_loop_header(dst):  # NB: some in edges are back edges
+            return
 
-        return self
+        targets = {self._add_break: self.get_cfg().merge_block(header), self._add_continue: header}
+        choices = [br_or_cnt for br_or_cnt in self._allowed_break_continue_functions if targets[br_or_cnt] != dst
+                   and not (br_or_cnt == self._add_break and block_data.in_switch())]
+        if choices:
+            self._rng.choice(choices)(block, header)
 
     def generate_cfgs_method_uniform(self,
                                      target_filepath: str,
                                      no_of_graphs: int,
                                      min_depth: int,
-                                     max_depth: int):
+                                     max_depth: int,
+                                     fingerprint_index: Optional[FingerprintIndex] = None,
+                                     fmt: CFGFormat = CFGFormat.CFG,
+                                     no_of_blocks: Optional[int] = None,
+                                     jobs: int = 1,
+                                     seed: Optional[int] = None):
+        """
+        fingerprint_index: if given, CFGs already in the index (e.g. tested in an earlier run) are skipped
+        fmt: CFGFormat.CFG for a pickle per graph (graph_{i}.pickle), or CFGFormat.CORPUS for a single corpus file
+        no_of_blocks: if given, every CFG has exactly this many blocks (c.f. generate_of_size), and the depth drawn
+            from [min_depth, max_depth] bounds its nesting
+        jobs, seed: if either's given, graphs are generated across `jobs` processes from per-graph streams derived
+            from `seed` (drawn from the generator's rng if None), so the output only depends on the seed, not on
+            `jobs`. c.f. _generate_cfgs_in_parallel
+        """
+
+        if jobs != 1 or seed is not None:
+            task = _GenerationTask(self._generator_config, None, min_depth, max_depth, no_of_blocks)
+            stream = RandomStream(seed if seed is not None else self._rng.getrandbits(128))
+            _generate_cfgs_in_parallel(task, target_filepath, no_of_graphs, fingerprint_index, fmt, jobs, stream)
+            return
 
-        generated_hashes = set()
+        generated_fingerprints = set()
         time_limit = timedelta(seconds=5)  # if it can't generate a new CFG in time_limit, early return.
 
-        for i in range(no_of_graphs):
+        with _CFGSink(target_filepath, fmt) as cfg_sink:
+            for i in range(no_of_graphs):
 
-            start_time = datetime.now()
+                start_time = datetime.now()
 
-            found_new_cfg = False
-            while datetime.now() - start_time < time_limit:
+                found_new_cfg = False
+                while datetime.now() - start_time < time_limit:
 
-                depth = random.randint(min_depth, max_depth)
-                cfg = self.generate(depth, min_successors=3, max_successors=5)
-                cfg_hash = hash(cfg)
+                    depth = self._rng.randint(min_depth, max_depth)
+                    cfg = self.generate(depth, min_successors=3, max_successors=5) if no_of_blocks is None \
+                        else self.generate_of_size(no_of_blocks, max_depth=depth)
+                    # NB: not hash(cfg), so relabelled duplicates are skipped too
+                    cfg_fingerprint = cfg.fingerprint()
 
-                if cfg_hash not in generated_hashes:
-                    found_new_cfg = True
-                    generated_hashes.add(cfg_hash)
-                    with open(f'{target_filepath}/graph_{i}.pickle', "wb") as f:
-                        pickle.dump(cfg, f)
-                    break
+                    if cfg_fingerprint not in generated_fingerprints \
+                            and (fingerprint_index is None or cfg_fingerprint not in fingerprint_index):
+                        found_new_cfg = True
+                        generated_fingerprints.add(cfg_fingerprint)
+                        cfg_sink.save(i, cfg)
+                        break
 
-            if not found_new_cfg:
-                logging.info(f"Aborted graph generation (>{time_limit} elapsed)")
-                return
+                if not found_new_cfg:
+                    logging.info(f"Aborted graph generation (>{time_limit} elapsed)")
+                    return
 
     @staticmethod
     def generate_cfgs_method_swarm(language,
                                    target_filepath,
                                    no_of_graphs,
                                    min_depth,
-                                   max_depth):
+                                   max_depth,
+                                   fingerprint_index: Optional[FingerprintIndex] = None,
+                                   fmt: CFGFormat = CFGFormat.CFG,
+                                   no_of_blocks: Optional[int] = None,
+                                   jobs: int = 1,
+                                   seed: Optional[int] = None,
+                                   rng: RNG = None):
+        """c.f. generate_cfgs_method_uniform. rng: c.f. CFGGenerator"""
+
+        rng = resolve_rng(rng=rng)
+
+        if jobs != 1 or seed is not None:
+            task = _GenerationTask(None, language, min_depth, max_depth, no_of_blocks)
+            stream = RandomStream(seed if seed is not None else rng.getrandbits(128))
+            _generate_cfgs_in_parallel(task, target_filepath, no_of_graphs, fingerprint_index, fmt, jobs, stream)
+            return
 
-        generated_hashes = set()
+        generated_fingerprints = set()
         time_limit = timedelta(seconds=5)  # if it can't generate a new CFG in time_limit, early return.
 
-        for i in range(no_of_graphs):
+        with _CFGSink(target_filepath, fmt) as cfg_sink:
+            for i in range(no_of_graphs):
+
+                start_time = datetime.now()
+                found_new_cfg = False
+
+                while datetime.now() - start_time < time_limit:
+
+                    cfg_generator = CFGGenerator(GeneratorConfig.random(language, rng), rng)
+
+                    depth = rng.randint(min_depth, max_depth)
+                    cfg = cfg_generator.generate(depth, min_successors=3, max_successors=5) if no_of_blocks is None \
+                        else cfg_generator.generate_of_size(no_of_blocks, max_depth=depth)
+                    # NB: not hash(cfg), so relabelled duplicates are skipped too
+                    cfg_fingerprint = cfg.fingerprint()
+
+                    if cfg_fingerprint not in generated_fingerprints \
+                            and (fingerprint_index is None or cfg_fingerprint not in fingerprint_index):
+                        found_new_cfg = True
+                        generated_fingerprints.add(cfg_fingerprint)
+                        cfg_sink.save(i, cfg)
+                        break
+
+                if not found_new_cfg:
+                    logging.info(f"Aborted graph generation (>{time_limit} elapsed)")
+                    return
+
+    def stream_cfgs_method_uniform(self,
+                                   no_of_graphs: int,
+                                   min_depth: int,
+                                   max_depth: int,
+                                   fingerprint_index: Optional[FingerprintIndex] = None,
+                                   no_of_blocks: Optional[int] = None,
+                                   jobs: int = 1,
+                                   seed: Optional[int] = None) -> Iterator[CFG]:
+        """
+        Like generate_cfgs_method_uniform w/ a seed, but yields each CFG as soon as it's made rather than saving it,
+        so consumers can start on graph 0 while the rest are generated. Fewer than no_of_graphs if generation aborts
+        """
+        task = _GenerationTask(self._generator_config, None, min_depth, max_depth, no_of_blocks)
+        stream = RandomStream(seed if seed is not None else self._rng.getrandbits(128))
+        return _iter_generated_cfgs(task, no_of_graphs, fingerprint_index, jobs, stream)
+
+    @staticmethod
+    def stream_cfgs_method_swarm(language,
+                                 no_of_graphs: int,
+                                 min_depth: int,
+                                 max_depth: int,
+                                 fingerprint_index: Optional[FingerprintIndex] = None,
+                                 no_of_blocks: Optional[int] = None,
+                                 jobs: int = 1,
+                                 seed: Optional[int] = None,
+                                 rng: RNG = None) -> Iterator[CFG]:
+        """c.f. stream_cfgs_method_uniform"""
+        task = _GenerationTask(None, language, min_depth, max_depth, no_of_blocks)
+        stream = RandomStream(seed if seed is not None else resolve_rng(rng=rng).getrandbits(128))
+        return _iter_generated_cfgs(task, no_of_graphs, fingerprint_index, jobs, stream)
+
+
+class _GenerationTask:
+    """
+    What a worker needs to generate a candidate for graph i (attempt k) by itself: the config (or, if None, a random
+    one per attempt from `language`, i.e. swarm) and the depth/size settings. Picklable, unlike a CFGGenerator's state
+    """
+
+    def __init__(self, generator_config: Optional[GeneratorConfig], language: Optional[Language],
+                 min_depth: int, max_depth: int, no_of_blocks: Optional[int]):
+        self.generator_config = generator_config
+        self.language = language
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.no_of_blocks = no_of_blocks
+
+    def __call__(self, stream: RandomStream, graph_no: int, attempt: int = 0) -> tuple[str, CFG]:
+        """
+        The fingerprint and (validated) CFG of candidate `attempt` for graph `graph_no`, drawn from its own child of
+        `stream`, so independent of every other candidate's and of which process makes it
+        """
+        rng = stream.child(graph_no, attempt)
+        generator_config = self.generator_config if self.language is None \
+            else GeneratorConfig.random(self.language, rng)
+        cfg_generator = CFGGenerator(generator_config, rng)
+        depth = rng.randint(self.min_depth, self.max_depth)
+        cfg = cfg_generator.generate(depth, min_successors=3, max_successors=5) if self.no_of_blocks is None \
+            else cfg_generator.generate_of_size(self.no_of_blocks, max_depth=depth)
+        _CFGSink.check_valid(graph_no, cfg)  # NB: in the worker, so validating scales w/ jobs too
+        return cfg.fingerprint(), cfg
+
+
+def _iter_generated_cfgs(task: _GenerationTask, no_of_graphs: int, fingerprint_index: Optional[FingerprintIndex],
+                         jobs: int, stream: RandomStream) -> Iterator[CFG]:
+    """
+    Yield no_of_graphs distinct CFGs, generated across `jobs` processes, deterministically: candidate k for graph i
+    comes from stream's child (i, k) alone, and graph i is its first candidate whose fingerprint isn't that of an
+    earlier graph (or in fingerprint_index). Workers make candidate 0 for every graph; the (rare) duplicates are
+    redrawn here, in order, so the graphs yielded, and their order, are the same for any no. of jobs.
+
+    Lazy: graph 0 is yielded as soon as it's made, while the workers carry on w/ the next few (c.f.
+    _first_candidates_in_parallel), so they keep only as far ahead of the consumer as it takes to keep them busy.
+    """
+
+    generated_fingerprints = set()
+    time_limit = timedelta(seconds=5)  # if it can't generate a new CFG for a graph in time_limit, early return.
+
+    with ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext() as executor:
+
+        candidates = _first_candidates_in_parallel(executor, task, stream, no_of_graphs, jobs) if jobs > 1 \
+            else map(functools.partial(task, stream), range(no_of_graphs))
 
-            start_time = datetime.now()
-            found_new_cfg = False
+        try:
+            for i, (cfg_fingerprint, cfg) in enumerate(candidates):  # NB: in graph order, whatever order they finish
 
-            while datetime.now() - start_time < time_limit:
+                start_time, attempt = datetime.now(), 0
+                while cfg_fingerprint in generated_fingerprints \
+                        or (fingerprint_index is not None and cfg_fingerprint in fingerprint_index):
+                    if datetime.now() - start_time >= time_limit:
+                        logging.info(f"Aborted graph generation (>{time_limit} elapsed)")
+                        return
+                    attempt += 1
+                    cfg_fingerprint, cfg = task(stream, i, attempt)
 
-                cfg_generator = CFGGenerator(GeneratorConfig.random(language))
+                generated_fingerprints.add(cfg_fingerprint)
+                yield cfg
+        finally:  # NB: incl. if the consumer stops early
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
 
-                depth = random.randint(min_depth, max_depth)
-                cfg = cfg_generator.generate(depth, min_successors=3, max_successors=5)
-                cfg_hash = hash(cfg)
 
-                if cfg_hash not in generated_hashes:
-                    found_new_cfg = True
-                    generated_hashes.add(cfg_hash)
-                    with open(f'{target_filepath}/graph_{i}.pickle', "wb") as f:
-                        pickle.dump(cfg, f)
-                    break
+_GRAPHS_IN_FLIGHT_PER_JOB = 32  # first candidates submitted but not yet consumed, per job
+_MAX_CHUNKSIZE = 8  # first candidates made per task, once the first few graphs are out of the way
 
-            if not found_new_cfg:
-                logging.info(f"Aborted graph generation (>{time_limit} elapsed)")
-                return
+
+def _first_candidates(task: _GenerationTask, stream: RandomStream, graph_nos: range) -> list[tuple[str, CFG]]:
+    return [task(stream, graph_no) for graph_no in graph_nos]
+
+
+def _first_candidates_in_parallel(executor: ProcessPoolExecutor, task: _GenerationTask, stream: RandomStream,
+                                  no_of_graphs: int, jobs: int) -> Iterator[tuple[str, CFG]]:
+    """
+    Candidate 0 of each graph, in graph order, made by the executor a chunk at a time. Chunks start at one graph and
+    double up to _MAX_CHUNKSIZE, so graph 0 is yielded as soon as it's made while later graphs still cost few tasks.
+    Only a window of graphs is in flight: more are submitted as each chunk is consumed, so however many graphs there
+    are, the parent holds at most _GRAPHS_IN_FLIGHT_PER_JOB * jobs of them (unlike executor.map, which submits them
+    all up front)
+    """
+    window = _GRAPHS_IN_FLIGHT_PER_JOB * jobs
+    in_flight = deque()  # NB: of (future, no. of graphs in its chunk)
+    in_flight_graphs, next_graph_no, chunksize = 0, 0, 1
+
+    def submit_chunks():
+        nonlocal in_flight_graphs, next_graph_no, chunksize
+        while next_graph_no < no_of_graphs and in_flight_graphs < window:
+            size = min(chunksize, no_of_graphs - next_graph_no, window - in_flight_graphs)
+            chunk = range(next_graph_no, next_graph_no + size)
+            in_flight.append((executor.submit(_first_candidates, task, stream, chunk), size))
+            in_flight_graphs += size
+            next_graph_no += size
+            chunksize = min(2 * chunksize, _MAX_CHUNKSIZE)
+
+    submit_chunks()
+    while in_flight:
+        future, size = in_flight.popleft()
+        candidates = future.result()
+        in_flight_graphs -= size
+        submit_chunks()
+        yield from candidates
+
+
+def _generate_cfgs_in_parallel(task: _GenerationTask, target_filepath: str, no_of_graphs: int,
+                               fingerprint_index: Optional[FingerprintIndex], fmt: CFGFormat, jobs: int,
+                               stream: RandomStream):
+    """Save the CFGs of _iter_generated_cfgs, in order"""
+    with _CFGSink(target_filepath, fmt) as cfg_sink:
+        for i, cfg in enumerate(_iter_generated_cfgs(task, no_of_graphs, fingerprint_index, jobs, stream)):
+            cfg_sink.save(i, cfg, is_validated=True)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .FrozenCFG import FrozenCFG
+
+
+class CFGViolation:
+    """A structured-control-flow invariant (one the code builders rely on) that a CFG breaks, and where"""
+
+    def __init__(self, blocks: tuple[int, ...], message: str):
+        self.blocks = blocks
+        self.message = message
+
+    def __eq__(self, other):
+        return isinstance(other, CFGViolation) and (self.blocks, self.message) == (other.blocks, other.message)
+
+    def __hash__(self):
+        return hash((self.blocks, self.message))
+
+    def __repr__(self):
+        return f"CFGViolation({self.blocks}, {self.message!r})"
+
+    def __str__(self):
+        return f"block(s) {', '.join(map(str, self.blocks))}: {self.message}"
+
+
+class CFGValidator:
+    """
+    Checks a (frozen) CFG satisfies the invariants CodeBuilder assumes, reporting every violation rather than the
+    first. Each check is a pass over the blocks or edges w/ O(1) queries against the CFG's cached analysis (c.f.
+    CFGAnalysis), so validating costs about as much as freezing. Used via `cfg.validate()`.
+    """
+
+    def __init__(self, cfg: 'FrozenCFG'):
+        self._cfg = cfg
+        self._analysis = cfg.analysis()
+        self._violations: list[CFGViolation] = []
+
+    def _report(self, blocks, message: str) -> None:
+        self._violations.append(CFGViolation(tuple(blocks), message))
+
+    def validate(self) -> list[CFGViolation]:
+        self._violations = []
+        self._check_roles()
+        self._check_reachability()
+        self._check_merges()
+        self._check_edges()
+        self._check_switches()
+        return self._violations
+
+    # CHECKS
+
+    def _check_roles(self) -> None:
+        cfg = self._cfg
+        for block in cfg.nodes():
+            out_degree = cfg.out_degree(block)
+            is_header = cfg.is_header_block(block) or cfg.is_switch_block(block)
+
+            if is_header and not cfg.contains_merge_instruction(block):
+                self._report([block], "header has no Merge")
+            elif not is_header and cfg.contains_merge_instruction(block):
+                self._report([block], "has a Merge but isn't a header")
+            elif is_header and cfg.merge_block(block) == block:
+                self._report([block], "header is its own merge block")
+
+            if cfg.is_loop_header(block) and out_degree != 2:
+                self._report([block], f"loop header has {out_degree} out edges, not 2 (merge, then body)")
+            elif cfg.is_switch_block(block) and out_degree < 2:
+                self._report([block], f"switch block has {out_degree} out edge(s), not >= 2 (case(s), then default)")
+            elif cfg.is_selection_header(block) and not cfg.is_loop_header(block) \
+                    and not cfg.is_switch_block(block) and out_degree != 2:
+                self._report([block], f"selection header has {out_degree} out edges, not 2")
+            elif out_degree >= 2 and not is_header:
+                self._report([block], "branches but isn't a header")
+
+            # NB: the flags are read directly, as is_break_block and is_continue_block assert a block's basic
+            is_break, is_continue = cfg._has_flag(block, cfg.BREAK_BLOCK), cfg._has_flag(block, cfg.CONTINUE_BLOCK)
+            if is_break and is_continue:
+                self._report([block], "is both a break and a continue block")
+            if (is_break or is_continue) and out_degree != 1:
+                self._report([block], f"break/continue block has {out_degree} out edges, not 1")
+
+    def _check_reachability(self) -> None:
+        entry = self._cfg.entry_node()
+        unreachable = [block for block in self._cfg.nodes() if not self._analysis.dominates(entry, block)]
+        if unreachable:
+            self._report(unreachable, "unreachable from the entry block")
+
+        distances = self._cfg.distances_to_exit()
+        trapped = [block for block in self._cfg.nodes() if block not in distances]
+        if trapped:
+            self._report(trapped, "can't reach an exit")
+
+    def _check_merges(self) -> None:
+        """
+        NB: a merge needn't dominate nor post-dominate its header here: a switch case can fall through into another
+        construct's merge, nested constructs can share one, and a break, continue or exit can leave a construct early
+        """
+        for block in self._cfg.nodes():
+            if not self._cfg.contains_merge_instruction(block):
+                continue
+            merge_block = self._cfg.merge_block(block)
+            if not self._analysis.is_reachable(block, merge_block):
+                self._report([block, merge_block], "merge block is unreachable from its header")
+
+    def _check_edges(self) -> None:
+        cfg, analysis = self._cfg, self._analysis
+        forward_successors = {block: [] for block in cfg.nodes()}
+        in_degree = dict.fromkeys(cfg.nodes(), 0)
+
+        for block in cfg.nodes():
+            loops = analysis.enclosing_loops(block)
+            innermost_loop = loops[-1] if loops else None
+            for dst in set(cfg.out_edges_destinations(block)):
+                is_back_edge = analysis.dominates(dst, block)
+                if is_back_edge and dst != innermost_loop:
+                    self._report([block, dst], "back edge isn't to the header of the innermost enclosing loop")
+                elif not is_back_edge:
+                    forward_successors[block].append(dst)
+                    in_degree[dst] += 1
+
+            if cfg.out_degree(block) != 1:
+                continue  # NB: so not a valid break/continue, already reported
+            dst = cfg.out_edges_destinations(block)[0]
+            if cfg.is_continue_block(block) and dst != innermost_loop:
+                self._report([block], "continue block doesn't go to the header of the innermost enclosing loop")
+            loop_merge = cfg.merge_block(innermost_loop) \
+                if innermost_loop is not None and cfg.contains_merge_instruction(innermost_loop) else None
+            if cfg.is_break_block(block) and (loop_merge is None or dst != loop_merge):
+                self._report([block], "break block doesn't go to the merge of the innermost enclosing loop")
+
+        # once back edges are removed, a structured CFG is acyclic (else it has a loop w/o a header, i.e. irreducible)
+        queue = deque(block for block, degree in in_degree.items() if degree == 0)
+        while queue:
+            block = queue.popleft()
+            for dst in forward_successors[block]:
+                in_degree[dst] -= 1
+                if in_degree[dst] == 0:
+                    queue.append(dst)
+        # what's left is the cycles and anything after them. Trim the latter, from the end back
+        cyclic = {block for block, degree in in_degree.items() if degree > 0}
+        out_degree = {block: sum(dst in cyclic for dst in forward_successors[block]) for block in cyclic}
+        forward_predecessors = {block: [] for block in cyclic}
+        for block in cyclic:
+            for dst in forward_successors[block]:
+                if dst in cyclic:
+                    forward_predecessors[dst].append(block)
+        queue = deque(block for block, degree in out_degree.items() if degree == 0)
+        while queue:
+            block = queue.popleft()
+            cyclic.discard(block)
+            for src in forward_predecessors[block]:
+                out_degree[src] -= 1
+                if out_degree[src] == 0:
+                    queue.append(src)
+        if cyclic:
+            cyclic = [block for block in cfg.nodes() if block in cyclic]
+            self._report(cyclic, "in a cycle that doesn't go through a loop header (irreducible)")
+
+    def _check_switches(self) -> None:
+        """Cases (then the default, last) must be in fallthrough order: no case can fall through to an earlier one"""
+        for block in self._cfg.nodes():
+            if not self._cfg.is_switch_block(block):
+                continue
+            loops = self._analysis.enclosing_loops(block)
+            innermost_loop = loops[-1] if loops else None  # NB: going round the loop isn't falling through
+
+            destinations = self._cfg.out_edges_destinations(block)
+            for later_ix in range(1, len(destinations)):
+                for earlier_ix in range(later_ix):
+                    later, earlier = destinations[later_ix], destinations[earlier_ix]
+                    if later != earlier and self._analysis.is_reachable(later, earlier, avoiding=innermost_loop):
+                        label = "default" if later_ix == len(destinations) - 1 else f"case {later_ix}"
+                        self._report([block, later, earlier], f"{label} falls through to earlier case {earlier_ix}")
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import heapq
+import random
+from collections import deque
+from enum import Enum
+
+
+class CoverageGoal(Enum):
+    EDGE = 'edge'  # (EDGE, block, edge_ix): direction edge_ix taken from block (incl. switch cases & fallthrough)
+    LOOP_TRIPS = 'loop_trips'  # (LOOP_TRIPS, header, n): loop entered and iterated n times, n in TRIP_COUNTS
+
+    def __str__(self):
+        return self.value
+
+
+TRIP_COUNTS = ('0', '1', 'many')
+
+
+class CoverageReport:
+    """Which coverage goals a set of input directions hits"""
+
+    def __init__(self, goals: set[tuple], covered: set[tuple], no_of_paths: int):
+        self.goals = goals
+        self.covered = covered
+        self.no_of_paths = no_of_paths
+
+    @property
+    def uncovered(self) -> set[tuple]:
+        return self.goals - self.covered
+
+    def ratio(self, kind: CoverageGoal = None) -> float:
+        goals = {g for g in self.goals if kind is None or g[0] is kind}
+        return len(goals & self.covered) / len(goals) if goals else 1.0
+
+    def __str__(self):
+        return (f"{self.no_of_paths} paths cover {len(self.covered)}/{len(self.goals)} goals "
+                f"(edges: {self.ratio(CoverageGoal.EDGE):.0%}, loop trip counts: "
+                f"{self.ratio(CoverageGoal.LOOP_TRIPS):.0%})")
+
+
+class CoverageSelector:
+    """
+    Picks a small set of valid input directions that together take every edge of the CFG (so every switch case,
+    fallthrough edge, break and continue) and run every loop 0, 1 and many (>= 2) times on some entry.
+
+    Candidates are a witness path built per goal (shortest route to the goal, through it, then shortest route out)
+    plus a few uniformly sampled paths. Each candidate's actual coverage is measured by simulating it, then a greedy
+    set cover repeatedly takes the candidate covering the most still-uncovered goals (ties -> fewer directions).
+    """
+
+    def __init__(self, cfg, max_length: int = 512):
+        self._cfg = cfg.freeze()
+        self._max_length = max_length
+        self._distances = self._cfg.distances_to_exit()
+        self._loop_bodies = {h: self._loop_body(h) for h in self._cfg.nodes() if self._cfg.is_loop_header(h)}
+        self._from_entry = self._shortest_routes(self._cfg.entry_node())
+        self._back_routes = {}  # loop header -> directions along the shortest route from its true branch back to it
+        self._exit_hops = {}  # block -> (next block, direction) on the shortest route to an exit
+
+    # GOALS
+
+    def goals(self) -> set[tuple]:
+        cfg = self._cfg
+        goals = {(CoverageGoal.EDGE, block, ix) for block in cfg.nodes() for ix in range(cfg.out_degree(block))}
+        goals |= {(CoverageGoal.LOOP_TRIPS, header, n) for header in self._loop_bodies for n in TRIP_COUNTS}
+        return goals
+
+    def _loop_body(self, header) -> set[int]:
+        """Blocks reachable from the loop's true branch, w/o passing through its header, that can get back to it"""
+        cfg = self._cfg
+        forward = {cfg.out_edges_destinations(header)[1]}
+        predecessors = {}
+        stack = list(forward)
+        while stack:
+            block = stack.pop()
+            for dst in cfg.out_edges_destinations(block):
+                predecessors.setdefault(dst, []).append(block)
+                if dst != header and dst not in forward:
+                    forward.add(dst)
+                    stack.append(dst)
+
+        body = set()
+        stack = list(predecessors.get(header, []))
+        while stack:
+            block = stack.pop()
+            if block not in body:
+                body.add(block)
+                stack.extend(predecessors.get(block, []))
+        return body
+
+    def covered_by(self, directions: list[int], path: list[int]) -> set[tuple]:
+        """Goals hit by `directions`, whose expected output path is `path`"""
+        cfg = self._cfg
+        covered = set()
+        directions_ix = 0
+        trips = {}  # header -> no. of iterations in the current entry to the loop
+
+        def end_loop_entry(header_):
+            n = trips.pop(header_)
+            covered.add((CoverageGoal.LOOP_TRIPS, header_, TRIP_COUNTS[min(n, 2)]))
+
+        for block, next_block in zip(path, path[1:]):
+            if cfg.out_degree(block) == 1:
+                edge_ix = 0
+            else:
+                edge_ix = directions[directions_ix]
+                directions_ix += 1
+            covered.add((CoverageGoal.EDGE, block, edge_ix))
+
+            for header in [h for h in trips if h != block and next_block not in self._loop_bodies[h]
+                           and next_block != h]:
+                end_loop_entry(header)  # left the loop w/o going via its header (e.g. break)
+
+            if block in self._loop_bodies:
+                trips.setdefault(block, 0)
+                if next_block == cfg.out_edges_destinations(block)[1]:
+                    trips[block] += 1
+                else:
+                    end_loop_entry(block)
+
+        for header in list(trips):
+            end_loop_entry(header)
+
+        return covered
+
+    # CANDIDATES
+
+    def _shortest_routes(self, source, within: set[int] = None) -> dict[int, tuple]:
+        """
+        Shortest-route tree from source, w/ route length = no. of directions consumed: block -> (parent, direction
+        taken from parent, or None if parent is a basic block). If given, the routes only go via blocks in `within`
+        """
+        cfg = self._cfg
+        parents = {source: None}
+        distances = {source: 0}
+        queue = deque([source])  # 0-1 BFS: leaving a branch costs a direction, leaving a basic block doesn't
+        settled = set()
+        while queue:
+            block = queue.popleft()
+            if block in settled:
+                continue
+            settled.add(block)
+            is_branch = cfg.out_degree(block) > 1
+            for direction, dst in enumerate(cfg.out_edges_destinations(block)):
+                if within is not None and dst not in within:
+                    continue
+                if distances[block] + is_branch < distances.get(dst, float('inf')):
+                    distances[dst] = distances[block] + is_branch
+                    parents[dst] = (block, direction if is_branch else None)
+                    if is_branch:
+                        queue.append(dst)
+                    else:
+                        queue.appendleft(dst)
+        return parents
+
+    @staticmethod
+    def _route(parents: dict[int, tuple], destination) -> list[int] | None:
+        """Directions along the route to destination in a shortest-route tree (None if it isn't reachable)"""
+        if destination not in parents:
+            return None
+        directions = []
+        block = destination
+        while parents[block] is not None:
+            block, direction = parents[block]
+            if direction is not None:
+                directions.append(direction)
+        return directions[::-1]
+
+    def _route_out(self, block) -> list[int]:
+        """Directions from `block` to an exit, following the fewest directions"""
+        cfg = self._cfg
+        directions = []
+        while not cfg.is_end_node(block):
+            if block not in self._exit_hops:
+                destinations = cfg.out_edges_destinations(block)
+                direction = min(range(len(destinations)), key=lambda d: self._distances.get(destinations[d], 1e18))
+                self._exit_hops[block] = (destinations[direction], direction if len(destinations) > 1 else None)
+            block, direction = self._exit_hops[block]
+            if direction is not None:
+                directions.append(direction)
+        return directions
+
+    def _witness(self, goal) -> list[int] | None:
+        cfg = self._cfg
+        kind, block, param = goal
+        prefix = self._route(self._from_entry, block)
+        if prefix is None:
+            return None
+
+        if kind is CoverageGoal.EDGE:
+            dst = cfg.edge_index_to_dst_block(block, param)
+            if dst not in self._distances:
+                return None
+            return prefix + ([param] if cfg.out_degree(block) > 1 else []) + self._route_out(dst)
+
+        # LOOP_TRIPS: go round the loop n times via the shortest route back to the header, then leave
+        if block not in self._back_routes:
+            body_entry = cfg.out_edges_destinations(block)[1]
+            self._back_routes[block] = self._route(
+                self._shortest_routes(body_entry, within=self._loop_bodies[block] | {block}), block)
+        back = self._back_routes[block]
+        if back is None:
+            return None
+        return prefix + ([1] + back) * {'0': 0, '1': 1, 'many': 2}[param] + [0] + self._route_out(
+            cfg.out_edges_destinations(block)[0])
+
+    def candidates(self, goals: set[tuple], no_of_samples: int, rng) -> list[list[int]]:
+        candidates = [w for w in map(self._witness, sorted(goals, key=str)) if w is not None]
+        candidates += self._cfg.generate_n_valid_input_directions(no_of_samples, seed=rng.randrange(2 ** 32),
+                                                                  max_length=self._max_length)
+        unique = {tuple(c): c for c in candidates if len(c) <= self._max_length}
+        return list(unique.values())
+
+    # SET COVER
+
+    def select(self, no_of_samples: int = 32, rng=random) -> tuple[list[list[int]], CoverageReport]:
+        goals = self.goals()
+        candidates = self.candidates(goals, no_of_samples, rng)
+        expected_paths = self._cfg.expected_output_paths(candidates)
+
+        coverage = [(c, self.covered_by(c, expected_paths[ix]))
+                    for ix, c in enumerate(candidates) if expected_paths.status[ix] == 0]
+
+        # lazy greedy: a candidate's gain only shrinks as more is covered, so a stale gain is an upper bound and the
+        # best candidate is found by re-scoring from the top of the heap until a fresh gain stays on top
+        heap = [(-len(goals_hit), len(c), ix) for ix, (c, goals_hit) in enumerate(coverage)]
+        heapq.heapify(heap)
+        chosen, covered = [], set()
+        while heap:
+            _, length, ix = heapq.heappop(heap)
+            gain = len(coverage[ix][1] - covered)
+            if gain == 0:
+                continue
+            if heap and (-gain, length, ix) > heap[0]:
+                heapq.heappush(heap, (-gain, length, ix))
+                continue
+            chosen.append(coverage[ix][0])
+            covered |= coverage[ix][1]
+
+        return chosen, CoverageReport(goals, covered & goals, len(chosen))
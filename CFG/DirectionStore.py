@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+from .PathEvaluator import ExpectedPaths, PathEvaluator
+
+
+class DirectionStore:
+    """
+    A set of direction vectors (e.g. every path tested on one CFG), and optionally the expected path of each, stored
+    columnar in one memory-mapped file: a flat array of values plus an offsets array, rather than a list of lists of
+    boxed ints. 10^6 vectors of ~50 directions take ~50MB (less if run-length encoded), not GBs.
+
+    Directions are stored as int8 (or int16 if a branch has > 127 out edges). If run-length encoded, e.g. for long
+    runs of loop iterations, values are stored once per run w/ the run's length. Expected paths are stored as block
+    IDs in the smallest int type that fits, w/ their own offsets.
+
+    File layout (little-endian): header (magic b'DIRS', version: u32, no. of sections: u32), then a table of
+    sections (name: 8s, dtype: 4s, offset: u64, length: u64), then each section's array, 8-byte aligned.
+    """
+
+    MAGIC = b'DIRS'
+    VERSION = 1
+    EXTENSION = 'dirs'
+
+    _HEADER = struct.Struct('<4sII')
+    _SECTION = struct.Struct('<8s4sQQ')
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, no_of_sections = self._HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{filepath} isn't a v{self.VERSION} direction store")
+
+        self._sections: dict[str, np.ndarray] = {}
+        for s in range(no_of_sections):
+            name, dtype, offset, length = self._SECTION.unpack_from(self._mmap,
+                                                                   self._HEADER.size + s * self._SECTION.size)
+            self._sections[name.rstrip(b'\0').decode()] = np.frombuffer(
+                self._mmap, dtype=dtype.rstrip(b'\0').decode(), count=length, offset=offset)
+
+        self._offsets = self._sections['offsets']
+        self._is_rle = 'run_lens' in self._sections
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {'filepath': self.filepath}  # NB: mmaps can't be pickled
+
+    def __setstate__(self, state):
+        self.__init__(state['filepath'])
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, ix: int) -> list[int]:
+        return self.directions(ix).tolist()
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def close(self):
+        self._sections = self._offsets = None  # NB: release the buffer exports before closing the mmap
+        self._mmap.close()
+
+    # READING
+
+    def directions(self, ix: int) -> np.ndarray:
+        """Direction vector ix, as an array"""
+        if not 0 <= ix < len(self):
+            raise IndexError("Direction vector index out of range")
+        start, end = self._offsets[ix], self._offsets[ix + 1]
+        if not self._is_rle:
+            return self._sections['values'][start:end]
+        return np.repeat(self._sections['values'][start:end], self._sections['run_lens'][start:end])
+
+    def lengths(self) -> np.ndarray:
+        """No. of directions in each vector"""
+        if not self._is_rle:
+            return np.diff(self._offsets)
+        run_ends = np.cumsum(self._sections['run_lens'], dtype=np.int64)
+        run_ends = np.concatenate([[0], run_ends])
+        return run_ends[self._offsets[1:]] - run_ends[self._offsets[:-1]]
+
+    def padded(self, fill_value: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        """All vectors as a padded 2-D array and their lengths, c.f. PathEvaluator.pad_directions"""
+        lengths = self.lengths()
+        padded = np.full((len(self), int(lengths.max(initial=0))), fill_value, dtype=np.int64)
+        values = self._sections['values']
+        if self._is_rle:
+            values = np.repeat(values, self._sections['run_lens'])
+        padded[np.arange(padded.shape[1]) < lengths[:, None]] = values
+        return padded, lengths
+
+    def has_expected_paths(self) -> bool:
+        return 'paths' in self._sections
+
+    def expected_path(self, ix: int) -> list[int]:
+        """The expected path stored for direction vector ix"""
+        if not self.has_expected_paths():
+            raise RuntimeError(f"{self.filepath} holds no expected paths")
+        path_offsets = self._sections['path_ixs']
+        return self._sections['paths'][path_offsets[ix]:path_offsets[ix + 1]].tolist()
+
+    # WRITING
+
+    @staticmethod
+    def _smallest_int_dtype(values: np.ndarray, candidates=('<i1', '<i2', '<i4', '<i8')) -> str:
+        lo, hi = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+        return next(dtype for dtype in candidates if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max)
+
+    @classmethod
+    def save(cls, filepath: str, directions: list[list[int]], expected_paths: Optional[ExpectedPaths] = None,
+             rle: Optional[bool] = None) -> None:
+        """
+        expected_paths: if given (e.g. from `cfg.expected_output_paths(directions)`), stored alongside. Every path
+            must be OK
+        rle: run-length encode the directions. If None, do so iff it's smaller
+        """
+
+        padded, lengths = PathEvaluator.pad_directions(directions)
+        values = padded[np.arange(padded.shape[1]) < lengths[:, None]]
+        offsets = np.zeros(len(directions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # a run starts at every change of value, and at the start of every vector
+        run_starts = np.ones(len(values), dtype=bool)
+        run_starts[1:] = values[1:] != values[:-1]
+        run_starts[offsets[:-1][lengths > 0]] = True
+        run_start_ixs = np.flatnonzero(run_starts)
+        if rle is None:
+            rle = len(run_start_ixs) * 5 < len(values)  # NB: each run costs a value (1 byte) and a length (4 bytes)
+
+        sections = {}
+        if rle:
+            sections['values'] = values[run_start_ixs]
+            sections['run_lens'] = np.diff(np.append(run_start_ixs, len(values))).astype('<i4')
+            sections['offsets'] = np.searchsorted(run_start_ixs, offsets).astype('<i8')
+        else:
+            sections['values'] = values
+            sections['offsets'] = offsets.astype('<i8')
+        sections['values'] = sections['values'].astype(cls._smallest_int_dtype(sections['values'], ('<i1', '<i2')))
+
+        if expected_paths is not None:
+            if len(expected_paths) != len(directions) or not expected_paths.all_ok():
+                raise ValueError("Need an OK expected path for every direction vector")
+            sections['paths'] = expected_paths.blocks.astype(cls._smallest_int_dtype(expected_paths.blocks))
+            sections['path_ixs'] = expected_paths.offsets.astype('<i8')
+
+        cls._write(filepath, sections)
+
+    @classmethod
+    def _write(cls, filepath: str, sections: dict[str, np.ndarray]):
+        offset = cls._HEADER.size + len(sections) * cls._SECTION.size
+        table = []
+        for name, arr in sections.items():
+            offset += -offset % 8
+            table.append(cls._SECTION.pack(name.encode(), arr.dtype.str.encode(), offset, len(arr)))
+            offset += arr.nbytes
+
+        tmp_filepath = f'{filepath}.tmp'
+        with open(tmp_filepath, 'wb') as file:
+            file.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, len(sections)))
+            file.write(b''.join(table))
+            for arr in sections.values():
+                file.write(b'\0' * (-file.tell() % 8))
+                file.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp_filepath, filepath)  # NB: readers never see a half-written store
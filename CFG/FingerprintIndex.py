@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+
+class FingerprintIndex:
+    """
+    On-disk set of CFG fingerprints (see `CFG.fingerprint()`), so CFGs tested in earlier runs aren't generated again.
+
+    Backed by a SQLite table keyed on the 16-byte digest: membership is a B-tree lookup (~ a handful of page reads,
+    mostly cached, even w/ tens of millions of entries), and WAL mode lets any no. of processes read while one
+    appends. Each add is a single INSERT OR IGNORE, so concurrent workers can use `add` as an atomic test-and-set.
+    Within a process, its threads (e.g. a Pipeline's stages) can share one index: queries are serialised by a lock.
+    """
+
+    _TIMEOUT = 60  # seconds to wait for another writer before raising
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, timeout=self._TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS fingerprints ("
+                           "fingerprint BLOB PRIMARY KEY, added REAL NOT NULL) WITHOUT ROWID")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {'filepath': self.filepath}  # NB: connections can't be pickled (or shared across processes)
+
+    def __setstate__(self, state):
+        self.__init__(state['filepath'])
+
+    def __contains__(self, fingerprint: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM fingerprints WHERE fingerprint = ?",
+                                     (bytes.fromhex(fingerprint),)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def add(self, fingerprint: str) -> bool:
+        """Record the fingerprint. Return True iff it wasn't already recorded (by anyone)"""
+        with self._lock:
+            cursor = self._conn.execute("INSERT OR IGNORE INTO fingerprints VALUES (?, ?)",
+                                        (bytes.fromhex(fingerprint), time.time()))
+            return cursor.rowcount == 1
+
+    def add_all(self, fingerprints: Iterable[str]) -> int:
+        """Record many fingerprints in one transaction. Return how many weren't already recorded"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO fingerprints VALUES (?, ?)",
+                                   ((bytes.fromhex(f), now) for f in fingerprints))
+            return self._conn.total_changes - before
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,491 @@
+from __future__ import annotations
+
+import hashlib
+from array import array
+from collections import deque
+from typing import TYPE_CHECKING
+
+from .CFG import CFG
+from .RandomStream import RNG, resolve_rng
+
+if TYPE_CHECKING:
+    from .CFGAnalysis import CFGAnalysis
+    from .CFGValidator import CFGViolation
+    from .CoverageSelector import CoverageReport
+    from .PathEvaluator import ExpectedPaths
+    from .PathSampler import PathSampler
+    from .StructuredCFG import StructuredCFG
+
+
+class FrozenCFG:
+    """
+    An immutable, array-backed snapshot of a CFG (see `CFG.freeze()`).
+
+    Blocks are renumbered to dense indices 0..n-1 and the graph is stored CSR-style, so successor, degree and role
+    queries are O(1) array lookups rather than nx view constructions. It exposes the read-only subset of the CFG
+    interface, so path simulation and the code builders can run against either.
+
+    _succ_offsets[i]:_succ_offsets[i+1]     slice of _succ_targets holding block i's out edges (in nx edge order)
+    _dir_offsets[i]:_dir_offsets[i+1]       slice of _dir_targets holding block i's out edges expanded by MultiEdge
+                                            count, i.e. _dir_targets[_dir_offsets[i] + edge_ix] is the dst for edge_ix
+    """
+
+    # role bit flags
+    SELECTION_HEADER = 1 << 0
+    LOOP_HEADER = 1 << 1
+    SWITCH_BLOCK = 1 << 2
+    BREAK_BLOCK = 1 << 3
+    CONTINUE_BLOCK = 1 << 4
+    MERGE_TARGET = 1 << 5
+    HAS_MULTI_EDGE = 1 << 6
+
+    _NO_BLOCK = -1
+
+    _DATA_SLOTS = ('_ids', '_index', '_entry', '_succ_offsets', '_succ_targets', '_succ_counts',
+                   '_dir_offsets', '_dir_targets', '_in_degree', '_flags', '_merge')
+
+    __slots__ = _DATA_SLOTS + ('_path_evaluator', '_path_samplers', '_length_sampler', '_distances', '_analysis',
+                                 '_structures')
+
+    def __init__(self, cfg: CFG):
+        ids = list(cfg.nodes())
+        index = {block: ix for ix, block in enumerate(ids)}
+
+        src, dst, counts = [], [], []
+        for ix, block in enumerate(ids):
+            for edge in cfg.out_edges(block):
+                src.append(ix)
+                dst.append(index[edge[1]])
+                counts.append(cfg.no_of_edges_represented_by_edge(edge))
+
+        entry = None
+        roles = {role: [False] * len(ids) for role in ('selection_header', 'loop_header', 'switch_block',
+                                                       'break_block', 'continue_block')}
+        merge = [self._NO_BLOCK] * len(ids)
+        for ix, (block, attrs) in enumerate(cfg.nodes(data=True)):
+            if 'EntryBlock' in attrs:
+                entry = ix
+            roles['selection_header'][ix] = bool(attrs.get('SelectionHeader', False))
+            roles['loop_header'][ix] = bool(attrs.get('LoopHeader', False))
+            roles['switch_block'][ix] = attrs.get('SwitchBlock', False) is not False
+            roles['break_block'][ix] = attrs.get('BreakBlock', False) is not False
+            roles['continue_block'][ix] = attrs.get('ContinueBlock', False) is not False
+            if 'Merge' in attrs:
+                merge[ix] = index[attrs['Merge']]
+
+        self._build(ids, entry, src, dst, counts, merge=merge, **roles)
+
+    @classmethod
+    def from_arrays(cls, ids, entry, src, dst, counts, merge, selection_header, loop_header, switch_block,
+                    break_block, continue_block) -> FrozenCFG:
+        """
+        Build directly from per-block and per-edge sequences, w/o going via a CFG (e.g. when read from a corpus).
+        Blocks are referred to by position in `ids` (entry is None or -1 if there isn't one); edges must be in nx
+        edge order, i.e. grouped by src, each block's out edges in order.
+        """
+        frozen = cls.__new__(cls)
+        frozen._build(ids, None if entry is None or entry < 0 else int(entry), src, dst, counts, merge=merge,
+                      selection_header=selection_header, loop_header=loop_header, switch_block=switch_block,
+                      break_block=break_block, continue_block=continue_block)
+        return frozen
+
+    def _build(self, ids, entry, src, dst, counts, merge, selection_header, loop_header, switch_block, break_block,
+               continue_block):
+        n = len(ids)
+
+        succ_offsets = array('i', [0] * (n + 1))
+        for ix in src:
+            succ_offsets[ix + 1] += 1
+        for ix in range(n):
+            succ_offsets[ix + 1] += succ_offsets[ix]
+
+        succ_targets = array('i', dst)
+        succ_counts = array('i', counts)
+        dir_offsets = array('i', [0])
+        dir_targets = array('i')
+        in_degree = array('i', [0] * n)
+        flags = array('B', [0] * n)
+        merge = array('i', merge)
+
+        for ix in range(n):
+            for e in range(succ_offsets[ix], succ_offsets[ix + 1]):
+                if succ_counts[e] != 1:
+                    flags[ix] |= self.HAS_MULTI_EDGE
+                dir_targets.extend([succ_targets[e]] * succ_counts[e])
+                in_degree[succ_targets[e]] += succ_counts[e]
+            dir_offsets.append(len(dir_targets))
+
+        for ix in range(n):
+            for flag, is_role in ((self.SELECTION_HEADER, selection_header), (self.LOOP_HEADER, loop_header),
+                                  (self.SWITCH_BLOCK, switch_block), (self.BREAK_BLOCK, break_block),
+                                  (self.CONTINUE_BLOCK, continue_block)):
+                if is_role[ix]:
+                    flags[ix] |= flag
+            if merge[ix] != self._NO_BLOCK:
+                flags[merge[ix]] |= self.MERGE_TARGET
+
+        self._ids = array('i', ids)
+        self._index = {block: ix for ix, block in enumerate(self._ids)}
+        self._entry = entry
+        self._succ_offsets = succ_offsets
+        self._succ_targets = succ_targets
+        self._succ_counts = succ_counts
+        self._dir_offsets = dir_offsets
+        self._dir_targets = dir_targets
+        self._in_degree = in_degree
+        self._flags = flags
+        self._merge = merge
+        self._path_evaluator = None
+        self._path_samplers = {}
+        self._length_sampler = None
+        self._distances = None
+        self._analysis = None
+        self._structures = {}
+
+    def __getstate__(self):
+        return {attr: getattr(self, attr) for attr in self._DATA_SLOTS}  # NB: derived caches aren't pickled
+
+    def __setstate__(self, state):
+        for attr, value in state.items():
+            setattr(self, attr, value)
+        self._path_evaluator = None
+        self._path_samplers = {}
+        self._length_sampler = None
+        self._distances = None
+        self._analysis = None
+        self._structures = {}
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenCFG):
+            return False
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self._DATA_SLOTS)
+
+    def __hash__(self):
+        return hash((self._ids.tobytes(), self._succ_targets.tobytes(), self._succ_counts.tobytes(),
+                     self._flags.tobytes(), self._merge.tobytes(), self._entry))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def freeze(self) -> FrozenCFG:
+        return self
+
+    def analysis(self) -> 'CFGAnalysis':
+        """Cached structural analyses (dominators, enclosing loops, reachability, ...), c.f. CFGAnalysis"""
+        if self._analysis is None:
+            from .CFGAnalysis import CFGAnalysis
+            self._analysis = CFGAnalysis(self)
+        return self._analysis
+
+    def structure(self, nests_switch_cases: bool = False) -> 'StructuredCFG':
+        """The cached structured control flow tree the code builders print, c.f. StructuredCFG"""
+        structure = self._structures.get(nests_switch_cases)
+        if structure is None:
+            from .StructuredCFG import StructuredCFG
+            structure = self._structures[nests_switch_cases] = StructuredCFG(self, nests_switch_cases)
+        return structure
+
+    def validate(self) -> list['CFGViolation']:
+        """c.f. CFG.validate"""
+        from .CFGValidator import CFGValidator
+        return CFGValidator(self).validate()
+
+    # HELPERS
+
+    def _ix(self, block) -> int:
+        try:
+            return self._index[block]
+        except KeyError:
+            raise RuntimeError(f"No node with id {block}")
+
+    def _has_flag(self, block, flag: int) -> bool:
+        if block is None:
+            return False
+        return bool(self._flags[self._ix(block)] & flag)
+
+    def _successor_ixs(self, ix: int) -> array:
+        return self._succ_targets[self._succ_offsets[ix]:self._succ_offsets[ix + 1]]
+
+    # NODES
+
+    def nodes(self, data=False) -> list:
+        if not data:
+            return list(self._ids)
+        return [(block, self.node_attributes_dict(block)) for block in self._ids]
+
+    def node_attributes_dict(self, block) -> dict:
+        """Rebuild the nx-style attribute dict of `block`"""
+        ix = self._ix(block)
+        flags = self._flags[ix]
+        attrs = {}
+        if ix == self._entry:
+            attrs['EntryBlock'] = True
+        for flag, label in ((self.SELECTION_HEADER, 'SelectionHeader'), (self.LOOP_HEADER, 'LoopHeader'),
+                            (self.SWITCH_BLOCK, 'SwitchBlock'), (self.BREAK_BLOCK, 'BreakBlock'),
+                            (self.CONTINUE_BLOCK, 'ContinueBlock')):
+            if flags & flag:
+                attrs[label] = True
+        if self._merge[ix] != self._NO_BLOCK:
+            attrs['Merge'] = self._ids[self._merge[ix]]
+        return attrs
+
+    def entry_node(self) -> int:
+        if self._entry is None:
+            raise ValueError("EntryBlock not found")
+        return self._ids[self._entry]
+
+    def is_selection_header(self, block) -> bool:
+        return self._has_flag(block, self.SELECTION_HEADER)
+
+    def is_loop_header(self, block) -> bool:
+        return self._has_flag(block, self.LOOP_HEADER)
+
+    def is_switch_block(self, block) -> bool:
+        if not block:
+            return False
+        return self._has_flag(block, self.SWITCH_BLOCK)
+
+    def is_continue_block(self, block) -> bool:
+        is_cont = self._has_flag(block, self.CONTINUE_BLOCK)
+        if is_cont:
+            assert self.is_basic_block(block)
+        return is_cont
+
+    def is_break_block(self, block) -> bool:
+        is_br = self._has_flag(block, self.BREAK_BLOCK)
+        if is_br:
+            assert self.is_basic_block(block)
+        return is_br
+
+    def is_merge_block(self, block) -> bool:
+        """Return if block is a merge for any (header) node(s)"""
+        return self._has_flag(block, self.MERGE_TARGET)
+
+    def is_end_node(self, block) -> bool:
+        if block is None:
+            return False
+        ix = self._ix(block)
+        return self._succ_offsets[ix] == self._succ_offsets[ix + 1]
+
+    def contains_merge_instruction(self, block) -> bool:
+        return self._merge[self._ix(block)] != self._NO_BLOCK
+
+    def merge_block(self, block) -> int:
+        m_ix = self._merge[self._ix(block)]
+        if m_ix == self._NO_BLOCK:
+            raise ValueError("No merge block")
+        return self._ids[m_ix]
+
+    # Shared with CFG: these are written purely in terms of the query methods above
+    is_basic_block = CFG.is_basic_block
+    is_exit_block = CFG.is_exit_block
+    is_header_block = CFG.is_header_block
+
+    # EDGES
+
+    def out_edges(self, block) -> list[tuple[int, int]]:
+        return [(block, self._ids[dst]) for dst in self._successor_ixs(self._ix(block))]
+
+    def out_edges_destinations(self, block) -> list[int]:
+        return [self._ids[dst] for dst in self._successor_ixs(self._ix(block))]
+
+    def out_degree(self, block) -> int:
+        ix = self._ix(block)
+        return self._dir_offsets[ix + 1] - self._dir_offsets[ix]
+
+    def in_degree(self, block) -> int:
+        return self._in_degree[self._ix(block)]
+
+    def contains_multi_edge(self, block) -> bool:
+        return self._has_flag(block, self.HAS_MULTI_EDGE)
+
+    def no_of_edges_represented_by_edge(self, edge) -> int:
+        """NB: as with CFG, a 2-tuple refers to the first of any parallel (u, v) edges"""
+        if not edge:
+            return 1
+        src, dst = self._ix(edge[0]), self._index.get(edge[1])
+        key = edge[2] if len(edge) > 2 else 0
+        for ix in range(self._succ_offsets[src], self._succ_offsets[src + 1]):
+            if self._succ_targets[ix] == dst:
+                if key == 0:
+                    return self._succ_counts[ix]
+                key -= 1
+        return 1
+
+    def is_multi_edge(self, edge) -> bool:
+        return self.no_of_edges_represented_by_edge(edge) != 1
+
+    def edge_index_to_dst_block(self, src_block: int, edge_ix: int) -> int:
+        ix = self._ix(src_block)
+        start, end = self._dir_offsets[ix], self._dir_offsets[ix + 1]
+        if edge_ix >= end - start or start == end:
+            raise IndexError("Index out of range")
+        # NB: CFG.edge_index_to_dst_block resolves negative indices to the first edge, so do the same
+        return self._ids[self._dir_targets[start + max(edge_ix, 0)]]
+
+    # REACHABILITY
+
+    def ancestors(self, block) -> set[int]:
+        return set(self.analysis().ancestors(block))
+
+    def descendants(self, block) -> set[int]:
+        return set(self.analysis().descendants(block))
+
+    def is_reachable(self, source: int, destination: int, avoiding: int = None) -> bool:
+        """c.f. CFGAnalysis.is_reachable"""
+        return self.analysis().is_reachable(source, destination, avoiding)
+
+    def distances_to_exit(self) -> dict[int, int]:
+        """
+        For each block that can reach an exit, the min. no. of directions consumed on the way (i.e. the no. of
+        branches passed through, excluding exits). Blocks that can't reach an exit are omitted.
+        """
+        if self._distances is not None:
+            return self._distances
+
+        predecessors = [[] for _ in self._ids]
+        for src in range(len(self._ids)):
+            for dst in self._successor_ixs(src):
+                predecessors[dst].append(src)
+
+        # 0-1 BFS backwards from the exits: leaving a branch costs a direction, leaving a basic block doesn't
+        distances = {}
+        queue = deque(ix for ix in range(len(self._ids)) if self._succ_offsets[ix] == self._succ_offsets[ix + 1])
+        tentative = {ix: 0 for ix in queue}
+        while queue:
+            ix = queue.popleft()
+            if ix in distances:
+                continue
+            distances[ix] = tentative[ix]
+            for src in predecessors[ix]:
+                cost = 1 if self._dir_offsets[src + 1] - self._dir_offsets[src] >= 2 else 0
+                if src not in distances and tentative.get(src, float('inf')) > distances[ix] + cost:
+                    tentative[src] = distances[ix] + cost
+                    if cost:
+                        queue.append(src)
+                    else:
+                        queue.appendleft(src)
+
+        self._distances = {self._ids[ix]: dist for ix, dist in distances.items()}
+        return self._distances
+
+    # FINGERPRINT
+
+    def _signature(self, ix: int, labels: dict[int, int]) -> tuple:
+        """Block ix's roles and ordered out edges, w/ blocks referred to by their label"""
+        merge = self._merge[ix]
+        counts = self._succ_counts[self._succ_offsets[ix]:self._succ_offsets[ix + 1]]
+        return (self._flags[ix], labels.get(merge, self._NO_BLOCK) if merge != self._NO_BLOCK else self._NO_BLOCK,
+                tuple((labels.get(dst, self._NO_BLOCK), count) for dst, count in zip(self._successor_ixs(ix), counts)))
+
+    def canonical_form(self) -> bytes:
+        """
+        An encoding of the CFG's structure that is independent of block numbering: two CFGs have the same canonical
+        form iff they're identical up to relabelling blocks (incl. roles, merge blocks, multi-edges and edge order).
+
+        Out edges are ordered (edge order = branch direction) and every block hangs off the single entry block, so a
+        BFS from the entry taking out edges in order visits blocks in the same order whatever their IDs. Blocks are
+        labelled in visit order and encoded as (roles, merge label, ordered (dst label, multi-edge count) pairs).
+
+        NB: blocks unreachable from the entry (never produced by CFGGenerator) have no such order. They're
+        summarised by a Weisfeiler-Lehman colour refinement instead, which is relabelling-invariant but not exact.
+        """
+        labels = {}
+        if self._entry is not None:
+            labels[self._entry] = 0
+            queue = deque([self._entry])
+            while queue:
+                for dst in self._successor_ixs(queue.popleft()):
+                    if dst not in labels:
+                        labels[dst] = len(labels)
+                        queue.append(dst)
+
+        order = sorted(labels, key=labels.get)
+        encoding = [len(self._ids), len(order)]
+        for ix in order:
+            flags, merge, out_edges = self._signature(ix, labels)
+            encoding += [flags, merge, len(out_edges)]
+            for dst, count in out_edges:
+                encoding += [dst, count]
+
+        unreachable = [ix for ix in range(len(self._ids)) if ix not in labels]
+        if unreachable:
+            colours = {ix: hash(self._signature(ix, labels)) for ix in unreachable}
+            for _ in range(len(unreachable)):
+                refined = {ix: hash((colours[ix], tuple(colours.get(dst, labels.get(dst))
+                                                        for dst in self._successor_ixs(ix)))) for ix in unreachable}
+                if len(set(refined.values())) == len(set(colours.values())):
+                    break
+                colours = refined
+            encoding += sorted(colours.values())
+
+        return array('q', encoding).tobytes()
+
+    def fingerprint(self) -> str:
+        """Digest of `canonical_form()`: equal for CFGs that are identical up to relabelling blocks"""
+        return hashlib.blake2b(self.canonical_form(), digest_size=16).hexdigest()
+
+    # PATHS
+
+    generate_valid_input_directions = CFG.generate_valid_input_directions
+    expected_output_path = CFG.expected_output_path
+
+    def _path_sampler(self, max_length: int) -> 'PathSampler':
+        from .PathSampler import PathSampler
+
+        if max_length not in self._path_samplers:
+            self._path_samplers[max_length] = PathSampler(self, max_length)
+        return self._path_samplers[max_length]
+
+    def count_valid_input_directions(self, max_length: int = 64) -> int:
+        """No. of distinct valid input directions w/ at most max_length directions"""
+        return self._path_sampler(max_length).count()
+
+    def generate_n_valid_input_directions(self, n: int, seed: int = None, max_length: int = 64,
+                                          rng: RNG = None) -> list[list[int]]:
+        """
+        Return n distinct valid input directions (or all of them, if there are fewer than n), each of length at most
+        max_length, sampled uniformly at random from all such directions.
+        seed, rng: c.f. resolve_rng (likewise below)
+        """
+        rng = resolve_rng(seed, rng)
+        return self._path_sampler(max_length).sample(n, rng)
+
+    def generate_input_directions_of_length(self, min_length: int, max_length: int = None,
+                                            seed: int = None, rng: RNG = None) -> list[int]:
+        """
+        Return valid input directions w/ exactly min_length directions or, if max_length is given, a length in
+        [min_length, max_length]. Built in a single pass; raises ValueError if no such directions exist.
+        """
+        from .PathSampler import LengthTargetedSampler
+
+        if self._length_sampler is None:
+            self._length_sampler = LengthTargetedSampler(self)
+        rng = resolve_rng(seed, rng)
+        return self._length_sampler.sample(min_length, min_length if max_length is None else max_length, rng)
+
+    def generate_covering_input_directions(self, seed: int = None, max_length: int = 512,
+                                           no_of_samples: int = 32,
+                                           rng: RNG = None) -> tuple[list[list[int]], 'CoverageReport']:
+        """
+        Return a small set of valid input directions that together take every edge (incl. every switch case and
+        fallthrough) and run every loop 0, 1 and many times, plus a report of the coverage achieved.
+        NB: goals no valid path can hit (e.g. a loop whose body always breaks can't run many times) stay uncovered
+        """
+        from .CoverageSelector import CoverageSelector
+
+        rng = resolve_rng(seed, rng)
+        return CoverageSelector(self, max_length).select(no_of_samples, rng)
+
+    def expected_output_paths(self, directions, lengths=None) -> 'ExpectedPaths':
+        """
+        Batch version of `expected_output_path`.
+        directions: a padded 2-D array (w/ `lengths` giving each row's length) or a list of direction lists
+        """
+        from .PathEvaluator import PathEvaluator
+
+        if self._path_evaluator is None:
+            self._path_evaluator = PathEvaluator(self)
+        if isinstance(directions, list):
+            directions, lengths = PathEvaluator.pad_directions(directions)
+        return self._path_evaluator.evaluate(directions, lengths)
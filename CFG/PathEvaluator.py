@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from enum import IntEnum
+from typing import Optional
+
+import numpy as np
+
+
+class PathStatus(IntEnum):
+    """Per-row outcome of a batch `expected_output_path` evaluation"""
+    OK = 0
+    EXHAUSTED_DIRECTIONS = 1  # reached a branch with no directions left
+    INVALID_DIRECTION = 2  # direction was negative or >= the branch's out degree
+    NON_TERMINATING = 3  # entered a cycle of basic blocks, so never reaches another branch or an exit
+
+
+class ExpectedPaths:
+    """
+    Ragged expected paths for a batch of direction vectors, stored flat.
+
+    The path for row i is `blocks[offsets[i]:offsets[i+1]]`. For rows whose status isn't OK, this is the prefix of
+    the path walked before the error.
+    """
+
+    def __init__(self, blocks: np.ndarray, offsets: np.ndarray, status: np.ndarray):
+        self.blocks = blocks
+        self.offsets = offsets
+        self.status = status
+
+    def __len__(self):
+        return len(self.status)
+
+    def __getitem__(self, row: int) -> list[int]:
+        status = PathStatus(int(self.status[row]))
+        if status is not PathStatus.OK:
+            raise RuntimeError(f"No expected path for row {row}: {status.name}")
+        return self.partial_path(row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def partial_path(self, row: int) -> list[int]:
+        return self.blocks[self.offsets[row]:self.offsets[row + 1]].tolist()
+
+    def all_ok(self) -> bool:
+        return bool(np.all(self.status == PathStatus.OK))
+
+
+class PathEvaluator:
+    """
+    Compiles a (frozen) CFG into a transition table, then evaluates `expected_output_path` for many direction vectors
+    at once, advancing every path by one direction per vectorised step.
+
+    Runs of basic blocks are collapsed ahead of time: for each block v, `chain(v)` is v followed by its forced
+    (out degree == 1) successors up to and including the first block that is a branch or an exit. A path is then
+    chain(entry) followed by chain(dst) for each direction consumed.
+
+    NB: unlike `CFG.expected_output_path`, negative directions are reported as INVALID_DIRECTION rather than being
+    treated as edge 0.
+    """
+
+    _NO_BLOCK = -1
+
+    def __init__(self, frozen_cfg):
+        cfg = frozen_cfg
+
+        self._ids = np.asarray(cfg._ids, dtype=np.int64)
+        self._entry = cfg._index[cfg.entry_node()]
+
+        dir_offsets = np.asarray(cfg._dir_offsets, dtype=np.int64)
+        dir_targets = np.asarray(cfg._dir_targets, dtype=np.int64)
+        self._out_degree = np.diff(dir_offsets)
+
+        # transition table: _table[block, direction] = dst block (or _NO_BLOCK)
+        n = len(self._ids)
+        width = max(int(self._out_degree.max(initial=0)), 1)
+        self._table = np.full((n, width), self._NO_BLOCK, dtype=np.int64)
+        rows = np.repeat(np.arange(n), self._out_degree)
+        cols = np.arange(len(dir_targets)) - np.repeat(dir_offsets[:-1], self._out_degree)
+        self._table[rows, cols] = dir_targets
+
+        self._compile_chains()
+
+    def _compile_chains(self):
+        n = len(self._ids)
+        is_forced = self._out_degree == 1
+        forced_dst = self._table[:, 0]
+
+        needs_chain = np.zeros(n, dtype=bool)
+        needs_chain[self._entry] = True
+        branch_dsts = self._table[self._out_degree >= 2]
+        needs_chain[branch_dsts[branch_dsts != self._NO_BLOCK]] = True
+
+        chain_start = np.zeros(n, dtype=np.int64)
+        chain_len = np.zeros(n, dtype=np.int64)
+        chain_end = np.full(n, self._NO_BLOCK, dtype=np.int64)
+        chain_blocks: list[int] = []
+
+        for v in np.flatnonzero(needs_chain).tolist():
+            chain_start[v] = len(chain_blocks)
+            seen = set()
+            block = v
+            while block not in seen:
+                seen.add(block)
+                chain_blocks.append(block)
+                if not is_forced[block]:
+                    chain_end[v] = block
+                    break
+                block = int(forced_dst[block])
+            chain_len[v] = len(chain_blocks) - chain_start[v]
+
+        self._chain_start = chain_start
+        self._chain_len = chain_len
+        self._chain_end = chain_end
+        self._chain_blocks = np.asarray(chain_blocks, dtype=np.int64)
+
+    @staticmethod
+    def pad_directions(directions: list[list[int]], fill_value: int = -1) -> tuple[np.ndarray, np.ndarray]:
+        """Convert a list of direction vectors to a padded 2-D array and an array of their lengths"""
+        lengths = np.fromiter((len(d) for d in directions), dtype=np.int64, count=len(directions))
+        padded = np.full((len(directions), int(lengths.max(initial=0))), fill_value, dtype=np.int64)
+        if len(directions):
+            mask = np.arange(padded.shape[1]) < lengths[:, None]
+            padded[mask] = np.fromiter((x for d in directions for x in d), dtype=np.int64, count=int(lengths.sum()))
+        return padded, lengths
+
+    def evaluate(self, directions: np.ndarray, lengths: Optional[np.ndarray] = None) -> ExpectedPaths:
+        """
+        directions: 2-D array, one (padded) direction vector per row
+        lengths: number of valid directions in each row. If None, every column of every row is used
+        """
+
+        directions = np.asarray(directions, dtype=np.int64)
+        if directions.ndim != 2:
+            raise ValueError("directions must be a 2-D array")
+        no_of_rows, width = directions.shape
+        lengths = np.full(no_of_rows, width, dtype=np.int64) if lengths is None else np.asarray(lengths,
+                                                                                             dtype=np.int64)
+        if lengths.shape != (no_of_rows,) or np.any(lengths > width) or np.any(lengths < 0):
+            raise ValueError("lengths must give, for each row, a length in the range [0, no. of columns]")
+
+        status = np.full(no_of_rows, PathStatus.OK, dtype=np.int8)
+        entry_end = self._chain_end[self._entry]
+        if entry_end == self._NO_BLOCK:
+            status[:] = PathStatus.NON_TERMINATING
+        state = np.full(no_of_rows, entry_end, dtype=np.int64)
+
+        # taken[r, k] = dst block chosen by the k-th direction of row r
+        taken = np.full((no_of_rows, width), self._NO_BLOCK, dtype=np.int64)
+
+        for k in range(width + 1):
+            active = np.flatnonzero(status == PathStatus.OK)
+            active = active[self._out_degree[state[active]] >= 2]  # rows at an exit are done
+            if len(active) == 0:
+                break
+
+            exhausted = lengths[active] <= k
+            status[active[exhausted]] = PathStatus.EXHAUSTED_DIRECTIONS
+            active = active[~exhausted]
+            if len(active) == 0:
+                break
+
+            current = state[active]
+            choice = directions[active, k]
+            valid = (choice >= 0) & (choice < self._out_degree[current])
+            status[active[~valid]] = PathStatus.INVALID_DIRECTION
+            active, current, choice = active[valid], current[valid], choice[valid]
+
+            dst = self._table[current, choice]
+            taken[active, k] = dst
+            state[active] = self._chain_end[dst]
+            status[active[state[active] == self._NO_BLOCK]] = PathStatus.NON_TERMINATING
+
+        return self._assemble(taken, status)
+
+    def _assemble(self, taken: np.ndarray, status: np.ndarray) -> ExpectedPaths:
+        """Concatenate chain(entry), chain(taken[r, 0]), chain(taken[r, 1]), ... for every row r"""
+
+        no_of_rows = len(status)
+        segments = np.hstack([np.full((no_of_rows, 1), self._entry, dtype=np.int64), taken])
+        rows, _ = np.nonzero(segments != self._NO_BLOCK)
+        segments = segments[segments != self._NO_BLOCK]  # row-major, so each row's segments stay in order
+
+        seg_lens = self._chain_len[segments]
+        seg_offsets = np.cumsum(seg_lens) - seg_lens
+        gather = np.repeat(self._chain_start[segments] - seg_offsets, seg_lens) + np.arange(int(seg_lens.sum()))
+
+        offsets = np.zeros(no_of_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, weights=seg_lens, minlength=no_of_rows).astype(np.int64), out=offsets[1:])
+
+        return ExpectedPaths(blocks=self._ids[self._chain_blocks[gather]], offsets=offsets, status=status)
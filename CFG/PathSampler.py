@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import random
+
+import numpy as np
+
+
+class _BranchGraph:
+    """
+    The branch blocks (out degree >= 2) of a (frozen) CFG, w/ runs of basic blocks collapsed: each direction taken
+    from a branch targets the next branch reached, or one of two terminal codes: `exit` (reaches an exit block) or
+    `dead` (enters a cycle of basic blocks). Branches are numbered by position 0..m-1; exit = m, dead = m + 1.
+
+    targets[offsets[pos] + d] = target of direction d from the branch at position pos
+    start = target reached from the entry block w/o consuming a direction
+    """
+
+    def __init__(self, frozen_cfg):
+        dir_offsets = frozen_cfg._dir_offsets
+        out_degree = [dir_offsets[ix + 1] - dir_offsets[ix] for ix in range(len(frozen_cfg))]
+
+        branches = [ix for ix, degree in enumerate(out_degree) if degree >= 2]
+        branch_pos = {ix: pos for pos, ix in enumerate(branches)}
+        self.exit = len(branches)
+        self.dead = len(branches) + 1
+
+        settled: dict[int, int] = {}
+
+        def settle(ix: int) -> int:
+            """Follow basic blocks from ix to the first branch/exit. Return its branch position or terminal code"""
+            walked = {}  # NB: used as an ordered set
+            while ix not in settled:
+                if out_degree[ix] != 1:
+                    settled[ix] = self.exit if out_degree[ix] == 0 else branch_pos[ix]
+                    break
+                if ix in walked:
+                    settled[ix] = self.dead
+                    break
+                walked[ix] = None
+                ix = frozen_cfg._dir_targets[dir_offsets[ix]]
+            for w in walked:
+                settled[w] = settled[ix]
+            return settled[ix]
+
+        self.start = settle(frozen_cfg._index[frozen_cfg.entry_node()])
+
+        self.offsets = np.zeros(len(branches) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([out_degree[ix] for ix in branches])
+        self.targets = np.array([settle(dst) for ix in branches
+                                 for dst in frozen_cfg._dir_targets[dir_offsets[ix]:dir_offsets[ix + 1]]],
+                                dtype=np.int64)
+
+    def __len__(self):
+        return self.exit
+
+    def targets_of(self, pos: int) -> np.ndarray:
+        return self.targets[self.offsets[pos]:self.offsets[pos + 1]]
+
+
+class PathSampler:
+    """
+    Counts, and samples uniformly from, the valid direction vectors of a (frozen) CFG with at most `max_length`
+    directions, i.e. those whose path ends at an exit block.
+
+    Loops are unrolled up to the direction budget by dynamic programming over the branch blocks:
+        paths[b][j] = sum(paths[b - 1][dst] for dst in the targets of branch j's directions)
+    where a target that (via basic blocks) leads to an exit counts 1, and one that leads to a cycle of basic blocks
+    counts 0. Every valid direction vector then has a unique index in [0, count) and can be recovered from it
+    ("unranked") in time linear in its length, so N distinct vectors are drawn by sampling N distinct indices.
+    """
+
+    def __init__(self, frozen_cfg, max_length: int):
+        if max_length < 0:
+            raise ValueError("max_length must be non-negative")
+
+        self._max_length = max_length
+        self._graph = _BranchGraph(frozen_cfg)
+        self._counts = self._count_paths()
+
+    def _count_paths(self) -> list[np.ndarray]:
+        """counts[b][pos] = no. of valid direction vectors w/ at most b directions, starting from branch pos"""
+
+        graph = self._graph
+        layer = np.zeros(len(graph) + 2, dtype=object)
+        layer[graph.exit] = 1
+        counts = [layer]
+
+        for _ in range(self._max_length):
+            layer = np.zeros(len(graph) + 2, dtype=object)
+            layer[graph.exit] = 1
+            if len(graph):
+                layer[:len(graph)] = np.add.reduceat(counts[-1][graph.targets], graph.offsets[:-1])
+            counts.append(layer)
+
+        return counts
+
+    def count(self) -> int:
+        """Total no. of valid direction vectors w/ at most max_length directions"""
+        return int(self._counts[self._max_length][self._graph.start])
+
+    def unrank(self, index: int) -> list[int]:
+        """Return the index-th valid direction vector (in lexicographic order of directions)"""
+
+        if not 0 <= index < self.count():
+            raise IndexError("Index out of range")
+
+        directions = []
+        current, budget = self._graph.start, self._max_length
+
+        while current != self._graph.exit:
+            budget -= 1
+            for direction, target in enumerate(self._graph.targets_of(current)):
+                no_of_paths = self._counts[budget][target]
+                if index < no_of_paths:
+                    directions.append(direction)
+                    current = target
+                    break
+                index -= no_of_paths
+
+        return directions
+
+    def sample(self, n: int, rng=random) -> list[list[int]]:
+        """
+        Return min(n, count()) distinct valid direction vectors, drawn uniformly at random w/o rejection.
+        rng: anything w/ the `random` module's randrange/shuffle (the module itself, or a random.Random)
+        """
+
+        total = self.count()
+        if n >= total:
+            indices = list(range(total))
+        else:
+            # Floyd's algorithm: a uniform n-subset of range(total) in exactly n draws
+            chosen = set()
+            for upper in range(total - n, total):
+                t = rng.randrange(upper + 1)
+                chosen.add(upper if t in chosen else t)
+            indices = sorted(chosen)
+
+        rng.shuffle(indices)
+        return [self.unrank(ix) for ix in indices]
+
+
+class LengthTargetedSampler:
+    """
+    Generates valid direction vectors of an exact length (or a length within a range) in a single pass, e.g. ones
+    that drive a loop header tens of thousands of times before leaving.
+
+    feasible[k][j] is True iff some valid direction vector starting from branch j has exactly k directions. It is
+    built a layer at a time (vectorised over the branches), extending as longer lengths are requested, and the walk
+    only ever takes directions from which the remaining length is still exactly achievable, so it never backtracks.
+    Layers are stored bit-packed: memory is ~ max_length * no. of branches / 8 bytes.
+    """
+
+    def __init__(self, frozen_cfg):
+        self._graph = _BranchGraph(frozen_cfg)
+        self._layers: list[np.ndarray] = []  # bit-packed feasible[k] for k = 0, 1, ...
+        self._start_lengths: list[bool] = []  # feasible[k][start], w/ start possibly a terminal code
+
+    def _feasible(self, length: int, target: int) -> bool:
+        if target >= len(self._graph):
+            return target == self._graph.exit and length == 0
+        layer = self._layers[length]
+        return bool((layer[target >> 3] >> (7 - (target & 7))) & 1)
+
+    def _extend_to(self, max_length: int):
+        graph = self._graph
+        previous = np.unpackbits(self._layers[-1], count=len(graph)).astype(bool) if self._layers else None
+
+        for length in range(len(self._layers), max_length + 1):
+            layer = np.zeros(len(graph), dtype=bool)
+            if length > 0 and len(graph):
+                extended = np.concatenate([previous, [length == 1, False]])  # exit after the final direction
+                layer = np.logical_or.reduceat(extended[graph.targets], graph.offsets[:-1])
+            self._layers.append(np.packbits(layer))
+            self._start_lengths.append(self._feasible(length, graph.start))
+            previous = layer
+
+    def feasible_lengths(self, min_length: int, max_length: int) -> list[int]:
+        """All k in [min_length, max_length] s.t. a valid direction vector w/ exactly k directions exists"""
+        self._extend_to(max_length)
+        return [k for k in range(min_length, max_length + 1) if self._start_lengths[k]]
+
+    def sample(self, min_length: int, max_length: int, rng=random) -> list[int]:
+        """Return a valid direction vector w/ length in [min_length, max_length], the length chosen uniformly from
+        those achievable"""
+
+        if not 0 <= min_length <= max_length:
+            raise ValueError("Require 0 <= min_length <= max_length")
+
+        lengths = self.feasible_lengths(min_length, max_length)
+        if not lengths:
+            raise ValueError(f"No valid input directions have a length in [{min_length}, {max_length}]")
+
+        remaining = rng.choice(lengths)
+        directions = []
+        current = self._graph.start
+
+        while current != self._graph.exit:
+            remaining -= 1
+            choices = [d for d, target in enumerate(self._graph.targets_of(current))
+                       if self._feasible(remaining, target)]
+            direction = rng.choice(choices)
+            directions.append(direction)
+            current = int(self._graph.targets_of(current)[direction])
+
+        return directions
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import random
+from typing import Optional, Union
+
+import numpy as np
+
+
+class RandomStream(random.Random):
+    """
+    A random.Random (so usable wherever the `random` module is, e.g. PathSampler) seeded from a numpy SeedSequence,
+    so it can spawn child streams that are independent of it, of each other and of the order they're drawn from.
+    E.g. `RandomStream(seed).child(i)` is the same stream for graph i whether graphs are made in one process or many.
+
+    `numpy()` gives a numpy Generator on the same seed sequence, for batch draws.
+    """
+
+    def __init__(self, seed: Union[None, int, np.random.SeedSequence] = None):
+        """seed: None for fresh OS entropy"""
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        super().__init__(int.from_bytes(self.seed_sequence.generate_state(4, np.uint64).tobytes(), 'little'))
+
+    def __reduce__(self):
+        return self.__class__, (self.seed_sequence,), self.getstate()
+
+    def child(self, *key: int) -> RandomStream:
+        """The child stream w/ this key, e.g. (graph_no, attempt). Doesn't advance this stream"""
+        return RandomStream(np.random.SeedSequence(self.seed_sequence.entropy,
+                                                   spawn_key=self.seed_sequence.spawn_key + key))
+
+    def spawn(self, n: int) -> list[RandomStream]:
+        """n new child streams, c.f. SeedSequence.spawn"""
+        return [RandomStream(seed_sequence) for seed_sequence in self.seed_sequence.spawn(n)]
+
+    def numpy(self) -> np.random.Generator:
+        return np.random.Generator(np.random.PCG64(self.seed_sequence))
+
+
+RNG = Union[random.Random, np.random.Generator]
+
+
+def resolve_rng(seed: Optional[int] = None, rng: Optional[RNG] = None):
+    """
+    The RNG a `seed`/`rng` pair of parameters means: a random.Random(seed) if there's a seed, else rng (a numpy
+    Generator is converted by drawing a seed from it) or, if neither's given, the global `random` module.
+    """
+    if seed is not None:
+        return random.Random(seed)
+    if isinstance(rng, np.random.Generator):
+        return RandomStream(int(rng.integers(2 ** 63)))
+    return random if rng is None else rng
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class ReachabilityIndex:
+    """
+    Transitive closure of a graph over dense ixs 0..n-1, so "can u reach v" is a bit test rather than a traversal.
+
+    The graph is condensed to its strongly connected components (every block of a loop reaches every other), which
+    are numbered in reverse topological order, then each component's closure is built as a bitset (a Python int, so
+    OR-ing two is a word-at-a-time loop in C) by OR-ing its successors' closures: O(V + E·C/64) for C components.
+
+    Reachability is strict: u reaches v iff there's a path of >= 1 edge, so u only reaches itself if on a cycle.
+    """
+
+    def __init__(self, successors: list[list[int]]):
+        self._component = self._strongly_connected_components(successors)
+        no_of_components = max(self._component, default=-1) + 1
+
+        self._members = [[] for _ in range(no_of_components)]
+        for ix, component in enumerate(self._component):
+            self._members[component].append(ix)
+
+        # _closure[c] has bit d set iff component c reaches component d, plus bit c itself (see _is_cyclic)
+        self._closure = [0] * no_of_components
+        self._is_cyclic = [False] * no_of_components
+        for component, members in enumerate(self._members):  # NB: successors' components come first
+            closure = 1 << component
+            targets = set()
+            for ix in members:
+                for dst in successors[ix]:
+                    targets.add(self._component[dst])
+            if component in targets or len(members) > 1:
+                self._is_cyclic[component] = True
+                targets.discard(component)
+            for target in targets:
+                closure |= self._closure[target]
+            self._closure[component] = closure
+
+    @staticmethod
+    def _strongly_connected_components(successors: list[list[int]]) -> list[int]:
+        """Component of each ix, numbered in the order Tarjan's algorithm completes them (i.e. reverse topological)"""
+        n = len(successors)
+        component = [-1] * n
+        order, low_link = [-1] * n, [0] * n
+        stack, on_stack = [], [False] * n
+        counter = no_of_components = 0
+
+        for root in range(n):
+            if order[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                ix, edge_ix = work.pop()
+                if edge_ix == 0:
+                    order[ix] = low_link[ix] = counter
+                    counter += 1
+                    stack.append(ix)
+                    on_stack[ix] = True
+                else:  # NB: back from the child at edge_ix - 1
+                    low_link[ix] = min(low_link[ix], low_link[successors[ix][edge_ix - 1]])
+
+                dsts = successors[ix]
+                while edge_ix < len(dsts):
+                    dst = dsts[edge_ix]
+                    edge_ix += 1
+                    if order[dst] == -1:
+                        work.append((ix, edge_ix))
+                        work.append((dst, 0))
+                        break
+                    elif on_stack[dst]:
+                        low_link[ix] = min(low_link[ix], order[dst])
+                else:
+                    if low_link[ix] == order[ix]:  # ix is the root of a component: pop it
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component[member] = no_of_components
+                            if member == ix:
+                                break
+                        no_of_components += 1
+
+        return component
+
+    def reaches(self, src: int, dst: int) -> bool:
+        src_component, dst_component = self._component[src], self._component[dst]
+        if src_component == dst_component:
+            return self._is_cyclic[src_component]
+        return bool(self._closure[src_component] >> dst_component & 1)
+
+    def reachable_from(self, src: int) -> list[int]:
+        """Every ix src reaches"""
+        component = self._component[src]
+        closure = self._closure[component]
+        if not self._is_cyclic[component]:
+            closure ^= 1 << component
+        closure_bytes = np.frombuffer(closure.to_bytes((closure.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+        bits = np.unpackbits(closure_bytes, bitorder='little')
+        return [ix for reached in np.flatnonzero(bits).tolist() for ix in self._members[reached]]
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Generator, Optional
+
+from my_common.MergeBlockData import MergeBlockData
+
+if TYPE_CHECKING:
+    from .FrozenCFG import FrozenCFG
+
+Seq = list  # NB: of nodes and (nested) Seqs, in the order their code is placed
+
+
+class BlockNode:
+    """A block's own code (c.f. Language.block), where the block is placed"""
+
+    __slots__ = ('block',)
+
+    def __init__(self, block: int):
+        self.block = block
+
+
+class JumpNode:
+    """What ends a block that leaves its construct: the function (exit), the innermost loop (break) or an iteration"""
+
+    EXIT, BREAK, CONTINUE = 'exit', 'break', 'continue'
+
+    __slots__ = ('kind',)
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+
+class LoopNode:
+    __slots__ = ('header', 'body')
+
+    def __init__(self, header: int, body: Seq):
+        self.header = header
+        self.body = body
+
+
+class SelectionNode:
+    """false_body: None if the false branch goes straight to the merge block (i.e. there's no else)"""
+
+    __slots__ = ('header', 'true_body', 'false_body')
+
+    def __init__(self, header: int, true_body: Seq, false_body: Optional[Seq]):
+        self.header = header
+        self.true_body = true_body
+        self.false_body = false_body
+
+
+class CaseNode:
+    """
+    A switch case. is_fallthrough: it can reach the next case (w/o going round a loop). needs_break: it has to break
+    out of the switch, as it neither falls through nor ends in an exit, break or continue of its own
+    """
+
+    __slots__ = ('target', 'body', 'is_fallthrough', 'needs_break')
+
+    def __init__(self, target: int, body: Seq, is_fallthrough: bool, needs_break: bool):
+        self.target = target
+        self.body = body
+        self.is_fallthrough = is_fallthrough
+        self.needs_break = needs_break
+
+
+class SwitchNode:
+    __slots__ = ('header', 'cases', 'default')
+
+    def __init__(self, header: int, cases: list[CaseNode], default: Seq):
+        self.header = header
+        self.cases = cases
+        self.default = default
+
+
+class BlockRange:
+    """A request, yielded by a structuring generator, for the structure of blocks [block, end_block)"""
+
+    def __init__(self, block: int | None, end_block: int | None, merge_blocks: list[MergeBlockData],
+                 next_case_block: int = None):
+        self.block = block
+        self.end_block = end_block
+        self.merge_blocks = merge_blocks
+        self.next_case_block = next_case_block
+
+
+Structuring = Generator[BlockRange, Seq, Seq]  # NB: yields requests, is sent their structure, returns its own
+
+
+class StructuredCFG:
+    """
+    A CFG's structured control flow, as a tree of constructs: loops, selections and switches (w/ each case's
+    fallthrough and break), the blocks in each, and where they're left by an exit, break or continue. It's the same
+    for every language and code type, so it's built once per CFG (c.f. FrozenCFG.structure), then each language's
+    printer (c.f. code_builders.Printer) walks it to emit code.
+
+    Each block is placed once, where the traversal first reaches it, so blocks shared by branches are placed in the
+    branch built first (a selection's false branch, a switch's earlier case). The one language-dependent choice is
+    nests_switch_cases: WASM's switch is a chain of nested blocks, so each case's code ends where the next case's
+    starts (rather than at the switch's merge block), which changes where some merge blocks are placed.
+    """
+
+    def __init__(self, cfg: 'FrozenCFG', nests_switch_cases: bool = False):
+        self.cfg = cfg
+        self.nests_switch_cases = nests_switch_cases
+        self.body: Seq = _Structurer(cfg, nests_switch_cases).structure()
+
+
+class _Structurer:
+    """
+    Builds a StructuredCFG's tree w/o recursion: each construct's structure is built by a generator that yields a
+    BlockRange wherever it needs the structure of a range of blocks, and `structure` runs the generators off an
+    explicit stack (nesting is as deep as the CFG)
+    """
+
+    def __init__(self, cfg: 'FrozenCFG', nests_switch_cases: bool):
+        self.cfg = cfg
+        self.nests_switch_cases = nests_switch_cases
+        self.placed_blocks = set()
+
+    def structure(self) -> Seq:
+        stack = [self._block_range(self.cfg.entry_node(), end_block=None, merge_blocks=[])]
+        seq = None
+        while stack:
+            try:
+                request = stack[-1].send(seq)
+            except StopIteration as finished:
+                stack.pop()
+                seq = finished.value
+                continue
+            stack.append(self._block_range(request.block, request.end_block, request.merge_blocks,
+                                           request.next_case_block))
+            seq = None
+        return seq
+
+    def _place(self, block: int) -> BlockNode:
+        self.placed_blocks.add(block)
+        return BlockNode(block)
+
+    def _block_range(self,
+                     block: int | None,
+                     end_block: int | None,
+                     merge_blocks: list[MergeBlockData],  # treated like a stack DS
+                     next_case_block: int = None) -> Structuring:
+        """
+        The structure of all blocks in range [block, end_block)
+        In practice, if `block` is a header, end_block will normally be the corresponding merge block.
+        """
+
+        if not block or block == end_block or block in self.placed_blocks:
+            return []
+
+        self._handle_merge_blocks(block, merge_blocks)
+
+        seq = []
+
+        # ... visit 'block'
+        if not (self.cfg.is_loop_header(block)):  # Loops place their header themselves
+            seq.append(self._place(block))
+
+        # ... add the rest
+        if self.cfg.is_exit_block(block):
+
+            seq.append(JumpNode(JumpNode.EXIT))
+
+        elif self.cfg.is_basic_block(block):
+
+            if self.cfg.is_break_block(block):
+                seq.append(JumpNode(JumpNode.BREAK))
+            elif self.cfg.is_continue_block(block):
+                seq.append(JumpNode(JumpNode.CONTINUE))
+            else:
+                seq.append((yield BlockRange(self._dst_block(block), end_block, merge_blocks, next_case_block)))
+
+        else:  # is_selection_header
+
+            if self.cfg.is_loop_header(block):
+                construct = self._loop
+            elif self.cfg.is_switch_block(block):
+                construct = self._switch
+            else:
+                construct = self._selection
+
+            merge_block = self.cfg.merge_block(block)
+
+            # Add the structure in two sections
+
+            seq.append((yield from construct(block, merge_blocks, next_case_block)))
+
+            if merge_block != next_case_block:  # if true, then the merge block is placed later
+                seq.append((yield BlockRange(merge_block, end_block, merge_blocks, next_case_block)))
+
+        return seq
+
+    def _handle_merge_blocks(self, block, merge_blocks) -> None:
+        while merge_blocks and block == merge_blocks[-1].merge_block:  # loop for if multiple headers have same merge
+            merge_blocks.pop()
+        if self.cfg.is_header_block(block):
+            merge_blocks.append(MergeBlockData(merge_block=self.cfg.merge_block(block), related_header=block))
+
+    def _dst_block(self, block) -> int | None:
+        if self.cfg.out_degree(block) != 0:
+            return self.cfg.out_edges_destinations(block)[0]
+        else:
+            return None
+
+    # LOOP
+
+    def _loop(self, block: int, merge_blocks: list[MergeBlockData], next_case_block: int = None) -> Structuring:
+
+        if not self.cfg.is_loop_header(block):
+            raise RuntimeError("shouldn't be here")
+        elif self.cfg.out_degree(block) != 2:
+            raise RuntimeError("Loop headers must have out degree == 2")
+        elif not self.cfg.contains_merge_instruction(block):
+            raise RuntimeError('Invalid loop construct (missing a labeled merge block)')
+
+        merge_block = self.cfg.merge_block(block)
+        true_branch_block = self.cfg.out_edges_destinations(block)[1]
+
+        self._place(block)
+        body = yield BlockRange(true_branch_block, merge_block, merge_blocks, next_case_block)
+        return LoopNode(block, body)
+
+    # SELECTION
+
+    def _selection(self, block: int, merge_blocks: list[MergeBlockData], next_case_block: int = None) -> Structuring:
+
+        false_branch_block, true_branch_block = self.cfg.out_edges_destinations(block)[:2]
+        merge_block = self.cfg.merge_block(block)
+
+        # NB: the false branch is built first, so blocks it shares w/ the true branch are placed in it
+        false_body = None
+        if false_branch_block != merge_block:
+            false_body = yield BlockRange(false_branch_block, merge_block, merge_blocks, next_case_block)
+        true_body = yield BlockRange(true_branch_block, merge_block, merge_blocks, next_case_block)
+        return SelectionNode(block, true_body, false_body)
+
+    # SWITCH
+
+    def _switch(self, block: int, merge_blocks: list[MergeBlockData], next_case_block: int = None) -> Structuring:
+
+        destinations = self.cfg.out_edges_destinations(block)
+        default, cases = destinations[-1], destinations[:-1]  # default = last dst, cases = the rest
+
+        case_nodes = []
+        for ix, current_case in enumerate(cases):
+            next_case = default if ix + 1 == len(cases) else cases[ix + 1]
+
+            is_fallthrough = self._there_is_path_not_using_loop(merge_blocks, current_case, next_case)
+            end_block = next_case if is_fallthrough else self.cfg.merge_block(block)
+
+            body = yield BlockRange(current_case, end_block, merge_blocks,
+                                    next_case if self.nests_switch_cases else next_case_block)
+            case_nodes.append(CaseNode(current_case, body, is_fallthrough,
+                                       self._needs_switch_break(current_case, is_fallthrough)))
+
+        default_body = yield BlockRange(default, self._end_block_for_default(default, merge_blocks, block),
+                                        merge_blocks, next_case_block)
+        return SwitchNode(block, case_nodes, default_body)
+
+    def _needs_switch_break(self, target: int, is_fallthrough: bool) -> bool:
+        c1 = is_fallthrough  # leaves scope of current case block and fall into scope of next => no switch_break
+        c2 = self.cfg.is_exit_block(target)  # "return" added later => no switch_break
+        c3 = self.cfg.is_continue_block(target) or self.cfg.is_break_block(target)  # relevant. added later => no S.B.
+        return not (c1 or c2 or c3)
+
+    def _end_block_for_default(self, default, merge_blocks, block) -> int:
+        """Calculates the appropriate end block for the default case in a switch construct."""
+
+        # If true, it means it's not a *proper* merge (blocks from other cases can't reach it, e.g. tree-like CFGs)
+        if default == merge_blocks[-1].merge_block:
+            nearest_loop_header = next((b.related_header for b in merge_blocks[-2::-1]
+                                        if self.cfg.is_loop_header(b.related_header)), None)
+            return nearest_loop_header
+        else:
+            return self.cfg.merge_block(block)
+
+    def _there_is_path_not_using_loop(self, merge_blocks, current_case_block, next_case_block):
+        """
+        Checks if there is a path between `current_case_block` and `next_case_block` in the control flow graph
+        that does not pass through a loop header. Needed for checking switch fallthrough.
+        """
+
+        is_loop_header_present = any(self.cfg.is_loop_header(bk.related_header) for bk in merge_blocks)
+
+        if not is_loop_header_present or len(merge_blocks) <= 1:
+            return self.cfg.is_reachable(current_case_block, next_case_block)
+
+        closest_loop_header_enclosing_switch = None
+
+        for bk in merge_blocks[-2::-1]:  # Iterate from merge_blocks[-2] to mb[0] (mb[-1].header is always switch)
+            if self.cfg.is_loop_header(bk.related_header):
+                closest_loop_header_enclosing_switch = bk.related_header
+                break
+
+        return self.cfg.is_reachable(current_case_block, next_case_block, avoiding=closest_loop_header_enclosing_switch)
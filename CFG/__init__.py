@@ -2,7 +2,18 @@ __version__ = "1.0.0"
 __author__ = "Max Mitchell"
 
 from .CFG import *
+from .CFGCorpus import CFGCorpus, CFGCorpusWriter
 from .CFGGenerator import CFGGenerator
+from .FingerprintIndex import FingerprintIndex
+from .CoverageSelector import CoverageSelector, CoverageReport, CoverageGoal
+from .FrozenCFG import FrozenCFG
+from .CFGAnalysis import CFGAnalysis
+from .CFGValidator import CFGValidator, CFGViolation
+from .StructuredCFG import StructuredCFG
+from .RandomStream import RandomStream
+from .PathEvaluator import PathEvaluator, PathStatus, ExpectedPaths
+from .DirectionStore import DirectionStore
+from .PathSampler import PathSampler
 from .example_CFGs import (
     cfg_0,
     cfg_if_1,
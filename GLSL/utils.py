@@ -3,9 +3,11 @@ import tempfile
 from programs.GLSLProgram import GLSLProgram
 
 
-def run_glsl(program: GLSLProgram, input_directions: list[int], config) -> (bool, str):
+def run_glsl(program: GLSLProgram, input_directions: list[int], config,
+             expected_path: list[int] = None) -> (bool, str):
 
-    expected_path: list[int] = program.cfg.expected_output_path(input_directions)
+    if expected_path is None:
+        expected_path = program.cfg.expected_output_path(input_directions)
     shadertrap_test: str = program.generate_shader_test(input_directions, expected_path)
 
     with tempfile.NamedTemporaryFile(delete=False, suffix='.shadertrap') as temp_file:
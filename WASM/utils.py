@@ -53,10 +53,11 @@ def optimise_wasm(unoptimised_wasm: str, opt_option: str, output_filepath: str =
         os.remove(unoptimised_wasm_filepath)
 
 
-def run_wasm(program, input_directions, output_filepath: str = None):
+def run_wasm(program, input_directions, output_filepath: str = None, expected_output: list[int] = None):
 
     code_filepath = program.get_file_path()
-    expected_output = program.cfg.expected_output_path(input_directions)
+    if expected_output is None:
+        expected_output = program.cfg.expected_output_path(input_directions)
 
     with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as temp_file:
         temp_file.write(str(input_directions))
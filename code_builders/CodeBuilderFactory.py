@@ -11,6 +11,7 @@ from .LocalArrayCodeBuilder import LocalArrayCodeBuilder
 class CodeBuilderFactory:
     @staticmethod
     def create_builder(language: Language, cfg: CFG, code_type: CodeType, directions: Optional[list[int]] = None):
+        cfg = cfg.freeze()  # builders only query the CFG, so use the array-backed snapshot
         if code_type == CodeType.GLOBAL_ARRAY:
             return GlobalArrayCodeBuilder(language, cfg, directions)
         elif code_type == CodeType.HEADER_GUARD:
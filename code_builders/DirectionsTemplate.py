@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Optional, TextIO
+
+from languages import Language
+
+
+class DirectionsTemplate:
+    """
+    A LOCAL_ARRAY program, built and formatted once, split where its input_data declaration goes. The code for any
+    directions is then the two halves w/ just that declaration (an array literal) between them, byte for byte what
+    building it from scratch gives, so a CFG's code is generated once however many directions it's tested with.
+    """
+
+    def __init__(self, language: Language, before: str, after: str):
+        self.language = language
+        self.before = before
+        self.after = after
+        self._before_bytes = before.encode('utf-8')
+        self._after_bytes = after.encode('utf-8')
+
+    def __reduce__(self):
+        return self.__class__, (self.language, self.before, self.after)  # NB: not the encoded copies
+
+    def declaration(self, directions: list[int]) -> str:
+        return self.language.array_statement(values=directions, arr_name=self.language.input_data_array_name)
+
+    def pieces(self, directions: list[int]) -> list[bytes]:
+        return [self._before_bytes, self.declaration(directions).encode('utf-8'), self._after_bytes]
+
+    def code(self, directions: list[int]) -> str:
+        return f'{self.before}{self.declaration(directions)}{self.after}'
+
+    def hexdigest(self, directions: list[int]) -> str:
+        digest = hashlib.sha256()
+        for piece in self.pieces(directions):
+            digest.update(piece)
+        return digest.hexdigest()
+
+    def write_code(self, out: Optional[TextIO], directions: list[int]) -> str:
+        """Write the code for the directions to `out` (or nowhere, if None). Return its hash"""
+        if out is not None:
+            out.write(self.code(directions))
+        return self.hexdigest(directions)
+
+    def save(self, path: str, directions: list[int]) -> str:
+        """Save the code for the directions to path, in one writev (so w/o joining it first). Return its hash"""
+        pieces = self.pieces(directions)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            written = os.writev(fd, pieces) if hasattr(os, 'writev') else 0  # NB: not on Windows
+            if written < sum(map(len, pieces)):  # NB: a partial write, so write the rest
+                remaining = memoryview(b''.join(pieces))[written:]
+                while remaining:
+                    remaining = remaining[os.write(fd, remaining):]
+        finally:
+            os.close(fd)
+        return self.hexdigest(directions)
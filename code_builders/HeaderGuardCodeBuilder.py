@@ -3,7 +3,7 @@ from CFG import CFG
 from my_common import MergeBlockData
 from my_common.CodeType import CodeType
 from code_builders import CodeBuilder
-from languages import Language, WASMLang
+from languages import Language
 
 
 class _FleshingInfo:
@@ -49,106 +49,54 @@ class HeaderGuardCodeBuilder(CodeBuilder):
         super().__init__(language, cfg)
         self.directions = directions
 
+        self._enclosing_loops_inclusive, self._enclosing_loops_exclusive = self._calc_enclosing_loops()
+
         # All the info about the path of execution needed to flesh the skeleton program.
         self.fleshing_info = self._calc_fleshing_info()
 
+    @property
+    def code_type(self):
+        return CodeType.HEADER_GUARD
+
     # ------------------------------------------------------------------------------------------------------------------
 
     @property
     def enclosing_loops_inclusive(self) -> dict:
-        """Construct dict. For each header, calc list of loop headers that enclose it, from outer to innermost.
+        """Dict. For each header (and break block), list of loop headers that enclose it, from outer to innermost.
         Inclusive - for, e.g., enclosing_loops[block n] include block n if it's a loop header"""
-
-        loops_dict = {}
-        merge_blocks: list[MergeBlockData] = []
-        visited_blocks = set()
-
-        self._enclosing_loops_aux(self.cfg.entry_node(), None, loops_dict, merge_blocks, visited_blocks)
-
-        return loops_dict
+        return self._enclosing_loops_inclusive
 
     @property
     def enclosing_loops_exclusive(self) -> dict:
         """Filter out any MergeBlockData elements where key == MergeBlockData.related_header"""
-        return {key: [elem for elem in value if elem.related_header != key]
-                for key, value in self.enclosing_loops_inclusive.items()}
-
-    # helpers for enclosing_loops ...
-
-    def _enclosing_loops_aux(self, block, end_block, loops_dict, merge_blocks, visited_blocks):
-        """Helper function to recursively traverse blocks and calculate enclosing loops."""
-
-        if not block or block == end_block or block in visited_blocks:
-            return
-        visited_blocks.add(block)
-
-        if self.cfg.is_exit_block(block):
-            return
-
-        # add merge info for current block (if header) to dict.
-        self.handle_merge_blocks(block, merge_blocks)
-        if self.cfg.is_header_block(block) or self.cfg.is_break_block(
-                block):  # useful to know the outer loop of break blocks
-            loops_dict[block] = [m for m in merge_blocks if self.cfg.is_loop_header(m.related_header)]
+        return self._enclosing_loops_exclusive
 
-        # call enclosing_loops_aux for block's descendants
+    def _calc_enclosing_loops(self) -> tuple[dict, dict]:
+        """Both enclosing_loops dicts, read off the CFG's (cached) loop-nesting analysis"""
 
-        if self.cfg.is_basic_block(block):
-            self._process_basic_block(block, end_block, merge_blocks, loops_dict, visited_blocks)
-        elif self.cfg.is_loop_header(block):
-            self._process_loop_header(block, merge_blocks, loops_dict, visited_blocks)
-        elif self.cfg.is_switch_block(block):
-            self._process_switch_block(block, merge_blocks, loops_dict, visited_blocks)
-        else:
-            self._process_selection_header(block, merge_blocks, loops_dict, visited_blocks)
+        analysis = self.cfg.analysis()
+        entry = self.cfg.entry_node()
 
-        if self.cfg.contains_merge_instruction(block):
-            merge_block = self.cfg.merge_block(block)
-            self._enclosing_loops_aux(merge_block, end_block, loops_dict, merge_blocks, visited_blocks)
-
-    def _process_basic_block(self, block, end_block, merge_blocks, loops_dict, visited_blocks):
-        self._enclosing_loops_aux(self._calc_dst_block(block), end_block, loops_dict, merge_blocks, visited_blocks)
-
-    def _process_loop_header(self, block, merge_blocks, loops_dict, visited_blocks):
-        true_branch_block = self.cfg.out_edges_destinations(block)[1]
-        self._enclosing_loops_aux(true_branch_block, block, loops_dict, merge_blocks, visited_blocks)
-
-    def _process_switch_block(self, block, merge_blocks, loops_dict, visited_blocks):
-        destinations = [d for d in self.cfg.out_edges_destinations(block)]
-        default, cases = destinations[-1], destinations[:-1]  # default = last dst, cases = the rest
-
-        for ix in range(len(cases)):
-            current_case = cases[ix]
-            next_case = default if ix + 1 == len(cases) else cases[ix + 1]
-            is_fallthrough = self.there_is_path_not_using_loop(block, merge_blocks, current_case, next_case)
-            if not self.language.allows_switch_fallthrough:
-                assert not is_fallthrough
-
-            end_block = self._calc_end_block_for_case(is_fallthrough, block, next_case)
-            self._enclosing_loops_aux(current_case, end_block, loops_dict, merge_blocks, visited_blocks)
-
-        end_block = self.calc_end_block_for_default(default, merge_blocks, block)
-        self._enclosing_loops_aux(default, end_block, loops_dict, merge_blocks, visited_blocks)
+        inclusive, exclusive = {}, {}
+        for block in self.cfg.nodes():
+            # useful to know the outer loop of break blocks
+            if not (self.cfg.is_header_block(block) or self.cfg.is_break_block(block)):
+                continue
+            if not analysis.dominates(entry, block):  # i.e. unreachable
+                continue
+            loops = [MergeBlockData(merge_block=self.cfg.merge_block(header), related_header=header)
+                     for header in analysis.enclosing_loops_inclusive(block)]
+            inclusive[block] = loops
+            exclusive[block] = [elem for elem in loops if elem.related_header != block]
 
-    def _process_selection_header(self, block, merge_blocks, loops_dict, visited_blocks):
-        end_block = self.cfg.merge_block(block)
-        dst = self.cfg.out_edges_destinations(block)
-        self._enclosing_loops_aux(dst[0], end_block, loops_dict, merge_blocks, visited_blocks)
-        self._enclosing_loops_aux(dst[1], end_block, loops_dict, merge_blocks, visited_blocks)
+        return inclusive, exclusive
 
     # ------------------------------------------------------------------------------------------------------------------
 
     # fleshing functions and helpers
 
     def _blocks_enclosed_in(self, block):
-        affected = []
-        for block_key in self.enclosing_loops_inclusive:
-            if block_key == block:
-                continue
-            if block in [elem.related_header for elem in self.enclosing_loops_inclusive[block_key]]:
-                affected.append(block_key)
-
-        return affected
+        return [b for b in self.cfg.analysis().blocks_in_loop(block) if b in self.enclosing_loops_inclusive]
 
     def _calc_fleshing_info(self):
 
@@ -210,44 +158,6 @@ class HeaderGuardCodeBuilder(CodeBuilder):
 
         return arr_dict
 
-    def _loop_code_return_str(self, block: int, true_branch_block, merge_block, merge_blocks, next_case_block,
-                              switch_label_num) -> str:
-        pre_format_str = self.language.loop_str_pre_format(CodeType.HEADER_GUARD, block)
-        return pre_format_str.format(
-            loop_header=self.add_block(block),
-            loop_body=self.code_in_block_range(
-                block=true_branch_block,
-                end_block=merge_block,
-                merge_blocks=merge_blocks,
-                next_case_block=next_case_block,
-                switch_label_num=switch_label_num)
-        )
-
-    def _selection_str(self, true_branch_block, merge_block, block, merge_blocks, next_case_block, switch_label_num):
-        pre_format_str = self.langauge.selection_str_pre_format(CodeType.HEADER_GUARD, block)
-
-        return pre_format_str.format(
-            possible_else=self._calc_else_block_code(
-                block=block,
-                merge_blocks=merge_blocks,
-                next_case_block=next_case_block,
-                switch_label_num=switch_label_num),
-            true_block_code=self.code_in_block_range(
-                block=true_branch_block,
-                end_block=merge_block,
-                merge_blocks=merge_blocks,
-                next_case_block=next_case_block,
-                switch_label_num=switch_label_num)
-        )
-
-    def switch_full_code_aux(self, case_code: str, default_code: str, block: int):
-
-        if isinstance(self.language, WASMLang):
-            raise NotImplementedError("WASM static code for switches not written yet")
-
-        return self.language.switch_full_str(code_type=CodeType.HEADER_GUARD, case_code=case_code,
-                                             default_code=default_code, block=block)
-
     def _convert_to_arr_declarations(self, cntrl_arrays: dict):
         code: str = ''
         for key in cntrl_arrays:
@@ -1,5 +1,6 @@
 from CFG import CFG
 from code_builders.ArrayCodeBuilder import ArrayCodeBuilder
+from code_builders.DirectionsTemplate import DirectionsTemplate
 from languages import Language
 from my_common import CodeType
 
@@ -12,3 +13,13 @@ class LocalArrayCodeBuilder(ArrayCodeBuilder):
     @property
     def code_type(self):
         return CodeType.LOCAL_ARRAY
+
+    def build_template(self) -> DirectionsTemplate:
+        """Build the program once, to then splice in any directions (c.f. DirectionsTemplate)"""
+        # NB: the declaration's a line of its own, w/o brackets, so doesn't change how the lines around it format
+        code = LocalArrayCodeBuilder(self.language, self.cfg, directions=[]).build_code()
+        declaration = self.language.array_statement(values=[], arr_name=self.language.input_data_array_name)
+        if code.count(declaration) != 1:
+            raise RuntimeError(f"Expected the program to declare '{declaration}' exactly once")
+        start = code.index(declaration)
+        return DirectionsTemplate(self.language, code[:start], code[start + len(declaration):])
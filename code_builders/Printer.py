@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from typing import Generator
+
+from CFG.StructuredCFG import BlockNode, JumpNode, LoopNode, SelectionNode, Seq, StructuredCFG, SwitchNode
+from my_common.CodeType import CodeType
+from languages import Language, Template, WASMLang
+
+Fragments = list  # NB: of str and (nested) Fragments, joined once the whole program's built (c.f. CodeBuilder.join)
+
+Printing = Generator[tuple, Fragments, Fragments]  # NB: yields (Seq, switch label no.), is sent its code, returns own
+
+# NB: WASM's switch is a chain of nested blocks: the innermost branches to the case's block, and the default wraps them
+_WASM_BR_TABLE = Template("""
+                                (block (local.get {cntrl_val})
+                                    (br_table
+                                        {br_table}
+                                    )
+                                    ;; guard from UB
+                                    (call $store_in_output (local.get $output_index)(i32.const -1))
+                                    (local.set $output_index (call $inc (local.get $output_index)))
+                                    (br {switch_block_label})
+                                )""", params=('cntrl_val', 'br_table', 'switch_block_label'))
+
+_WASM_SWITCH_DEFAULT = Template("""
+                                {cntrl}
+                                (block {switch_block_label}
+                                    {code}
+                                    ;; Target for (br {ix}) => default
+                                    {target_code}
+                                )
+                        """, params=('cntrl', 'ix', 'code', 'target_code', 'switch_block_label'))
+
+
+class Printer:
+    """
+    Prints a StructuredCFG in a language, for a code type, by filling the language's templates (c.f.
+    Language.templates). Walks the tree w/o recursion: each Seq's code is built by a generator that yields a
+    (Seq, switch label no.) request wherever it needs a nested Seq's code, and `print` runs them off an explicit stack.
+
+    Structured control flow maps onto if/else, loops and switches (w/ fallthrough) as is, so this prints any such
+    language. One that doesn't needs its own subclass, c.f. WASMPrinter and `for_language`.
+    """
+
+    nests_switch_cases = False  # NB: c.f. StructuredCFG
+
+    def __init__(self, language: Language, code_type: CodeType):
+        self.language = language
+        self.code_type = code_type
+        self.templates = language.templates(code_type)
+
+    @staticmethod
+    def for_language(language: Language, code_type: CodeType) -> Printer:
+        printer_class = WASMPrinter if isinstance(language, WASMLang) else Printer
+        return printer_class(language, code_type)
+
+    def structure_of(self, cfg) -> StructuredCFG:
+        """The (cached) structure of the cfg this printer prints"""
+        return cfg.structure(self.nests_switch_cases)
+
+    def print(self, structure: StructuredCFG) -> Fragments:
+        stack = [self._seq_code(structure.body, 0)]
+        code = None
+        while stack:
+            try:
+                request = stack[-1].send(code)
+            except StopIteration as finished:
+                stack.pop()
+                code = finished.value
+                continue
+            stack.append(self._seq_code(*request))
+            code = None
+        return code
+
+    def _seq_code(self, seq: Seq, switch_label_num: int) -> Printing:
+        code = []
+        for item in seq:
+            if isinstance(item, list):
+                code.append((yield item, switch_label_num))
+            elif isinstance(item, BlockNode):
+                code.append(self.templates.block.fill(item.block))
+            elif isinstance(item, JumpNode):
+                code.append(self.jump_code(item))
+            elif isinstance(item, LoopNode):
+                code.append((yield from self.loop_code(item, switch_label_num)))
+            elif isinstance(item, SelectionNode):
+                code.append((yield from self.selection_code(item, switch_label_num)))
+            elif isinstance(item, SwitchNode):
+                code.append((yield from self.switch_code(item, switch_label_num)))
+            else:
+                raise TypeError(f"Can't print {type(item).__name__}")
+        return code
+
+    # CONSTRUCTS
+
+    def jump_code(self, node: JumpNode) -> str:
+        if node.kind == JumpNode.EXIT:
+            return self.language.exit_code
+        return self.language.break_code if node.kind == JumpNode.BREAK else self.language.continue_code
+
+    def loop_code(self, node: LoopNode, switch_label_num: int) -> Printing:
+        loop_header = self.templates.block.fill(node.header)
+        loop_body = yield node.body, switch_label_num
+        return self.templates.loop(node.header).fill(loop_header, loop_body)
+
+    def selection_code(self, node: SelectionNode, switch_label_num: int) -> Printing:
+        possible_else = []
+        if node.false_body is not None:
+            possible_else = self.templates.else_.fill((yield node.false_body, switch_label_num))
+        true_block_code = yield node.true_body, switch_label_num
+        return self.templates.selection(node.header).fill(true_block_code, possible_else)
+
+    def switch_code(self, node: SwitchNode, switch_label_num: int) -> Printing:
+        case_code = []
+        for ix, case in enumerate(node.cases):
+            self._check_fallthrough(case)
+            code = yield case.body, switch_label_num
+            case_code.append(self.templates.switch_case.fill(ix, None, code,
+                                                             self.switch_break_str(case, switch_label_num)))
+        default_code = self.templates.switch_default.fill((yield node.default, switch_label_num))
+        return self.templates.switch_full(node.header).fill(case_code, default_code)
+
+    # helpers...
+
+    def _check_fallthrough(self, case) -> None:
+        if not self.language.allows_switch_fallthrough:
+            assert not case.is_fallthrough
+
+    def switch_break_str(self, case, switch_label_num: int) -> str:
+        return self.language.switch_label(switch_label_num) if case.needs_break else ""
+
+
+class WASMPrinter(Printer):
+    """
+    WASM has no switch, so one's a chain of nested blocks that a br_table branches out of: the n-th case's code
+    follows the end of the n-th block, so each case's code ends where the next's starts, and each switch is labelled
+    (by how many it's nested in) so its cases can break out of it.
+    """
+
+    nests_switch_cases = True
+
+    def switch_code(self, node: SwitchNode, switch_label_num: int) -> Printing:
+        next_label_num = switch_label_num + 1
+
+        # inner block
+        code = _WASM_BR_TABLE.fill(WASMLang.cntrl_val_var_name(),
+                                   WASMLang.build_br_table([case.target for case in node.cases]),
+                                   WASMLang.switch_label(switch_label_num))
+
+        for ix, case in enumerate(node.cases):
+            self._check_fallthrough(case)
+            case_code = yield case.body, next_label_num
+            code = self.templates.switch_case.fill(ix, code, case_code, self.switch_break_str(case, switch_label_num))
+
+        target_code = yield node.default, next_label_num
+        return _WASM_SWITCH_DEFAULT.fill(self.language.set_and_increment_control(), len(node.cases), code,
+                                         target_code, WASMLang.switch_label(switch_label_num))
+
+    def switch_break_str(self, case, switch_label_num: int) -> str:
+        return WASMLang.switch_break_label(switch_label_num) if case.needs_break else ""
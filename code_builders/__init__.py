@@ -3,3 +3,5 @@ from .CodeBuilderFactory import CodeBuilderFactory
 from .GlobalArrayCodeBuilder import GlobalArrayCodeBuilder
 from .HeaderGuardCodeBuilder import HeaderGuardCodeBuilder
 from .LocalArrayCodeBuilder import LocalArrayCodeBuilder
+from .DirectionsTemplate import DirectionsTemplate
+from .Printer import Printer, WASMPrinter
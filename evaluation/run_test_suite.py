@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import argparse
 import os
 import pickle
@@ -9,8 +11,10 @@ from enum import Enum
 from tqdm import tqdm
 
 import WGSL.utils
+from CFG import DirectionStore
 from evaluation.mutation_testing.utils import get_non_visitable_mutant_ids, get_visitable_mutant_ids
 from my_common import CodeType
+from runner.scheduler import Resources, Scheduler
 
 
 class TestResult(Enum):
@@ -24,6 +28,8 @@ class TestResult(Enum):
 
 program_directions = list[list[int]]  # all directions to test for, say, a global_array program
 
+DAWN_NEEDS = Resources(gpu=1, cpu=1)  # NB: what each Dawn run holds, c.f. my_test.execution_requirements
+
 evaluation_root = '/Users/maxmitchell/Documents/msc-control-flow-fleshing-project/evaluation'
 
 
@@ -47,14 +53,26 @@ def _get_program_filepaths(code_type: CodeType, is_reduced: bool):
 
 
 def _get_directions(directions_files: list[str]):
-    directions: list[program_directions] = []
+    directions: list[program_directions | DirectionStore] = []
     for file in directions_files:
+        if file.endswith(f'.{DirectionStore.EXTENSION}'):
+            directions.append(DirectionStore(file))  # NB: memory-mapped, not loaded
+            continue
         with open(file, 'rb') as f:
             file_contents: program_directions = pickle.load(f)
             directions.append(file_contents)
     return directions
 
 
+def _expected_path_getter(cfg, directions: program_directions | DirectionStore):
+    """Return a fn from direction index to expected path, using the paths stored w/ the directions if there are any"""
+    if isinstance(directions, DirectionStore):
+        if directions.has_expected_paths():
+            return directions.expected_path
+        return cfg.expected_output_paths(*directions.padded()).__getitem__
+    return cfg.expected_output_paths(directions).__getitem__
+
+
 def _fetch_correct_input_directions(code_filepath: str) -> list[int]:
     """return correct input directions for CodeType.LOCAL_ARRAY code"""
 
@@ -77,16 +95,22 @@ def _fetch_correct_input_directions(code_filepath: str) -> list[int]:
     return directions
 
 
-def _passes_tst_suite_x_array_code(env, code_type: CodeType, is_reduced: bool) -> TestResult:
+def _passes_tst_suite_x_array_code(env, code_type: CodeType, is_reduced: bool, scheduler: Scheduler) -> TestResult:
 
     program_files: list[str] = _get_program_filepaths(code_type, is_reduced)
     directions_files: list[str] = _get_directions_filepaths(code_type, is_reduced)
     code_directory = os.path.join(_get_test_suite_path(is_reduced=is_reduced), f'{code_type.value}/code')
 
-    directions: list[program_directions] = _get_directions(directions_files)
+    directions: list[program_directions | DirectionStore] = _get_directions(directions_files)
+    env = dict(env)  # NB: a snapshot, as tests can still be starting when the caller changes env for the next mutant
 
-    # for each program...
-    for program_ix, program_path in enumerate(tqdm(program_files, desc="Testing programs...")):
+    def submit(code_filepath_, expected_path_, input_directions_):
+        return scheduler.submit(WGSL.utils.tst_shader, code_filepath_, expected_path_, env, input_directions_,
+                                executor='dawn', needs=DAWN_NEEDS)
+
+    # NB: every test is queued up front, so Dawn's never idle while Python loads the next program
+    tests = []
+    for program_ix, program_path in enumerate(tqdm(program_files, desc="Queueing programs...")):
 
         with open(program_path, "rb") as code_file:
                 program = pickle.load(code_file)
@@ -96,37 +120,44 @@ def _passes_tst_suite_x_array_code(env, code_type: CodeType, is_reduced: bool) -
 
         if code_type is CodeType.GLOBAL_ARRAY:
 
-            for direction_ix, input_directions in enumerate(
-                    tqdm(directions[program_ix], desc="Testing directions for each program...", leave=False, position=1)
-            ):
-                expected_path = program.cfg.expected_output_path(input_directions)
-                is_match, msg = WGSL.utils.tst_shader(code_filepath, expected_path, env, input_directions)
+            expected_path_of = _expected_path_getter(program.cfg, directions[program_ix])
 
-                if not is_match:
-                    return TestResult.FAIL_PATH_MISMATCH
+            for direction_ix, input_directions in enumerate(directions[program_ix]):
+                tests.append(submit(code_filepath, expected_path_of(direction_ix), input_directions))
 
         elif code_type is CodeType.LOCAL_ARRAY:
             input_directions = _fetch_correct_input_directions(code_filepath)
             expected_path = program.cfg.expected_output_path(input_directions)
-            is_match, msg = WGSL.utils.tst_shader(code_filepath, expected_path, env, input_directions)
+            tests.append(submit(code_filepath, expected_path, input_directions))
 
+    try:
+        for test in tqdm(tests, desc="Testing programs..."):
+            is_match, msg = test.result()  # NB: re-raises if the test crashed
             if not is_match:
                 return TestResult.FAIL_PATH_MISMATCH
+    finally:
+        for test in tests:
+            test.cancel()  # NB: no-op for those that have run; once one fails, the rest needn't
 
     return TestResult.PASS
 
 
-def passes_tst_suite(env, is_reduced: bool, mutant_ids: list[int] = None) -> TestResult:
+def passes_tst_suite(env, is_reduced: bool, mutant_ids: list[int] = None, scheduler: Scheduler = None) -> TestResult:
+    """scheduler: runs the tests. If None, one's made that runs a test on the GPU at a time"""
     if mutant_ids:
         ids_as_string = ','.join(map(str, mutant_ids))
         env['DREDD_ENABLED_MUTATION'] = ids_as_string
 
+    scheduler_ = scheduler if scheduler is not None else Scheduler(gpu_slots=1)
     try:
-        is_pass = _passes_tst_suite_x_array_code(env, CodeType.LOCAL_ARRAY, is_reduced) \
-            and _passes_tst_suite_x_array_code(env, CodeType.GLOBAL_ARRAY, is_reduced)
+        is_pass = _passes_tst_suite_x_array_code(env, CodeType.LOCAL_ARRAY, is_reduced, scheduler_) \
+            and _passes_tst_suite_x_array_code(env, CodeType.GLOBAL_ARRAY, is_reduced, scheduler_)
         return is_pass
     except Exception:
         return TestResult.FAIL_COMPILER_CRASH
+    finally:
+        if scheduler is None:
+            scheduler_.shutdown()
 
 
 def passes_tst_suite_no_mutants(env, is_reduced: bool) -> TestResult:
@@ -141,13 +172,14 @@ def passes_tst_suite_all_non_visitable_mutants(env, is_reduced: bool) -> TestRes
 def main():
 
     def random_index(lst):
-        return random.randint(0, len(lst) - 1)
+        return rng.randint(0, len(lst) - 1)
 
     parser = argparse.ArgumentParser(description='For mutant tracking file creation [OPTIONAL].')
     parser.add_argument('--create-mutant-tracking-file', action='store_true', default=False, help='Create a mutant tracking file.')
     parser.add_argument('--reduced-test-suite', action='store_true', default=False, help='Run of the reduced test suite.')
     parser.add_argument('--seed', type=int, default=None, help='Seed for random number generator.')
     parser.add_argument('--time-limit', type=int, default=None, help='Time limit in seconds')
+    parser.add_argument('--gpu-slots', type=int, default=1, help='How many Dawn runs can use the GPU at once.')
 
     args = parser.parse_args()
 
@@ -170,8 +202,7 @@ def main():
         assert 'DREDD_MUTANT_TRACKING_FILE' in os.environ, \
             "'DREDD_MUTANT_TRACKING_FILE' must be set when --create-mutant-tracking-file is used."
 
-    if args.seed is not None:
-        random.seed(args.seed)
+    rng = random.Random(args.seed)  # NB: its own stream, rather than reseeding the global one
 
     # --------
 
@@ -184,6 +215,8 @@ def main():
 
     visitable_mutant_ids = get_visitable_mutant_ids()
 
+    scheduler = Scheduler(gpu_slots=args.gpu_slots)
+
     killed_mutants_compiler_crash = []
     killed_mutants_path_mismatch = []
     killed_mutants_unknown_cause = []
@@ -193,7 +226,7 @@ def main():
         mutant_id = visitable_mutant_ids.pop(random_index(visitable_mutant_ids))
 
         print(f"Testing mutant {mutant_id}...")
-        result: TestResult = passes_tst_suite(env, args.reduced_test_suite, [mutant_id])
+        result: TestResult = passes_tst_suite(env, args.reduced_test_suite, [mutant_id], scheduler)
         if result is TestResult.PASS:
             print(f"\nMutant {mutant_id} survived")
             survived_mutants.append(mutant_id)
@@ -206,6 +239,7 @@ def main():
             else:
                 killed_mutants_unknown_cause.append(mutant_id)
 
+    scheduler.shutdown()
     print(f"Time taken: {(time.time()-start_time)//60} minutes")
 
     print('survived_mutants:', survived_mutants)
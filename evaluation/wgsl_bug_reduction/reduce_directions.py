@@ -12,6 +12,9 @@ script_path = '../../testing/run_individual_test_via_program.py'
 with open('/evaluation/wgsl_bug_reduction/bug/graph_2439.pickle', 'rb') as file:
     cfg: CFG = pickle.load(file)
 
+if violations := cfg.validate():  # NB: graph may have been hand-edited, so check before paying for any runs
+    raise RuntimeError('Invalid CFG: ' + '; '.join(map(str, violations)))
+
 def assemble_command(directions: tuple[int]) -> list[str]:
     directions_str = ','.join(map(str, directions))
     command = ['python', script_path, program_class_filepath, directions_str]
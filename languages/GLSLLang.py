@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+from typing import Optional, TextIO
+
 from my_common.CodeType import CodeType
+from my_common.CodeWriter import CodeWriter
 from languages.Language import Language
 
 
@@ -206,9 +209,8 @@ class GLSLLang(Language):
     # CODE FORMATTING
 
     @staticmethod
-    def format_code_(code: str) -> str:
-        from my_common.utils import format_code
-        return format_code(code=code,
-                           add_line_above=['layout', 'void main()'],
-                           deliminators=('{', '}'),
-                           comment_marker='//')
+    def code_writer(out: Optional[TextIO] = None) -> CodeWriter:
+        return CodeWriter(out=out,
+                          add_line_above=['layout', 'void main()'],
+                          deliminators=('{', '}'),
+                          comment_marker='//')
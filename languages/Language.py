@@ -1,10 +1,17 @@
 from __future__ import annotations
 
 import argparse
+import io
 from abc import ABC, abstractmethod
+from typing import Optional, TextIO
 
 from my_common.CodeType import CodeType
+from my_common.CodeWriter import CodeWriter
 from languages.LanguageMeta import LanguageMeta
+from languages.Template import LanguageTemplates
+
+
+_templates: dict[tuple[type, CodeType], LanguageTemplates] = {}  # NB: shared by every instance of a language
 
 
 class Language(ABC, metaclass=LanguageMeta):
@@ -30,6 +37,13 @@ class Language(ABC, metaclass=LanguageMeta):
             f"Invalid language: {language_str}. Choose from: {valid_languages}."
         )
 
+    def templates(self, code_type: CodeType) -> LanguageTemplates:
+        """This language's construct templates for the code type, compiled once (per process) and shared"""
+        key = (type(self), code_type)
+        if key not in _templates:
+            _templates[key] = LanguageTemplates(self, code_type)
+        return _templates[key]
+
     # LANGUAGE PROPERTIES
 
     @property
@@ -212,9 +226,17 @@ class Language(ABC, metaclass=LanguageMeta):
 
     @staticmethod
     @abstractmethod
-    def format_code_(code: str) -> str:
+    def code_writer(out: Optional[TextIO] = None) -> CodeWriter:
+        """A CodeWriter that formats code in this language as it streams it to `out`"""
         pass
 
+    @classmethod
+    def format_code_(cls, code: str) -> str:
+        buffer = io.StringIO()
+        with cls.code_writer(buffer) as writer:
+            writer.write(code)
+        return buffer.getvalue()
+
 
 
 
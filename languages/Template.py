@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import cached_property
+from string import Formatter
+from typing import TYPE_CHECKING, Callable
+
+from my_common.CodeType import CodeType
+
+if TYPE_CHECKING:
+    from languages.Language import Language
+
+_MAX_HEADER_TEMPLATES = 1024  # HEADER_GUARD templates kept per language and code type, most recently used first
+
+
+class Template:
+    """
+    A format string (as the Language *_pre_format methods give) parsed once, then filled positionally: the i-th value
+    goes wherever params[i] is named. `fill` doesn't copy the values into a new string, it returns the fragments (the
+    literal text between fields, and the values themselves) for a CodeBuilder to join once, at the end.
+    """
+
+    def __init__(self, source: str, params: tuple[str, ...]):
+        self.source = source
+        self.params = params
+        self._literals: list[str] = []
+        self._slots: list[int] = []  # NB: for the gap after each literal bar the last, the index of the value in it
+
+        literal = ''
+        for text, field_name, format_spec, conversion in Formatter().parse(source):
+            literal += text
+            if field_name is None:
+                continue
+            if field_name not in params:
+                raise ValueError(f"Template field '{field_name}' isn't one of its params {params}")
+            if format_spec or conversion:
+                raise ValueError(f"Template field '{field_name}' has a format spec or conversion (unsupported)")
+            self._literals.append(literal)
+            self._slots.append(params.index(field_name))
+            literal = ''
+        self._literals.append(literal)
+
+    def fill(self, *values) -> list:
+        """The template w/ the values in: a list of str and of any values that are (fragment) lists"""
+        fragments = [self._literals[0]]
+        for slot, literal in zip(self._slots, self._literals[1:]):
+            value = values[slot]
+            fragments.append(value if isinstance(value, (str, list)) else str(value))
+            fragments.append(literal)
+        return fragments
+
+    def format(self, *values: str | int) -> str:
+        return ''.join(self.fill(*values))
+
+
+class LanguageTemplates:
+    """
+    A language's construct templates for a code type. Each is compiled the first time it's needed (so a language
+    needn't implement those it never uses, e.g. WASM's switch_default) and kept. Only HEADER_GUARD templates depend
+    on the header (they name its placeholder), so array code types share one template per construct, while only the
+    _MAX_HEADER_TEMPLATES most recently used HEADER_GUARD ones are kept (else they'd grow w/ every header ever seen).
+    """
+
+    def __init__(self, language: 'Language', code_type: CodeType):
+        self.language = language
+        self.code_type = code_type
+        self._compiled: OrderedDict[tuple, Template] = OrderedDict()
+
+    def _template(self, key: tuple, source: Callable[[], str], params: tuple[str, ...]) -> Template:
+        template = self._compiled.get(key)
+        if template is None:
+            template = self._compiled[key] = Template(source(), params)
+            if len(self._compiled) > _MAX_HEADER_TEMPLATES:  # NB: so only ever when they're per header
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(key)
+        return template
+
+    def _header_key(self, block: int):
+        return block if self.code_type == CodeType.HEADER_GUARD else None
+
+    @cached_property
+    def block(self) -> Template:
+        return Template(self.language.block, ('n',))
+
+    @cached_property
+    def else_(self) -> Template:
+        return Template(self.language.else_str_pre_format(), ('false_block',))
+
+    @cached_property
+    def switch_case(self) -> Template:
+        return Template(self.language.switch_case_str_pre_format(),
+                        ('ix', 'code', 'case_code', 'possible_switch_break'))
+
+    @cached_property
+    def switch_default(self) -> Template:
+        return Template(self.language.switch_default_str_pre_format(), ('default_code',))
+
+    def selection(self, block: int) -> Template:
+        return self._template(('selection', self._header_key(block)),
+                              lambda: self.language.selection_str_pre_format(self.code_type, block),
+                              ('true_block_code', 'possible_else'))
+
+    def switch_full(self, block: int) -> Template:
+        return self._template(('switch_full', self._header_key(block)),
+                              lambda: self.language.switch_full_str_pre_format(self.code_type, block),
+                              ('cases', 'default'))
+
+    def loop(self, block: int) -> Template:
+        return self._template(('loop', self._header_key(block)),
+                              lambda: self.language.loop_str_pre_format(self.code_type, block),
+                              ('loop_header', 'loop_body'))
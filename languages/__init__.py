@@ -3,3 +3,4 @@ from .WASMLang import WASMLang
 from .WGSLLang import WGSLLang
 from .Language import Language
 from .LanguageMeta import LanguageMeta
+from .Template import LanguageTemplates, Template
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Iterable, Optional, TextIO
+
+_BATCH_SIZE = 4096  # pieces joined before they're written, by write_all
+_FLUSH_SIZE = 2048  # formatted lines (and newlines) buffered before they're passed on to `out` and hashed
+_READ_SIZE = 1 << 20  # chars read at a time when hashing a file
+
+
+class CodeWriter:
+    """
+    Formats code as it's written, line by line (giving the same result as format_code), and streams it to `out`, a
+    text file or buffer, or nowhere if None. Code can be written in pieces of any size: only the line being written
+    is held, so a program is never in memory as a whole. The output is hashed on the way (c.f. `hexdigest`).
+
+    Close it (or use it as a context manager) once done, to write the last line. `out` is left open.
+    """
+
+    def __init__(self, out: Optional[TextIO] = None, add_line_above: Iterable[str] = (),
+                 deliminators=('{', '}'), comment_marker=';;'):
+        self.out = out
+        self.add_line_above = tuple(add_line_above)
+        self.open_delim, self.closed_delim = deliminators
+        self.comment_marker = comment_marker
+        self.is_closed = False
+        self._hash = hashlib.sha256()
+        self._partial_line: list[str] = []
+        self._lines: list[str] = []  # NB: formatted, waiting to be flushed
+        self._indent = 0
+        self._is_first_line = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, code: str) -> None:
+        if self.is_closed:
+            raise ValueError("Can't write to a closed CodeWriter")
+        lines = code.split('\n')
+        if len(lines) == 1:
+            self._partial_line.append(code)
+            return
+        self._partial_line.append(lines[0])
+        lines[0] = ''.join(self._partial_line)
+        self._partial_line = [lines.pop()]
+        self._write_lines(lines)
+
+    def write_all(self, pieces: Iterable[str]) -> None:
+        """Write each piece, a batch at a time (as code builders' pieces are mostly a few chars)"""
+        batch = []
+        for piece in pieces:
+            batch.append(piece)
+            if len(batch) == _BATCH_SIZE:
+                self.write(''.join(batch))
+                batch.clear()
+        self.write(''.join(batch))
+
+    def close(self) -> None:
+        if self.is_closed:
+            return
+        self._write_lines([''.join(self._partial_line)])
+        self._partial_line = []
+        self._flush()
+        self.is_closed = True
+
+    def hexdigest(self) -> str:
+        """sha256 of what's been written (so of the whole code, once closed)"""
+        return self._hash.hexdigest()
+
+    # FORMATTING
+
+    def _bracket_count_difference(self, line: str) -> int:
+        """Return the number of open minus closed delimiters, ignoring everything after the comment marker"""
+        comment_index = line.find(self.comment_marker)
+        if comment_index != -1:
+            line = line[:comment_index]
+        return line.count(self.open_delim) - line.count(self.closed_delim)
+
+    def _write_lines(self, lines: list[str]) -> None:
+        """Indent each (complete) line, by the brackets opened and not closed in those before it"""
+        formatted_lines = self._lines
+        for line in lines:
+            stripped_line = line.lstrip()
+
+            if not stripped_line:
+                continue
+
+            just_closed_bracket: bool = stripped_line[0] == self.closed_delim
+
+            indented_line = '\t' * (self._indent - just_closed_bracket) + stripped_line
+            indented_line = indented_line.rstrip(' \t')
+
+            if stripped_line.startswith(self.add_line_above):
+                indented_line = '\n' + indented_line
+
+            if not self._is_first_line:
+                formatted_lines.append('\n')
+            self._is_first_line = False
+            formatted_lines.append(indented_line)
+
+            self._indent += self._bracket_count_difference(stripped_line)
+
+        if len(formatted_lines) >= _FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        text = ''.join(self._lines)
+        self._lines.clear()
+        self._hash.update(text.encode('utf-8'))
+        if self.out is not None:
+            self.out.write(text)
+
+
+def file_hexdigest(path: str) -> Optional[str]:
+    """sha256 of a text file's content (as a CodeWriter hashes it), read a chunk at a time. None if it doesn't exist"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "r") as file:
+            while chunk := file.read(_READ_SIZE):
+                digest.update(chunk.encode('utf-8'))
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
@@ -1,3 +1,4 @@
 from .MergeBlockData import MergeBlockData
 from .utils import *
 from .CodeType import CodeType
+from .CodeWriter import CodeWriter
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import io
 import json
 import logging
 import os
@@ -8,6 +9,8 @@ from functools import wraps
 import platform
 from typing import Optional
 
+from my_common.CodeWriter import CodeWriter
+
 
 def parse_int_list(string: str) -> list[int]:
     return [int(x) for x in string.split(',')]
@@ -60,64 +63,40 @@ def load_repo_paths_config():
 
 
 def format_code(code: str, add_line_above, deliminators=('{', '}'), comment_marker=';;', ) -> str:
-    open_delim = deliminators[0]
-    closed_delim = deliminators[1]
-
-    def bracket_count_difference(line: str):
-        """Return the number of `(` minus the number of `)`, ignoring all characters after ';;'."""
-        # Ignore characters after comment_marker
-        comment_index = line.find(comment_marker)
-        if comment_index != -1:
-            line = line[:comment_index]
-        return line.count(open_delim) - line.count(closed_delim)
-
-    lines = code.split('\n')
-    formatted_lines = []
-    current_indent = 0
-
-    for line in lines:
-        stripped_line = line.lstrip()
-
-        if not stripped_line:
-            continue
-
-        just_closed_bracket: bool = stripped_line[0] == closed_delim
-
-        if just_closed_bracket:
-            current_indent -= 1
-
-        indented_line = '\t' * current_indent + stripped_line
-        indented_line = indented_line.rstrip(' \t')
+    buffer = io.StringIO()
+    with CodeWriter(buffer, add_line_above, deliminators, comment_marker) as writer:
+        writer.write(code)
+    return buffer.getvalue()
 
-        if any(stripped_line.startswith(prefix) for prefix in add_line_above):
-            indented_line = '\n' + indented_line
 
-        formatted_lines.append(indented_line)
-
-        current_indent += bracket_count_difference(stripped_line)
-
-        if just_closed_bracket:
-            current_indent += 1
-
-    return '\n'.join(formatted_lines)
-
-
-def generate_program(args, cfg, directions: list[int] = None):
+def generate_program(args, cfg, directions: list[int] = None, template=None):
+    """template: a DirectionsTemplate for the cfg, to splice LOCAL_ARRAY directions into, rather than build the code"""
     from programs.WASMProgram import WASMProgram
     from programs.GLSLProgram import GLSLProgram
     from programs.WGSLProgram import WGSLProgram
     from languages import WASMLang, WGSLLang, GLSLLang
 
     if isinstance(args.language, WASMLang):
+        if template is not None:
+            raise ValueError("WASM has no LOCAL_ARRAY code to splice directions into")
         return WASMProgram(cfg, args.code_type, directions)
     elif isinstance(args.language, WGSLLang):
-        return WGSLProgram(cfg, args.code_type, directions)
+        return WGSLProgram(cfg, args.code_type, directions, template=template)
     elif isinstance(args.language, GLSLLang):
-        return GLSLProgram(cfg, args.code_type, directions)
+        return GLSLProgram(cfg, args.code_type, directions, template=template)
     else:
         raise ValueError("Unsupported language")
 
 
+def generate_local_array_programs(args, cfg, directions: list[list[int]]) -> list:
+    """A LOCAL_ARRAY program per direction. The code's built once, then each direction's spliced into it"""
+    from code_builders import CodeBuilderFactory
+    from my_common.CodeType import CodeType
+
+    template = CodeBuilderFactory.create_builder(args.language, cfg, CodeType.LOCAL_ARRAY).build_template()
+    return [generate_program(args, cfg, directions_list, template=template) for directions_list in directions]
+
+
 def save_program(program, file_path, opt_level: Optional[str] = None):
     """Save program of any supported language"""
     from languages import WASMLang, WGSLLang, GLSLLang
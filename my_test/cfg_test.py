@@ -0,0 +1,447 @@
+import hashlib
+import io
+import pickle
+import random
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import networkx as nx
+import pytest
+
+from CFG import (CFG, CFGCorpus, CFGCorpusWriter, CFGGenerator, CFGViolation, DirectionStore, FingerprintIndex,
+                 PathStatus, RandomStream, cfg_early_1_continue, cfg_if_1, cfg_while_1, cfg_while_2_nested)
+from CFG.CFG import CFGFormat
+from CFG.StructuredCFG import BlockNode, LoopNode, SelectionNode, SwitchNode
+from CFG.CFGGenerator import (_GRAPHS_IN_FLIGHT_PER_JOB, _MAX_CHUNKSIZE, GeneratorConfig,
+                              _first_candidates_in_parallel, _GenerationTask)
+from code_builders import CodeBuilderFactory
+from languages import GLSLLang, Template, WASMLang, WGSLLang
+from languages.Template import _MAX_HEADER_TEMPLATES, LanguageTemplates
+from my_common import CodeType
+from my_common.CodeWriter import file_hexdigest
+from .cfg_utilities import all_example_cfgs
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_frozen_cfg_matches_cfg(cfg):
+    frozen = cfg.freeze()
+
+    assert frozen.entry_node() == cfg.entry_node()
+
+    for block in cfg.nodes():
+        assert frozen.out_edges_destinations(block) == cfg.out_edges_destinations(block)
+        assert frozen.out_degree(block) == cfg.out_degree(block)
+        assert frozen.is_header_block(block) == cfg.is_header_block(block)
+        assert frozen.is_merge_block(block) == cfg.is_merge_block(block)
+        if cfg.contains_merge_instruction(block):
+            assert frozen.merge_block(block) == cfg.merge_block(block)
+
+    for seed in range(10):
+        random.seed(seed)
+        directions = cfg.generate_valid_input_directions()
+        random.seed(seed)
+        assert frozen.generate_valid_input_directions() == directions
+        assert frozen.expected_output_path(directions) == cfg.expected_output_path(directions)
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_expected_output_paths_matches_expected_output_path(cfg):
+    random.seed(0)
+    directions = [cfg.generate_valid_input_directions() for _ in range(20)]
+    directions.append(directions[0] + [7])  # NB: directions left over once an exit is reached are ignored
+
+    expected_paths = cfg.expected_output_paths(directions)
+
+    assert expected_paths.all_ok()
+    assert list(expected_paths) == [cfg.expected_output_path(d) for d in directions]
+
+
+def test_expected_output_paths_reports_bad_directions():
+    cfg = all_example_cfgs()[0]  # switch on 1 (cases 2, 3), 2 falls through to 3
+    expected_paths = cfg.expected_output_paths([[], [5]])
+
+    assert list(expected_paths.status) == [PathStatus.EXHAUSTED_DIRECTIONS, PathStatus.INVALID_DIRECTION]
+    assert expected_paths.partial_path(0) == [1]
+    with pytest.raises(RuntimeError):
+        expected_paths[1]
+
+
+def test_generate_n_valid_input_directions_are_distinct_and_exhaustive():
+    cfg = cfg_while_1()  # each path is some no. of loop iterations, i.e. directions [1]*k + [0]
+
+    assert cfg.count_valid_input_directions(max_length=5) == 5
+    assert sorted(cfg.generate_n_valid_input_directions(100, max_length=5)) == [[1] * k + [0] for k in range(5)]
+
+    directions = cfg.generate_n_valid_input_directions(10, seed=0, max_length=64)
+    assert len({tuple(d) for d in directions}) == 10
+    assert cfg.expected_output_paths(directions).all_ok()
+
+
+def test_generate_input_directions_of_length():
+    cfg = cfg_early_1_continue()  # each iteration consumes 2 directions, leaving the loop consumes 1
+
+    directions = cfg.generate_input_directions_of_length(1001, seed=0)
+    assert len(directions) == 1001
+    assert cfg.expected_output_paths([directions]).all_ok()
+
+    assert len(cfg.generate_input_directions_of_length(10, 11, seed=0)) == 11
+    with pytest.raises(ValueError):
+        cfg.generate_input_directions_of_length(10)
+
+    assert cfg.distances_to_exit()[cfg.entry_node()] == 1
+    assert len(cfg.generate_valid_input_directions(max_length=1)) == 1
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_generate_covering_input_directions(cfg):
+    directions, report = cfg.generate_covering_input_directions(seed=0)
+
+    assert not report.uncovered
+    assert report.no_of_paths == len(directions)
+    assert cfg.expected_output_paths(directions).all_ok()
+
+
+def test_covering_input_directions_run_loop_0_1_and_many_times():
+    cfg = cfg_while_1()
+    directions, report = cfg.generate_covering_input_directions(seed=0)
+
+    assert sorted(len(d) - 1 for d in directions) == [0, 1, 2]  # each path is [1]*k + [0]
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_fingerprint_ignores_block_numbering(cfg):
+    mapping = {block: 100 - block for block in cfg.nodes()}
+    relabelled = CFG(graph=nx.relabel_nodes(cfg.graph, mapping))
+    for block, merge_block in nx.get_node_attributes(relabelled.graph, 'Merge').items():
+        relabelled.update_node_attribute(block, 'Merge', mapping[merge_block])
+
+    assert relabelled.fingerprint() == cfg.fingerprint()
+
+
+def test_fingerprint_respects_edge_order():
+    cfg = cfg_while_1()
+    swapped = CFG(graph=nx.MultiDiGraph())
+    for block, attrs in cfg.nodes(data=True):
+        swapped.graph.add_node(block, **attrs)
+    for block in cfg.nodes():
+        for dst in reversed(cfg.out_edges_destinations(block)):
+            swapped.add_edge(block, dst)
+
+    assert swapped.fingerprint() != cfg.fingerprint()
+
+
+def test_fingerprint_index(tmp_path):
+    fingerprint = cfg_while_1().fingerprint()
+
+    with FingerprintIndex(str(tmp_path / 'index.db')) as index:
+        assert fingerprint not in index
+        assert index.add(fingerprint)
+        assert not index.add(fingerprint)
+        assert index.add_all([fingerprint, cfg_early_1_continue().fingerprint()]) == 1
+
+    with FingerprintIndex(str(tmp_path / 'index.db')) as index:  # persists across runs
+        assert fingerprint in index
+        assert len(index) == 2
+
+
+def test_cfg_corpus_round_trip(tmp_path):
+    cfgs = all_example_cfgs()
+    with CFGCorpusWriter(str(tmp_path / 'graphs.cfgc')) as writer:
+        for cfg in cfgs:
+            writer.append(cfg)
+
+    with CFGCorpus(str(tmp_path / 'graphs.cfgc')) as corpus:
+        assert len(corpus) == len(cfgs)
+        for ix in reversed(range(len(cfgs))):  # NB: random access
+            assert corpus.freeze(ix) == cfgs[ix].freeze()
+            assert corpus[ix] == cfgs[ix]
+            assert list(corpus[ix].graph.edges(data=True)) == list(cfgs[ix].graph.edges(data=True))
+
+    assert CFG().load(str(tmp_path / 'graphs.cfgc'), CFGFormat.CORPUS, index=3) == cfgs[3]
+
+
+@pytest.mark.parametrize("rle", [True, False])
+def test_direction_store_round_trip(tmp_path, rle):
+    cfg = cfg_early_1_continue()
+    directions = cfg.generate_n_valid_input_directions(20, seed=0) + [[1, 1] * 50 + [0]]
+    filepath = str(tmp_path / 'directions.dirs')
+
+    DirectionStore.save(filepath, directions, cfg.expected_output_paths(directions), rle=rle)
+
+    with DirectionStore(filepath) as store:
+        assert list(store) == directions
+        assert [store.expected_path(ix) for ix in range(len(store))] == list(cfg.expected_output_paths(directions))
+        assert cfg.expected_output_paths(*store.padded()).all_ok()
+
+
+def test_analysis_is_cached_until_mutated():
+    cfg = cfg_while_2_nested()  # 1 -> (5 | 2 -> (4 -> 1 | 3 -> 2))
+    analysis = cfg.analysis()
+
+    assert [analysis.enclosing_loops(block) for block in (1, 2, 3, 4, 5)] == [(), (1,), (1, 2), (1,), ()]
+    assert analysis.loop_nesting_forest() == {1: None, 2: 1}
+    assert analysis.blocks_in_loop(2) == {3}
+    assert analysis.immediate_dominator(3) == 2 and analysis.dominates(1, 4) and not analysis.dominates(4, 5)
+    assert analysis.immediate_post_dominator(3) == 2
+    assert analysis.headers_of(4) == [2]
+    assert cfg.is_reachable(3, 1) and cfg.analysis() is analysis
+
+    cfg.remove_edge(3, 2)
+    cfg.add_edge(3, 5)
+
+    assert cfg.analysis() is not analysis
+    assert not cfg.is_reachable(3, 1)
+    assert cfg.analysis().immediate_post_dominator(3) == 5
+
+
+def test_reachability_avoiding_a_block():
+    cfg = cfg_while_2_nested()  # 1 -> (5 | 2 -> (4 -> 1 | 3 -> 2))
+
+    assert cfg.is_reachable(3, 4) and not cfg.is_reachable(3, 4, avoiding=2)
+    assert cfg.is_reachable(2, 3, avoiding=2)  # NB: may start at the avoided block
+    assert cfg.is_reachable(3, 4, avoiding=1) and not cfg.is_reachable(4, 2, avoiding=1)
+    assert cfg.is_reachable(4, 5, avoiding=2) and not cfg.is_reachable(4, 5, avoiding=1)
+    assert cfg.descendants(4) == {1, 2, 3, 5} and cfg.ancestors(5) == {1, 2, 3, 4}  # NB: excludes the block itself
+
+
+def test_merge_and_entry_indices_track_attribute_updates():
+    cfg = pickle.loads(pickle.dumps(cfg_while_2_nested()))  # NB: pickles hold just the graph, not the indices
+
+    assert cfg.entry_node() == 1 and cfg.is_merge_block(4) and cfg.is_merge_block(5)
+
+    cfg.update_node_attribute(2, 'Merge', 3)
+    cfg.remove_node_attribute(1, 'EntryBlock')
+    cfg.add_node_attribute(2, 'EntryBlock', True)
+
+    assert cfg.entry_node() == 2
+    assert cfg.is_merge_block(3) and not cfg.is_merge_block(4) and cfg.is_merge_block(5)
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_example_cfgs_are_valid(cfg):
+    assert cfg.validate() == []
+
+
+def test_validate_reports_every_violation():
+    cfg = cfg_while_2_nested()  # 1 -> (5 | 2 -> (4 -> 1 | 3 -> 2))
+    cfg.add_edge(3, 1)
+    cfg.add_node_attribute(3, 'Merge', 4)
+
+    assert cfg.validate() == [CFGViolation((3,), "has a Merge but isn't a header"),
+                              CFGViolation((3,), "branches but isn't a header"),
+                              CFGViolation((3, 1), "back edge isn't to the header of the innermost enclosing loop")]
+
+    cfg = cfg_while_1()
+    cfg.remove_node_attribute(1, 'EntryBlock')
+    assert cfg.validate() == [CFGViolation((), "0 entry blocks, not 1")]
+
+    cfg = cfg_if_1()  # 1 -> (2 | 3) -> 4
+    cfg.add_node_attribute(1, 'ContinueBlock', True)
+    assert cfg.validate() == [CFGViolation((1,), "break/continue block has 2 out edges, not 1")]
+
+    cfg = cfg_while_1()
+    cfg.add_node_attribute(5, 'BreakBlock', True)
+    assert cfg.validate() == [CFGViolation((5,), "break/continue block has 0 out edges, not 1")]
+
+
+@pytest.mark.parametrize("no_of_blocks", [1, 2, 7, 500])
+def test_generate_of_size_hits_the_block_count(no_of_blocks):
+    random.seed(no_of_blocks)
+    cfg = CFGGenerator(GeneratorConfig.allow_all(WGSLLang())).generate_of_size(no_of_blocks, max_depth=4)
+
+    assert len(cfg.nodes()) == no_of_blocks and cfg.validate() == []
+
+    chain = CFGGenerator(GeneratorConfig.allow_all(WGSLLang())).generate_of_size(no_of_blocks, max_depth=0)
+    assert len(chain.nodes()) == no_of_blocks and all(chain.out_degree(block) <= 1 for block in chain.nodes())
+
+
+def test_generated_breaks_and_continues_are_valid():
+    random.seed(0)
+    generator = CFGGenerator(GeneratorConfig.allow_all(WGSLLang()))
+    cfgs = [generator.generate(5, 3, 5) for _ in range(20)] + [generator.generate_of_size(300) for _ in range(20)]
+
+    assert all(cfg.validate() == [] for cfg in cfgs)
+    assert any(cfg.is_break_block(block) for cfg in cfgs for block in cfg.nodes())
+    assert any(cfg.is_continue_block(block) for cfg in cfgs for block in cfg.nodes())
+
+
+def test_parallel_generation_is_independent_of_no_of_jobs(tmp_path):
+    fingerprints = []
+    for jobs in (1, 2):
+        (tmp_path / str(jobs)).mkdir()
+        CFGGenerator(GeneratorConfig.allow_all(WGSLLang())).generate_cfgs_method_uniform(
+            str(tmp_path / str(jobs)), no_of_graphs=12, min_depth=2, max_depth=4, fmt=CFGFormat.CORPUS,
+            jobs=jobs, seed=7)
+        corpus = CFGCorpus(str(tmp_path / str(jobs) / CFGCorpus.DEFAULT_FILENAME))
+        fingerprints.append([corpus[i].fingerprint() for i in range(len(corpus))])
+
+    streamed = CFGGenerator(GeneratorConfig.allow_all(WGSLLang())).stream_cfgs_method_uniform(
+        no_of_graphs=12, min_depth=2, max_depth=4, jobs=2, seed=7)
+
+    assert fingerprints[0] == fingerprints[1] == [cfg.fingerprint() for cfg in streamed]
+    assert len(set(fingerprints[0])) == 12
+
+
+def test_parallel_generation_yields_early_and_keeps_a_bounded_window_in_flight():
+    submitted, made, release = [], [], threading.Event()
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args[-1])
+            return super().submit(fn, *args, **kwargs)
+
+    class HeldTask(_GenerationTask):  # NB: only graph 0 can be made until released
+        def __call__(self, stream, graph_no, attempt=0):
+            if graph_no > 0:
+                release.wait(timeout=5)
+            made.append(graph_no)
+            return super().__call__(stream, graph_no, attempt)
+
+    task = HeldTask(GeneratorConfig.allow_all(WGSLLang()), None, 1, 2, None)
+    with CountingExecutor(2) as executor:
+        candidates = _first_candidates_in_parallel(executor, task, RandomStream(7), no_of_graphs=2000, jobs=2)
+        first = next(candidates)
+
+        assert made == [0] and first == _GenerationTask.__call__(task, RandomStream(7), 0)
+        assert len(submitted[0]) == 1 and max(map(len, submitted)) == _MAX_CHUNKSIZE
+        assert sum(map(len, submitted)) == _GRAPHS_IN_FLIGHT_PER_JOB * 2 + 1  # NB: the window, refilled once
+        release.set()
+        candidates.close()
+
+
+def test_generation_draws_only_from_its_own_stream():
+    random.seed(0)
+    state = random.getstate()
+
+    def generate(stream):
+        cfg = CFGGenerator(GeneratorConfig.random(WGSLLang(), stream), stream).generate(4, 3, 5)
+        return cfg.fingerprint(), cfg.generate_valid_input_directions(rng=stream)
+
+    assert generate(RandomStream(3).child(1)) == generate(pickle.loads(pickle.dumps(RandomStream(3))).child(1))
+    assert generate(RandomStream(3).child(1)) != generate(RandomStream(3).child(2))
+    assert random.getstate() == state
+
+
+def test_codegen_handles_nesting_deeper_than_the_recursion_limit():
+    depth = sys.getrecursionlimit() + 100
+    headers, inner = range(1, depth + 1), depth + 1
+    merges, exit_block = range(depth + 2, 2 * depth + 2), 2 * depth + 2
+
+    g = nx.MultiDiGraph()
+    for ix, header in enumerate(headers):  # NB: if (...) { if (...) { ... } }
+        g.add_edge(header, merges[ix])
+        g.add_edge(header, headers[ix + 1] if ix + 1 < depth else inner)
+    g.add_edge(inner, merges[-1])
+    for ix in range(depth - 1, 0, -1):
+        g.add_edge(merges[ix], merges[ix - 1])
+    g.add_edge(merges[0], exit_block)
+    cfg = CFG(graph=g, entry_block=1)
+    for header, merge in zip(headers, merges):
+        cfg.add_node_attribute(header, 'SelectionHeader', True)
+        cfg.add_node_attribute(header, 'Merge', merge)
+
+    for language in (GLSLLang(), WASMLang()):
+        code = CodeBuilderFactory.create_builder(language, cfg, CodeType.GLOBAL_ARRAY, [1]).build_code()
+        assert set(map(int, re.findall(r'BLOCK (\d+) ', code))) == set(cfg.nodes())
+
+
+@pytest.mark.parametrize("language", [GLSLLang(), WGSLLang()])
+@pytest.mark.parametrize("code_type", list(CodeType))
+def test_templates_fill_as_their_source_would_format(language, code_type):
+    templates = language.templates(code_type)
+    assert language.templates(code_type) is templates  # NB: compiled once
+
+    fields = {'true_block_code': 'T', 'possible_else': 'E', 'loop_header': 'H', 'loop_body': 'B', 'cases': 'C',
+              'default': 'D'}
+    for template in (templates.selection(7), templates.loop(7), templates.switch_full(7)):
+        values = [fields[param] for param in template.params]
+        assert template.format(*values) == template.source.format(**fields)
+        nested = ['nested ', ['fragments']]
+        assert any(fragment is nested for fragment in template.fill(*values[:-1], nested))  # NB: not copied
+    assert templates.block.format(3) == language.block.format(n=3)
+
+    with pytest.raises(ValueError):
+        Template('{a} {b}', params=('a',))
+
+
+def test_header_guard_templates_are_bounded():
+    templates = LanguageTemplates(GLSLLang(), CodeType.HEADER_GUARD)
+    first = templates.selection(0)
+    for header in range(1, 2 * _MAX_HEADER_TEMPLATES):
+        templates.selection(header)
+        assert templates.selection(0) is first  # NB: the most recently used, so kept
+
+    assert len(templates._compiled) == _MAX_HEADER_TEMPLATES and ('selection', 1) not in templates._compiled
+    assert templates.selection(1).source == GLSLLang().selection_str_pre_format(CodeType.HEADER_GUARD, 1)
+
+
+@pytest.mark.parametrize("language", [GLSLLang(), WASMLang(), WGSLLang()])
+def test_code_writer_streams_what_format_code_gives(language, tmp_path):
+    random.seed(5)
+    cfg = CFGGenerator(GeneratorConfig.allow_all(language)).generate_of_size(60)
+    builder = CodeBuilderFactory.create_builder(language, cfg, CodeType.GLOBAL_ARRAY, [1])
+    raw_code = builder.full_program_aux(builder.join(builder.control_flow_code()), [1])
+    formatted_code = language.format_code_(raw_code)
+    assert builder.build_code() == formatted_code
+
+    buffer = io.StringIO()
+    with language.code_writer(buffer) as writer:
+        for start in range(0, len(raw_code), 7):  # NB: pieces that split lines (and brackets) anywhere
+            writer.write(raw_code[start:start + 7])
+    assert buffer.getvalue() == formatted_code
+    assert writer.hexdigest() == hashlib.sha256(formatted_code.encode()).hexdigest()
+
+    path = tmp_path / 'code'
+    with open(path, 'w') as file:
+        file.write(formatted_code)
+    assert file_hexdigest(str(path)) == writer.hexdigest()
+    assert file_hexdigest(str(tmp_path / 'missing')) is None
+
+
+@pytest.mark.parametrize("language", [GLSLLang(), WGSLLang()])
+def test_directions_template_splices_what_building_gives(language, tmp_path):
+    random.seed(6)
+    cfg = CFGGenerator(GeneratorConfig.allow_all(language)).generate_of_size(60)
+    template = CodeBuilderFactory.create_builder(language, cfg, CodeType.LOCAL_ARRAY).build_template()
+    template = pickle.loads(pickle.dumps(template))
+
+    for directions in ([], [1], [0, 1, 1, 0, 2, 12, 1]):
+        code = CodeBuilderFactory.create_builder(language, cfg, CodeType.LOCAL_ARRAY, directions).build_code()
+        assert template.code(directions) == code
+        assert template.hexdigest(directions) == hashlib.sha256(code.encode()).hexdigest()
+        path = tmp_path / 'code'
+        template.save(str(path), directions)
+        assert path.read_text() == code
+
+
+@pytest.mark.parametrize("cfg", all_example_cfgs())
+def test_structure_is_built_once_per_cfg_and_places_each_block_once(cfg):
+    frozen = cfg.freeze()
+    structure = frozen.structure()
+    assert cfg.structure() is structure
+    assert frozen.structure(nests_switch_cases=True) is not structure
+
+    for language, code_type in [(GLSLLang(), CodeType.GLOBAL_ARRAY), (WGSLLang(), CodeType.LOCAL_ARRAY)]:
+        printer = CodeBuilderFactory.create_builder(language, cfg, code_type, [0]).printer
+        assert printer.structure_of(frozen) is structure  # NB: shared by every language and code type but WASM
+    assert CodeBuilderFactory.create_builder(WASMLang(), cfg, CodeType.GLOBAL_ARRAY, [0]).printer.structure_of(
+        frozen) is frozen.structure(nests_switch_cases=True)
+
+    for nests_switch_cases in (False, True):
+        placed, stack = [], [frozen.structure(nests_switch_cases).body]
+        while stack:
+            for item in stack.pop():
+                if isinstance(item, list):
+                    stack.append(item)
+                elif isinstance(item, BlockNode):
+                    placed.append(item.block)
+                elif isinstance(item, LoopNode):
+                    placed.append(item.header)
+                    stack.append(item.body)
+                elif isinstance(item, SelectionNode):
+                    stack += [item.true_body] + ([item.false_body] if item.false_body is not None else [])
+                elif isinstance(item, SwitchNode):
+                    stack += [case.body for case in item.cases] + [item.default]
+        assert sorted(placed) == sorted(set(placed)) == sorted(cfg.nodes())
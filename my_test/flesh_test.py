@@ -14,32 +14,48 @@ from WGSL.utils import tst_shader
 from .cfg_utilities import all_cfg_and_language_combos
 from my_common import generate_program, save_program, load_repo_paths_config
 from languages import Language, WASMLang, WGSLLang, GLSLLang
+from runner.scheduler import Resources
 
 def tst_generated_code(program,
                        input_directions: list[int],
                        config,
-                       clear_files_after=True):
+                       clear_files_after=True,
+                       expected_path: list[int] = None):
+    """expected_path: if None, calculated from program.cfg (pass it in when precomputed in batch)"""
 
     language = program.get_language()
 
     # RUN
     if isinstance(language, WASMLang):
-        is_match, msg = WASM.run_wasm(program, input_directions)
+        is_match, msg = WASM.run_wasm(program, input_directions, expected_output=expected_path)
     elif isinstance(language, WGSLLang):
         code_filepath = os.path.join('/Users/maxmitchell/Documents/msc-control-flow-fleshing-project', program.get_file_path())
-        expected_directions = program.cfg.expected_output_path(input_directions)
+        if expected_path is None:
+            expected_path = program.cfg.expected_output_path(input_directions)
         try:
-            is_match, msg = tst_shader(code_filepath, expected_directions, os.environ.copy(), input_directions)
+            is_match, msg = tst_shader(code_filepath, expected_path, os.environ.copy(), input_directions)
         except Exception as e:
             return False, f"An error occurred: {e}"
     elif isinstance(language, GLSLLang):
-        is_match, msg = GLSL.run_glsl(program, input_directions, config)
+        is_match, msg = GLSL.run_glsl(program, input_directions, config, expected_path)
     else:
         raise ValueError("Language not handled")
 
     return is_match, msg
 
 
+def execution_requirements(language: Language) -> tuple[str, Resources]:
+    """The scheduler executor running a test in this language uses, and what each test holds while it runs"""
+    if isinstance(language, WASMLang):
+        return 'node', Resources(cpu=1)
+    elif isinstance(language, WGSLLang):
+        return 'dawn', Resources(gpu=1, cpu=1)
+    elif isinstance(language, GLSLLang):
+        return 'shadertrap', Resources(gpu=1, cpu=1)
+    else:
+        raise ValueError("Language not handled")
+
+
 def test_direction(program, direction):
     match, msg = tst_generated_code(program,
                                     direction,
@@ -53,17 +69,7 @@ def test_cfg(cfg, language, config):
 
     # GENERATE INPUT DIRECTIONS
 
-    # TODO: write cfg.generate_n_valid_input_directions(n) taking even spread of paths w/ all guaranteed distinct
-    input_directions = [cfg.generate_valid_input_directions(max_length=512) for _ in range(100)]
-    # remove duplicates. TODO: Remove once generate_n_valid_input_directions is written
-    seen = set()
-    unique_inputs = []
-    for item in input_directions:
-        hashable_item = tuple(item)
-        if hashable_item not in seen:
-            unique_inputs.append(item)
-            seen.add(hashable_item)
-    input_directions = unique_inputs
+    input_directions = cfg.generate_n_valid_input_directions(100, max_length=512)
 
     with tempfile.TemporaryDirectory() as temp_dir:
 
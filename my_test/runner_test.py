@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from runner.pipeline import Pipeline, Stage
+from runner.scheduler import Resources, Scheduler
+
+
+def test_pipeline_runs_every_item_through_every_stage():
+    in_flight, max_in_flight, lock = [0], [0], threading.Lock()
+
+    def start(x):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        return x
+
+    def finish(x):
+        with lock:
+            in_flight[0] -= 1
+        return None if x % 10 == 0 else 2 * x  # NB: None drops the item
+
+    pipeline = Pipeline([Stage('start', start), Stage('double', lambda x: x, workers=3), Stage('finish', finish)],
+                        queue_size=2)
+
+    assert sorted(pipeline.run(range(100))) == [2 * x for x in range(100) if x % 10 != 0]
+    assert [stats.items for stats in pipeline.stats] == [100, 100, 100]
+    assert max_in_flight[0] <= 3 + 3 * 2 + 1  # NB: backpressure: workers + queues, not the whole input
+
+    def fail(x):
+        if x == 5:
+            raise RuntimeError("stage failed")
+        return x
+
+    with pytest.raises(RuntimeError, match="stage failed"):
+        list(Pipeline([Stage('fail', fail, workers=2)]).run(range(100)))
+
+
+def test_scheduler_respects_slots_limits_and_priorities():
+    running, peak, started, lock = {}, {}, [], threading.Lock()
+    gate = threading.Event()
+
+    def task(executor, i):
+        with lock:
+            running[executor] = running.get(executor, 0) + 1
+            peak[executor] = max(peak.get(executor, 0), running[executor])
+            started.append(i)
+        gate.wait(1)
+        with lock:
+            running[executor] -= 1
+        return i
+
+    with Scheduler(gpu_slots=1, cpu_slots=4, executor_limits={'node': 2}) as scheduler:
+        blocker = scheduler.submit(gate.wait, 1, executor='dawn', needs=Resources(gpu=1))
+        gpu_tasks = [scheduler.submit(task, 'dawn', i, executor='dawn', needs=Resources(gpu=1, cpu=1), priority=i)
+                     for i in range(4)]
+        cpu_tasks = [scheduler.submit(task, 'node', i, executor='node') for i in range(10, 16)]
+        assert gpu_tasks[0].cancel()
+        gate.set()
+
+    assert blocker.done() and gpu_tasks[0].cancelled()
+    assert [future.result() for future in gpu_tasks[1:] + cpu_tasks] == [1, 2, 3] + list(range(10, 16))
+    assert peak == {'dawn': 1, 'node': 2}
+    assert [i for i in started if i < 10] == [3, 2, 1]  # NB: highest priority first
+
+    with pytest.raises(ValueError):
+        Scheduler(gpu_slots=1).submit(print, needs=Resources(gpu=2))
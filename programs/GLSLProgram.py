@@ -12,7 +12,7 @@ from enum import Enum
 from languages import GLSLLang
 from programs.Program import Program
 from my_common.CodeType import CodeType
-from code_builders import CodeBuilderFactory
+from code_builders import CodeBuilderFactory, DirectionsTemplate
 
 
 def _list_to_space_separated_values(values: Optional[list[int]]) -> str:
@@ -96,11 +96,15 @@ class GLSLProgram(Program):
         COMP_SHADER = 0,
         SHADER_TEST = 1
 
-    def __init__(self, cfg: CFG, code_type: CodeType, directions: Optional[list[int]] = None):
+    def __init__(self, cfg: CFG, code_type: CodeType, directions: Optional[list[int]] = None,
+                 template: Optional[DirectionsTemplate] = None):
+        """template: for LOCAL_ARRAY, the program to splice the directions into, rather than building it"""
         super().__init__(cfg)
         self.code_type = code_type
-        self.builder = CodeBuilderFactory.create_builder(GLSLLang(), self.cfg, self.code_type, directions)
-        self._code = self.builder.build_code()
+        self.directions = directions
+        self.template = template
+        if template is None:
+            self.builder = CodeBuilderFactory.create_builder(GLSLLang(), self.cfg, self.code_type, directions)
         self.language = GLSLLang()
 
     def generate_shader_test(self, input_directions: Optional[list[int]] = None,
@@ -135,19 +139,15 @@ class GLSLProgram(Program):
             os.makedirs(directory)
 
         if output_type == GLSLProgram.OutputType.COMP_SHADER:
-            file_extension = 'glsl'  # NB: There's no official extension in the GLSL spec.
-            file_content = self.get_code()
+            new_file_path = f"{file_path}.glsl"  # NB: There's no official extension in the GLSL spec.
+            self._save_code(new_file_path)
         elif output_type == GLSLProgram.OutputType.SHADER_TEST:
-            file_extension = 'shadertrap'
-            file_content = self.generate_shader_test(input_directions, expected_path)
+            new_file_path = f"{file_path}.shadertrap"
+            with open(new_file_path, "w") as file:
+                file.write(self.generate_shader_test(input_directions, expected_path))
         else:
             raise ValueError("Unsupported output type")
 
-        new_file_path = f"{file_path}.{file_extension}"
-
-        with open(new_file_path, "w") as file:
-            file.write(file_content)
-
         self._file_path = new_file_path
 
         if verbose:
@@ -1,29 +1,76 @@
 # [CFG -> Program]. Can then compile, save, and return the code of Program
 from __future__ import annotations
 
+import hashlib
+import io
+import os
 from abc import ABC
-from CFG import *
+from typing import Optional, TextIO
+
+from code_builders import DirectionsTemplate
 from languages import Language
+from my_common.CodeWriter import file_hexdigest
 
 
 class Program(ABC):
     def __init__(self, cfg):
-        self._code = None
+        self._code = None  # NB: built on demand (c.f. get_code), as saving streams it straight to file instead
+        self._content_hash: Optional[str] = None
+        self.builder = None
+        self.template: Optional[DirectionsTemplate] = None  # NB: if set, the code's spliced from it, not built
+        self.directions: Optional[list[int]] = None
         self.cfg = cfg
         self.has_binary_format: bool
         self._file_path: Optional[str] = None
         self.language = None
 
     def get_code(self) -> str:
+        if self._code is None:
+            buffer = io.StringIO()
+            self.write_code(buffer)
+            self._code = buffer.getvalue()
         return self._code
 
+    def write_code(self, out: Optional[TextIO]) -> str:
+        """
+        Stream the code to `out` (a text file or buffer, or None to only hash it) as it's built, so it's never held as
+        a whole unless get_code() has been called. Return its hash
+        """
+        if self._code is not None:
+            if out is not None:
+                out.write(self._code)
+            self._content_hash = hashlib.sha256(self._code.encode('utf-8')).hexdigest()
+        elif self.template is not None:
+            self._content_hash = self.template.write_code(out, self.directions)
+        else:
+            self._content_hash = self.builder.write_code(self.language.code_writer(out))
+        return self._content_hash
+
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self.write_code(None)
+        return self._content_hash
+
     def _is_up_to_date(self, path: str) -> bool:
-        try:
-            with open(path, "r") as file:
-                existing_code = file.read()
-            return existing_code == self._code
-        except FileNotFoundError:
+        """Whether the file at path has this code, by comparing hashes (the file's read a chunk at a time)"""
+        return file_hexdigest(path) == self.content_hash()
+
+    def _save_code(self, path: str) -> None:
+        if self.template is not None and self._code is None:
+            self._content_hash = self.template.save(path, self.directions)
+            return
+        with open(path, "w") as file:
+            self.write_code(file)
+
+    def _save_code_if_changed(self, path: str) -> bool:
+        """Save the code to path unless the file there already has it. Whether it was saved"""
+        temp_path = f"{path}.tmp"
+        self._save_code(temp_path)  # NB: so the code's only built once, even if it then turns out to be unchanged
+        if self._is_up_to_date(path):
+            os.remove(temp_path)
             return False
+        os.replace(temp_path, path)
+        return True
 
     def set_file_path(self, filepath: str):
         self._file_path = filepath
@@ -17,16 +17,12 @@ class WASMProgram(Program):
         super().__init__(cfg)
         self.code_type = code_type
         self.builder = CodeBuilderFactory.create_builder(WASMLang(), self.cfg, self.code_type, directions)
-        self._wat_code = self.builder.build_code()
         self.language = WASMLang()
 
     @staticmethod
     def compile(source_code_path, target_binary_path):
         subprocess.run(["wat2wasm", "--enable-multi-memory", source_code_path, "-o", target_binary_path])
 
-    def get_code(self) -> str:
-        return self._wat_code
-
     def save(self, file_path: str, save_as_executable: bool = True, opt_level: Optional[str] = None, verbose=False):
 
         directory = os.path.dirname(os.path.abspath(file_path))
@@ -37,17 +33,13 @@ class WASMProgram(Program):
         binary_path = f"{file_path}.wasm"
 
         source_code_file_already_existed: bool = os.path.exists(source_code_path)
-        up_to_date: bool = self._is_up_to_date(source_code_path)
 
         if not save_as_executable:
-            with open(source_code_path, "w") as file:
-                file.write(self.get_code())
+            self._save_code(source_code_path)
             self._file_path = source_code_path
 
         else:
-            if not source_code_file_already_existed or not up_to_date:
-                with open(source_code_path, "w") as file:
-                    file.write(self.get_code())
+            self._save_code_if_changed(source_code_path)
 
             self.compile(source_code_path, binary_path)
 
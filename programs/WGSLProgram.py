@@ -1,7 +1,7 @@
 import os
 from typing import Optional
 
-from code_builders import CodeBuilderFactory
+from code_builders import CodeBuilderFactory, DirectionsTemplate
 from my_common.CodeType import CodeType
 from languages import WGSLLang
 from programs.Program import Program
@@ -9,11 +9,15 @@ import CFG
 
 
 class WGSLProgram(Program):
-    def __init__(self, cfg: CFG, code_type: CodeType, directions: Optional[list[int]] = None):
+    def __init__(self, cfg: CFG, code_type: CodeType, directions: Optional[list[int]] = None,
+                 template: Optional[DirectionsTemplate] = None):
+        """template: for LOCAL_ARRAY, the program to splice the directions into, rather than building it"""
         super().__init__(cfg)
         self.code_type = code_type
-        self.builder = CodeBuilderFactory.create_builder(WGSLLang(), self.cfg, self.code_type, directions)
-        self._code = self.builder.build_code()
+        self.directions = directions
+        self.template = template
+        if template is None:
+            self.builder = CodeBuilderFactory.create_builder(WGSLLang(), self.cfg, self.code_type, directions)
         self.language = WGSLLang()
 
     def save(self, file_path, verbose=False):
@@ -23,8 +27,7 @@ class WGSLProgram(Program):
 
         source_code_path = f"{file_path}.wgsl"
 
-        with open(source_code_path, "w") as file:
-            file.write(self.get_code())
+        self._save_code(source_code_path)
 
         self._file_path = source_code_path
 
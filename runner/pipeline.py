@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+_DONE = object()  # NB: end of stream marker, passed down the queues
+_POLL_INTERVAL = 0.1  # seconds between checks for a stopped pipeline while waiting on a queue
+
+
+class Stage:
+    """One step of a Pipeline: `workers` threads apply `fn` to each item. Items it returns None for are dropped"""
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least 1 worker")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class StageStats:
+    """
+    How a stage's workers spent their time: busy (in fn), starved (waiting for an item from the previous stage) or
+    blocked (waiting for room in the next stage's queue, i.e. backpressure)
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = self.starved = self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, starved: float, blocked: float):
+        with self._lock:
+            self.items += 1
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    def utilisation(self, elapsed: float) -> float:
+        """Fraction of its workers' time spent busy"""
+        return self.busy / (self.workers * elapsed) if elapsed > 0 else 0.0
+
+    def summary(self, elapsed: float) -> str:
+        worker_time = self.workers * elapsed if elapsed > 0 else 1.0
+        return (f"{self.name}: {self.items} items, {self.workers} worker(s), "
+                f"{self.busy / worker_time:.0%} busy, {self.starved / worker_time:.0%} starved, "
+                f"{self.blocked / worker_time:.0%} blocked")
+
+
+class Pipeline:
+    """
+    Runs items through stages concurrently. Each stage has its own worker threads, and consecutive stages are joined
+    by bounded queues, so a stage that gets ahead blocks (backpressure) rather than piling up work, and a slow stage
+    always has work waiting. Given enough workers on the slowest stage it's saturated, and no other stage idles
+    for longer than it takes to fill a queue. `report()` gives each stage's utilisation, to find that stage.
+
+    Threads suit stages that wait on subprocesses or devices (compilers, Dawn, ShaderTrap). CPU-bound Python stages
+    contend for the GIL, so parallelise those w/ processes instead (e.g. CFG generation's `jobs`).
+
+    Items leave in the order they finish, so not necessarily the order they came in if a stage has > 1 worker.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 4):
+        if not stages:
+            raise ValueError("A pipeline needs at least 1 stage")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = [StageStats(stage.name, stage.workers) for stage in stages]
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def run(self, items: Iterable) -> Iterator:
+        """Yield the output of the last stage for each item (that isn't dropped), as soon as it's ready"""
+
+        self._stop.clear()
+        self._error = None
+        # NB: queues[k] feeds stage k; the last feeds the caller
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        start_time = time.perf_counter()
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True, name='feed')]
+        for ix, stage in enumerate(self.stages):
+            remaining_workers = [stage.workers]
+            lock = threading.Lock()
+            threads += [threading.Thread(target=self._work,
+                                         args=(stage, self.stats[ix], queues[ix], queues[ix + 1], remaining_workers,
+                                               lock),
+                                         daemon=True, name=f'{stage.name}-{w}')
+                        for w in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while (item := self._get(queues[-1])) is not _DONE:
+                yield item
+        finally:  # NB: also if the caller stops early
+            self._stop.set()
+            for thread in threads[1:]:  # NB: the feeder may be stuck in the items iterator, so don't wait for it
+                thread.join()
+            self.elapsed = time.perf_counter() - start_time
+
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> str:
+        return '\n'.join(stats.summary(self.elapsed) for stats in self.stats)
+
+    def bottleneck(self) -> StageStats:
+        """The stage w/ the highest utilisation, i.e. the one to give more workers"""
+        return max(self.stats, key=lambda stats: stats.utilisation(self.elapsed))
+
+    # WORKERS
+
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Put the item on q once there's room. False if the pipeline stopped first"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """The next item on q, or _DONE if the pipeline stopped first"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, items: Iterable, q: queue.Queue):
+        try:
+            for item in items:
+                if not self._put(q, item):
+                    return
+            self._put(q, _DONE)
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(self, stage: Stage, stats: StageStats, in_queue: queue.Queue, out_queue: queue.Queue,
+              remaining_workers: list[int], lock: threading.Lock):
+        try:
+            while True:
+                t0 = time.perf_counter()
+                item = self._get(in_queue)
+                if item is _DONE:
+                    self._put(in_queue, _DONE)  # NB: for this stage's other workers
+                    break
+                t1 = time.perf_counter()
+                result = stage.fn(item)
+                t2 = time.perf_counter()
+                if result is not None and not self._put(out_queue, result):
+                    break
+                stats.add(busy=t2 - t1, starved=t1 - t0, blocked=time.perf_counter() - t2)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            with lock:
+                remaining_workers[0] -= 1
+                if remaining_workers[0] == 0:  # NB: the last worker out passes the end of stream on
+                    self._put(out_queue, _DONE)
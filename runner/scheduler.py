@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+
+class Resources:
+    """What a task holds while it runs: GPU device slots, CPU (tool/process) slots and memory"""
+
+    def __init__(self, gpu: int = 0, cpu: int = 0, memory_mb: int = 0):
+        self.gpu = gpu
+        self.cpu = cpu
+        self.memory_mb = memory_mb
+
+    def fits_in(self, other: Resources) -> bool:
+        return self.gpu <= other.gpu and self.cpu <= other.cpu and self.memory_mb <= other.memory_mb
+
+    def __add__(self, other: Resources) -> Resources:
+        return Resources(self.gpu + other.gpu, self.cpu + other.cpu, self.memory_mb + other.memory_mb)
+
+    def __sub__(self, other: Resources) -> Resources:
+        return Resources(self.gpu - other.gpu, self.cpu - other.cpu, self.memory_mb - other.memory_mb)
+
+    def __repr__(self):
+        return f"Resources(gpu={self.gpu}, cpu={self.cpu}, memory_mb={self.memory_mb})"
+
+
+class _Task:
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, executor: str, needs: Resources):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.executor = executor
+        self.needs = needs
+        self.future = Future()
+
+
+class Scheduler:
+    """
+    Runs tasks on threads once what they declare they need is free, so backends w/ different resource profiles (e.g.
+    Dawn and ShaderTrap on the GPU, Node on a CPU) can run side by side w/o oversubscribing any of them.
+
+    Capacity is in GPU device slots, CPU slots and memory, and each executor (a name for a kind of task, e.g. 'dawn')
+    can also have its own concurrency limit. Each executor's tasks start highest priority first (FIFO among equals),
+    and while the next can't start, the rest of that executor's wait, but other executors' can go ahead. So starting
+    a task costs O(no. of executors + log(pending)), however many are pending. `submit` returns a
+    concurrent.futures.Future, and cancelling it before it starts removes the task. Running tasks aren't interrupted.
+    """
+
+    def __init__(self, gpu_slots: int = 1, cpu_slots: int = None, memory_mb: int = None,
+                 executor_limits: dict[str, int] = None):
+        """cpu_slots: defaults to the no. of CPUs. memory_mb: None for no limit"""
+        self.capacity = Resources(gpu=gpu_slots, cpu=cpu_slots or os.cpu_count() or 1,
+                                  memory_mb=memory_mb if memory_mb is not None else 2 ** 62)
+        self.executor_limits = dict(executor_limits or {})
+        self._free = Resources(self.capacity.gpu, self.capacity.cpu, self.capacity.memory_mb)
+        self._running: dict[str, int] = {}
+        self._pending: dict[str, list[tuple[int, int, _Task]]] = {}  # NB: per executor, heap of (-priority, no., task)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._is_shut_down = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel_pending=exc_type is not None)
+
+    def submit(self, fn: Callable, *args, executor: str = 'default', needs: Optional[Resources] = None,
+               priority: int = 0, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) once `needs` (default: 1 CPU slot) is free and the executor is under its limit"""
+        needs = needs if needs is not None else Resources(cpu=1)
+        if not needs.fits_in(self.capacity):
+            raise ValueError(f"Task needs {needs}, but the scheduler only has {self.capacity}")
+        if self.executor_limits.get(executor, 1) < 1:
+            raise ValueError(f"Executor '{executor}' has a limit of {self.executor_limits[executor]}, so can't run")
+
+        task = _Task(fn, args, kwargs, executor, needs)
+        with self._lock:
+            if self._is_shut_down:
+                raise RuntimeError("Can't submit to a scheduler that's shut down")
+            heapq.heappush(self._pending.setdefault(executor, []), (-priority, next(self._counter), task))
+            self._dispatch()
+        return task.future
+
+    def cancel_pending(self) -> int:
+        """Cancel every task that hasn't started. Return how many were cancelled"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            cancelled = sum(task.future.cancel() for heap in pending.values() for _, _, task in heap)
+            self._all_done.notify_all()
+        return cancelled
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """Stop accepting tasks. If wait, block until every task that's been submitted (and not cancelled) is done"""
+        if cancel_pending:
+            self.cancel_pending()
+        with self._lock:
+            self._is_shut_down = True
+            while wait and (any(self._pending.values()) or self._running_count()):
+                self._all_done.wait()
+
+    # DISPATCH (NB: called w/ the lock held)
+
+    def _running_count(self) -> int:
+        return sum(self._running.values())
+
+    def _can_start(self, task: _Task) -> bool:
+        limit = self.executor_limits.get(task.executor)
+        return task.needs.fits_in(self._free) and (limit is None or self._running.get(task.executor, 0) < limit)
+
+    def _next_startable(self) -> Optional[tuple[int, int, _Task]]:
+        """The highest priority of the executors' next tasks that can start now, if any"""
+        best = None
+        for heap in self._pending.values():
+            while heap and heap[0][2].future.cancelled():
+                heapq.heappop(heap)
+            if heap and self._can_start(heap[0][2]) and (best is None or heap[0] < best):
+                best = heap[0]
+        return best
+
+    def _dispatch(self):
+        """Start every pending task that can start, highest priority first"""
+        while (entry := self._next_startable()) is not None:
+            task = entry[2]
+            heapq.heappop(self._pending[task.executor])
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            self._free = self._free - task.needs
+            self._running[task.executor] = self._running.get(task.executor, 0) + 1
+            threading.Thread(target=self._run, args=(task,), daemon=True, name=f'{task.executor}-task').start()
+
+    def _run(self, task: _Task):
+        try:
+            result = task.fn(*task.args, **task.kwargs)
+        except BaseException as e:
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+        finally:
+            with self._lock:
+                self._free = self._free + task.needs
+                self._running[task.executor] -= 1
+                self._dispatch()
+                self._all_done.notify_all()
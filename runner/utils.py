@@ -6,28 +6,34 @@ import time
 
 from threading import Lock
 
+from runner.scheduler import Resources, Scheduler
+
 print_lock = Lock()
 processed_cfgs_lock = Lock()
 processed_cfgs: dict[int, bool] = {}
 
 
-def execute_concurrently(tasks, task_args_list):
+def execute_concurrently(tasks, task_args_list, scheduler: Scheduler = None, needs: Resources = None):
     """
     Parameters:
         tasks (list): A list of task functions to execute.
         task_args_list (list): A list of tuples, where each tuple contains the arguments for the corresponding task.
+        scheduler (Scheduler): Runs the tasks. If None, one w/ a CPU slot per CPU is used.
+        needs (Resources): What each task holds while it runs. Defaults to 1 CPU slot.
     Returns:
         float: The time taken to execute all tasks.
     """
     start_time = time.time()
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(task, *args) for task, args in zip(tasks, task_args_list)]
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                future.result()  # To raise any exceptions that occurred during the processing
-            except Exception as e:
-                print(f'Exception occurred: {e}')
+    scheduler_ = scheduler if scheduler is not None else Scheduler()
+    futures = [scheduler_.submit(task, *args, needs=needs) for task, args in zip(tasks, task_args_list)]
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            future.result()  # To raise any exceptions that occurred during the processing
+        except Exception as e:
+            print(f'Exception occurred: {e}')
+    if scheduler is None:
+        scheduler_.shutdown()
 
     end_time = time.time()
     elapsed_time = end_time - start_time
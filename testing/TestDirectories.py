@@ -1,6 +1,7 @@
 import os
 from enum import Enum
 
+from CFG import DirectionStore
 from languages import Language
 
 from my_common.CodeType import CodeType
@@ -78,7 +79,7 @@ class TestDirectories:
             else:
                 return f'{file_type.value}_{graph_ix}_direction_{direction_ix}.{language.extension()}'
         elif file_type is FileType.DIRECTIONS:
-            return f'{file_type.value}_{graph_ix}.pickle'
+            return f'{file_type.value}_{graph_ix}.{DirectionStore.EXTENSION}'
         elif file_type is FileType.BUG_REPORT:
             return f'{language.extension()}_bug_graph_{graph_ix}_direction_{direction_ix}.txt'
         else:  # file_type == FileType.CFG
@@ -2,18 +2,23 @@ import argparse
 import logging
 import pickle
 
-from datetime import timedelta, datetime
-import random
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Iterator
 from TestDirectories import *
 
 from tqdm import tqdm
 
 from CFG.CFGGenerator import GeneratorConfig
 from languages import Language, WASMLang, GLSLLang
-from my_common.utils import generate_program, save_program, load_repo_paths_config, log_execution_time
+from my_common.utils import (generate_local_array_programs, generate_program, save_program, load_repo_paths_config,
+                             log_execution_time)
 from my_common.CodeType import CodeType
-from CFG import CFGGenerator
-from my_test import tst_generated_code
+from CFG import CFGCorpus, CFGGenerator, DirectionStore, FingerprintIndex, RandomStream
+from CFG.CFG import CFGFormat
+from my_test import execution_requirements, tst_generated_code
+from runner.pipeline import Pipeline, Stage
+from runner.scheduler import Scheduler
 
 
 def main():
@@ -23,36 +28,43 @@ def main():
 
     logging.info(f"Creating folders at {args.output_folder}...")
     test_directories = TestDirectories(f'./{args.output_folder}')
+    fingerprint_index = FingerprintIndex(args.fingerprint_index) if args.fingerprint_index else None
 
     @log_execution_time()
-    def process_cfgs():
+    def process_cfgs(cfgs):
         for i_ in tqdm(range(args.no_of_graphs), desc="Fleshing CFGs"):
-            cfg_ = pickle.load(open(f'{test_directories.cfg_filepath}/graph_{i_}.pickle', 'rb'))
+            cfg_ = cfgs[i_]
             flesh_cfgs(args, cfg_, i_, test_directories)
 
     @log_execution_time()
-    def run_tests():
+    def run_tests(cfgs):
         for g_ix in tqdm(range(args.no_of_graphs), desc="Running tests"):
 
-            paths = pickle.load(open(f'{test_directories.directions_filepath}/directions_{g_ix}.pickle', 'rb'))
+            # NB: holds the expected path (i.e. the oracle) for every direction, computed when the directions were
+            paths = DirectionStore(
+                f'{test_directories.directions_filepath}/directions_{g_ix}.{DirectionStore.EXTENSION}')
+            cfg_ = cfgs[g_ix]
             bug_report_memos = []
             g_passes_all_tests = True
 
-            # Load the program once for GLOBAL_ARRAY code type
+            # Load the program once for GLOBAL_ARRAY code type, else per direction
             if args.code_type is CodeType.GLOBAL_ARRAY:
                 program = pickle.load(open(f'{test_directories.program_filepath}/program_class_{g_ix}.pickle', "rb"))
+                programs = [program] * len(paths)
+            else:
+                programs = [pickle.load(open(
+                    f'{test_directories.program_filepath}/program_class_{g_ix}_direction_{d_ix}.pickle', "rb"
+                )) for d_ix in range(len(paths))]
+
+            # NB: every direction's test is queued at once, so they run as concurrently as the scheduler allows
+            results = [submit_test(programs[d_ix], direction, paths.expected_path(d_ix), d_ix, g_ix)
+                       for d_ix, direction in enumerate(paths)]
 
             for d_ix, direction in enumerate(paths):
 
                 p_passes_all_tests = True
-
-                # Load the program per direction for LOCAL_ARRAY code type
-                if args.code_type is CodeType.LOCAL_ARRAY:
-                    program = pickle.load(open(
-                        f'{test_directories.program_filepath}/program_class_{g_ix}_direction_{d_ix}.pickle', "rb"
-                    ))
-
-                match, msg = test_code(program, direction, d_ix, g_ix)
+                program = programs[d_ix]
+                match, msg = results[d_ix].result()
 
                 if not match:
                     g_passes_all_tests = False
@@ -71,11 +83,14 @@ def main():
                         test_directories.remove_file(FileType.PROGRAM_CLASS, graph_ix=g_ix, direction_ix=d_ix,
                                                      language=args.language, code_type=args.code_type)
 
+            paths.close()
+
             # Tidy test files
             if args.tidy:
                 if (g_passes_all_tests and args.tidy_mode == 'working') \
                         or (not g_passes_all_tests and args.tidy_mode == 'non-working'):
-                    test_directories.remove_file(FileType.CFG, graph_ix=g_ix)
+                    if args.cfg_format == 'pickle':
+                        test_directories.remove_file(FileType.CFG, graph_ix=g_ix)  # NB: can't drop one from a corpus
                     test_directories.remove_file(FileType.DIRECTIONS, graph_ix=g_ix)
                     if args.code_type == CodeType.GLOBAL_ARRAY:
                         test_directories.remove_file(FileType.CODE, graph_ix=g_ix,
@@ -83,32 +98,133 @@ def main():
                         test_directories.remove_file(FileType.PROGRAM_CLASS, graph_ix=g_ix,
                                                      language=args.language, code_type=args.code_type)
 
+            if fingerprint_index is not None:
+                fingerprint_index.add(cfg_.fingerprint())  # tested now, so later runs skip it
+
             if bug_report_memos:
                 logging.info(bug_report_memos)
 
     def create_bug_report(direction_, p_, msg_, program_, g_ix) -> str:
         bug_filename = f'{test_directories.bugs_filepath}/{program_.language.extension()}_bug_cfg_{g_ix}_path{p_}.txt'
         with open(bug_filename, 'w') as bug_file:
-            bug_file.write(f'CFG: {test_directories.cfg_filepath}/graph_{g_ix}.pickle\n\n')
+            if args.cfg_format == 'corpus':
+                bug_file.write(f'CFG: graph {g_ix} of {test_directories.cfg_filepath}/{CFGCorpus.DEFAULT_FILENAME}\n\n')
+            else:
+                bug_file.write(f'CFG: {test_directories.cfg_filepath}/graph_{g_ix}.pickle\n\n')
             bug_file.write(f"Directions: {direction_}\n\n")
             bug_file.write(msg_)
         return bug_filename
 
-    def test_code(program_, direction_, path_num, g_ix):
-        match_, msg_ = tst_generated_code(program_, direction_, config)
+    def test_code(program_, direction_, expected_path_, path_num, g_ix):
+        match_, msg_ = tst_generated_code(program_, direction_, config, expected_path=expected_path_)
         logging.debug(f'cfg_{g_ix}_path_{path_num}: {match_}, {msg_}')
         return match_, msg_
 
+    def submit_test(program_, direction_, expected_path_, path_num, g_ix) -> Future:
+        """Queue the test w/ the scheduler, holding what its backend needs. Earlier graphs go first"""
+        executor, needs = execution_requirements(program_.get_language())
+        return scheduler.submit(test_code, program_, direction_, expected_path_, path_num, g_ix,
+                                executor=executor, needs=needs, priority=-g_ix)
+
+    @log_execution_time()
+    def stream_tests():
+        """
+        Test each graph as soon as it's generated and fleshed (c.f. stream_test_records), rather than in phases. The
+        flesh, compile and execute stages run concurrently, each w/ its own workers, so the device needn't sit idle
+        while Python generates code
+        """
+        directions_rng = rng.child(1)
+        pipeline = Pipeline([
+            Stage('flesh', lambda item: flesh_record(args, *item, rng=directions_rng.child(item[0])),
+                  workers=args.flesh_workers),
+            Stage('compile', save_record_code, workers=args.compile_workers),
+            Stage('execute', run_record_tests, workers=args.execute_workers),
+        ], queue_size=args.queue_size)
+
+        cfgs = enumerate(stream_cfgs(args, rng, fingerprint_index))
+        for record in tqdm(pipeline.run(cfgs), total=args.no_of_graphs, desc="Testing CFGs"):
+            if fingerprint_index is not None:
+                fingerprint_index.add(record.cfg.fingerprint())  # tested now, so later runs skip it
+        logging.info(f"Stage utilisation:\n{pipeline.report()}")
+
+    def save_record_code(record: 'TestRecord') -> 'TestRecord':
+        """Save the record's code, so it can run (for WASM, this compiles and optimises it)"""
+        for p_ix, program in enumerate(record.programs):
+            suffix = f'_direction_{p_ix}' if args.code_type is CodeType.LOCAL_ARRAY else ''
+            save_program(program, f'{test_directories.code_filepath}/code_{record.graph_no}{suffix}',
+                         opt_level=getattr(args, 'opt_level', None))
+        return record
+
+    def run_record_tests(record: 'TestRecord') -> 'TestRecord':
+        """Test the record's (saved) code. Only a failing graph's CFG and directions are saved"""
+        g_ix = record.graph_no
+        is_local_array = args.code_type is CodeType.LOCAL_ARRAY
+
+        programs = record.programs if is_local_array else record.programs * len(record.directions)
+        results = [submit_test(programs[d_ix], direction, record.expected_paths[d_ix], d_ix, g_ix)
+                   for d_ix, direction in enumerate(record.directions)]
+
+        bug_report_memos = []
+        for d_ix, direction in enumerate(record.directions):
+
+            program = programs[d_ix]
+            match, msg = results[d_ix].result()
+
+            if not match:
+                if not bug_report_memos:  # NB: the bug reports point to these
+                    with open(test_directories.full_path(FileType.CFG, g_ix), 'wb') as f:
+                        pickle.dump(record.cfg, f)
+                    DirectionStore.save(test_directories.full_path(FileType.DIRECTIONS, g_ix), record.directions,
+                                        expected_paths=record.expected_paths)
+                bug_report_memos.append(create_bug_report(direction, d_ix, msg, program, g_ix))
+
+            # Tidy direction-specific test files
+            if args.tidy and is_local_array:
+                if (match and args.tidy_mode == 'working') or (not match and args.tidy_mode == 'non-working'):
+                    test_directories.remove_file(FileType.CODE, graph_ix=g_ix, direction_ix=d_ix,
+                                                 language=args.language, code_type=args.code_type)
+
+        # Tidy test files
+        g_passes_all_tests = not bug_report_memos
+        if args.tidy and not is_local_array:
+            if (g_passes_all_tests and args.tidy_mode == 'working') \
+                    or (not g_passes_all_tests and args.tidy_mode == 'non-working'):
+                test_directories.remove_file(FileType.CODE, graph_ix=g_ix,
+                                             language=args.language, code_type=args.code_type)
+
+        if bug_report_memos:
+            logging.info(bug_report_memos)
+        return record
+
     # ------------
 
+    # NB: everything random is drawn from its own child of one stream, so a seed gives the same tests for any --jobs
+    rng = RandomStream(args.seed)
+    # NB: every test runs through this, so backends sharing a device don't oversubscribe it
+    scheduler = Scheduler(gpu_slots=args.gpu_slots, cpu_slots=args.cpu_slots, memory_mb=args.memory_mb,
+                          executor_limits=args.executor_limits)
+
+    if args.stream:
+        stream_tests()
+        scheduler.shutdown()
+        if fingerprint_index is not None:
+            fingerprint_index.close()
+        logging.info("DONE!")
+        return
+
     logging.info("Generating CFGs...")
-    generate_cfgs(args, test_directories.cfg_filepath)
+    generate_cfgs(args, test_directories.cfg_filepath, fingerprint_index, seed=rng.child(0).getrandbits(64))
 
     logging.info("Generating directions...")
-    generate_direction_paths(args, test_directories.cfg_filepath, test_directories.directions_filepath)
-
-    process_cfgs()
-    run_tests()
+    generate_direction_paths(args, test_directories.cfg_filepath, test_directories.directions_filepath,
+                             rng=rng.child(1))
+
+    with cfg_loader(args, test_directories.cfg_filepath) as cfgs:
+        process_cfgs(cfgs)
+        run_tests(cfgs)
+    scheduler.shutdown()
+    if fingerprint_index is not None:
+        fingerprint_index.close()
     logging.info("DONE!")
 
 
@@ -119,11 +235,12 @@ def flesh_cfgs(args, cfg, i: int, test_directories):
         pickle.dump(program, open(f'{test_directories.program_filepath}/program_class_{i}.pickle', "wb"))
 
     elif args.code_type == CodeType.LOCAL_ARRAY:
-        # Each path needs its own program
-        directions = pickle.load(open(f'{test_directories.directions_filepath}/directions_{i}.pickle', 'rb'))
+        # Each path needs its own program, but they share one build of the code (only the directions array differs)
+        directions_filepath = f'{test_directories.directions_filepath}/directions_{i}.{DirectionStore.EXTENSION}'
+        with DirectionStore(directions_filepath) as store:
+            directions = list(store)
 
-        for p, directions_list in enumerate(directions):
-            program = generate_program(args, cfg, directions_list)
+        for p, program in enumerate(generate_local_array_programs(args, cfg, directions)):
             code_filepath = f'{test_directories.code_filepath}/code_{i}_direction_{p}'
             program_filepath = f'{test_directories.program_filepath}/program_class_{i}_direction_{p}.pickle'
             opt_level = getattr(args, 'opt_level', None)
@@ -144,63 +261,162 @@ def setup_logging(verbose: bool):
     logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=log_format)
 
 
-def generate_cfg_paths(cfg, graph_no, no_of_paths):
-    time_when_last_path_found = datetime.now()
-    TIME_LIMIT = timedelta(seconds=1)
+class TestRecord:
+    """
+    Everything needed to test one graph: its directions, their expected paths (the oracle) and the program(s) to run
+    them on: one for GLOBAL_ARRAY, else one per direction
+    """
 
-    paths_set = set()
+    def __init__(self, graph_no: int, cfg, directions: list[list[int]], expected_paths, programs: list):
+        self.graph_no = graph_no
+        self.cfg = cfg
+        self.directions = directions
+        self.expected_paths = expected_paths
+        self.programs = programs
 
-    aborted_path = False
 
-    def within_time_limit():
-        return datetime.now() - time_when_last_path_found < TIME_LIMIT
+def stream_cfgs(args, rng: RandomStream, fingerprint_index: FingerprintIndex = None) -> Iterator:
+    """
+    Lazily generate each graph in turn (across args.jobs processes), w/o anything round-tripping through disk. Draws
+    from the same stream as generate_cfgs, so a seed gives the same graphs
+    """
+    seed = rng.child(0).getrandbits(64)
+    if args.cfg_source == 'random':
+        return CFGGenerator(GeneratorConfig.allow_all(args.language)).stream_cfgs_method_uniform(
+            no_of_graphs=args.no_of_graphs, min_depth=args.min_depth, max_depth=args.max_depth,
+            fingerprint_index=fingerprint_index, no_of_blocks=args.no_of_blocks, jobs=args.jobs, seed=seed
+        )
+    elif args.cfg_source == 'swarm':
+        return CFGGenerator.stream_cfgs_method_swarm(
+            language=args.language, no_of_graphs=args.no_of_graphs, min_depth=args.min_depth,
+            max_depth=args.max_depth, fingerprint_index=fingerprint_index, no_of_blocks=args.no_of_blocks,
+            jobs=args.jobs, seed=seed
+        )
+    else:
+        raise ValueError("cfg_source not handled")
 
-    while len(paths_set) < no_of_paths and within_time_limit():
-        path = cfg.generate_valid_input_directions(max_length=512)
-        if tuple(path) not in paths_set:  # (tuple to make hashable)
-            time_when_last_path_found = datetime.now()
-            paths_set.add(tuple(path))
 
-    logging.debug(f'Paths for graph {graph_no}: {paths_set}')
+def flesh_record(args, graph_no: int, cfg, rng: RandomStream) -> TestRecord:
+    """Pick directions for the graph (from its own stream, c.f. generate_direction_paths) and generate its program(s)"""
+    directions, _ = generate_cfg_paths(cfg, graph_no=graph_no, no_of_paths=args.no_of_paths,
+                                       path_mode=args.path_mode, rng=rng)
+    if args.code_type is CodeType.GLOBAL_ARRAY:
+        programs = [generate_program(args, cfg)]
+    elif args.code_type is CodeType.LOCAL_ARRAY:
+        programs = generate_local_array_programs(args, cfg, directions)
+    else:
+        raise ValueError("Invalid code type")
+    return TestRecord(graph_no, cfg, directions, cfg.expected_output_paths(directions), programs)
+
+
+def stream_test_records(args, rng: RandomStream, fingerprint_index: FingerprintIndex = None) -> Iterator[TestRecord]:
+    """
+    Lazily generate, pick directions for and flesh each graph in turn, on this thread, so the first can be tested
+    while the rest are still being generated. Draws from the same streams as the phased harness (generate_cfgs,
+    generate_direction_paths), so a seed gives the same tests. C.f. stream_tests, which runs the stages concurrently.
+    """
+    directions_rng = rng.child(1)
+    for i, cfg in enumerate(stream_cfgs(args, rng, fingerprint_index)):
+        yield flesh_record(args, i, cfg, rng=directions_rng.child(i))
+
+
+def generate_cfg_paths(cfg, graph_no, no_of_paths, path_mode='random', rng=None):
+    if path_mode == 'coverage':
+        # NB: no_of_paths random paths are offered alongside the per-goal witnesses; only the covering set is kept
+        paths, report = cfg.freeze().generate_covering_input_directions(max_length=512, no_of_samples=no_of_paths,
+                                                                        rng=rng)
+        logging.info(f"Coverage for graph {graph_no}: {report}")
+        aborted_path = bool(report.uncovered)
+    else:
+        paths = cfg.freeze().generate_n_valid_input_directions(no_of_paths, max_length=512, rng=rng)
+        aborted_path = len(paths) < no_of_paths
+        if aborted_path:
+            logging.info(f"Only {len(paths)} distinct paths exist for CFG {graph_no} (max length 512)")
+
+    logging.debug(f'Paths for graph {graph_no}: {paths}')
+
+    return paths, aborted_path
+
+
+class PickledCFGs:
+    """The per-graph pickles in a folder, indexed by graph no. like a CFGCorpus (c.f. cfg_loader)"""
+
+    def __init__(self, cfg_filepath: str):
+        self.cfg_filepath = cfg_filepath
 
-    if len(paths_set) < no_of_paths:
-        aborted_path = True
-        logging.info(f"Aborted path generation for CFG {graph_no} (>1 seconds since found a distinct path)")
+    def __enter__(self):
+        return self
 
-    return [list(path) for path in paths_set], aborted_path
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, ix: int):
+        with open(f'{self.cfg_filepath}/graph_{ix}.pickle', 'rb') as file:
+            return pickle.load(file)
+
+    def close(self):
+        pass  # NB: each pickle's file is closed once it's loaded
+
+
+def cfg_loader(args, cfg_filepath: str) -> 'CFGCorpus | PickledCFGs':
+    """
+    The CFGs, indexed by graph no., from the corpus file or per-graph pickles (c.f. --cfg_format). Close it (or use
+    it as a context manager) once done w/ them: a corpus holds its file open, and its graphs decode lazily
+    """
+    if args.cfg_format == 'corpus':
+        return CFGCorpus(f'{cfg_filepath}/{CFGCorpus.DEFAULT_FILENAME}')
+    return PickledCFGs(cfg_filepath)
 
 
 @log_execution_time()
-def generate_cfgs(args, cfg_filepath: str):
+def generate_cfgs(args, cfg_filepath: str, fingerprint_index: FingerprintIndex = None, seed: int = None):
+    cfg_format = CFGFormat.CORPUS if args.cfg_format == 'corpus' else CFGFormat.CFG
     if args.cfg_source == 'random':
         CFGGenerator(GeneratorConfig.allow_all(args.language)).generate_cfgs_method_uniform(
             target_filepath=cfg_filepath, no_of_graphs=args.no_of_graphs,
-            min_depth=args.min_depth, max_depth=args.max_depth
+            min_depth=args.min_depth, max_depth=args.max_depth, fingerprint_index=fingerprint_index, fmt=cfg_format,
+            no_of_blocks=args.no_of_blocks, jobs=args.jobs, seed=seed
         )
     elif args.cfg_source == 'swarm':
         CFGGenerator.generate_cfgs_method_swarm(
             language=args.language, target_filepath=cfg_filepath, no_of_graphs=args.no_of_graphs,
-            min_depth=args.min_depth, max_depth=args.max_depth
+            min_depth=args.min_depth, max_depth=args.max_depth, fingerprint_index=fingerprint_index, fmt=cfg_format,
+            no_of_blocks=args.no_of_blocks, jobs=args.jobs, seed=seed
         )
     else:
         raise ValueError("cfg_source not handled")  # shouldn't get here anyway 'cause throws if invalid at start
 
 
 @log_execution_time()
-def generate_direction_paths(args, cfg_filepath, directions_filepath):
+def generate_direction_paths(args, cfg_filepath, directions_filepath, rng: RandomStream):
     aborted_paths = []
 
-    for i in tqdm(range(args.no_of_graphs), desc="Generating directions"):
-        cfg = pickle.load(open(f'{cfg_filepath}/graph_{i}.pickle', 'rb'))
-        paths, aborted_path = generate_cfg_paths(cfg, graph_no=i, no_of_paths=args.no_of_paths)
+    with cfg_loader(args, cfg_filepath) as cfgs:
+        for i in tqdm(range(args.no_of_graphs), desc="Generating directions"):
+            cfg = cfgs[i]
+            paths, aborted_path = generate_cfg_paths(cfg, graph_no=i, no_of_paths=args.no_of_paths,
+                                                     path_mode=args.path_mode, rng=rng.child(i))
 
-        if aborted_path:
-            aborted_paths.append(i)
+            if aborted_path:
+                aborted_paths.append(i)
 
-        pickle.dump(paths, open(f'{directions_filepath}/directions_{i}.pickle', "wb"))
+            DirectionStore.save(f'{directions_filepath}/directions_{i}.{DirectionStore.EXTENSION}',
+                                paths, expected_paths=cfg.expected_output_paths(paths))
 
     if len(aborted_paths) > 0:
-        logging.debug(f"Aborted path generation for CFGs {aborted_paths} (>1 seconds since found a distinct path)")
+        if args.path_mode == 'coverage':
+            logging.debug(f"Some coverage goals are unreachable for CFGs {aborted_paths}")
+        else:
+            logging.debug(f"Fewer than {args.no_of_paths} distinct paths exist for CFGs {aborted_paths}")
+
+
+def parse_executor_limits(limits: str) -> dict[str, int]:
+    """E.g. 'dawn=1,node=8' -> {'dawn': 1, 'node': 8}"""
+    try:
+        return {executor.strip(): int(limit) for executor, limit in
+                (pair.split('=') for pair in limits.split(',') if pair.strip())}
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid executor limits: {limits}. Expected e.g. 'dawn=1,node=8'")
 
 
 def parse_command_line_args():
@@ -230,7 +446,45 @@ def parse_command_line_args():
     parser.add_argument("--seed", type=int, help="Seed for randomness", default=None)
     parser.add_argument("--min_depth", type=int, default=3)
     parser.add_argument("--max_depth", type=int, default=5)
+    parser.add_argument("--no_of_blocks", type=int, default=None,
+                        help="Generate CFGs of exactly this many blocks (e.g. 10^4+, to stress compilers), with "
+                             "nesting bounded by a depth in [min_depth, max_depth]. By default, size isn't targeted.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Generate CFGs across this many processes. With --seed, the CFGs are the same for any "
+                             "no. of jobs.")
     parser.add_argument("--output_folder", type=str)
+    parser.add_argument("--cfg_format", type=str, choices=["pickle", "corpus"], default="pickle",
+                        help="How generated CFGs are stored. 'pickle': one file per graph. "
+                             "'corpus': all graphs in one memory-mapped file (faster to load, far fewer files).")
+    parser.add_argument("--fingerprint_index", type=str, default=None,
+                        help="SQLite file of fingerprints of CFGs tested in earlier runs (created if missing). "
+                             "Those CFGs aren't generated again, and this run's CFGs are added once tested.")
+    parser.add_argument("--path_mode", type=str, choices=["random", "coverage"], default="random",
+                        help="How to choose the directions tested for each graph. "
+                             "'random': no_of_paths distinct paths, drawn uniformly. "
+                             "'coverage': a small set of paths that takes every edge and runs every loop 0, 1 and "
+                             "many times (no_of_paths random paths are considered alongside per-goal paths).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Test each graph as soon as it's generated and fleshed, rather than generating every "
+                             "graph, then every set of directions, etc. Only failing graphs' CFGs and directions "
+                             "are kept (as pickles), so it's quicker to the first result and uses far less disk.")
+    parser.add_argument("--flesh_workers", type=int, default=1,
+                        help="With --stream, threads picking directions and generating code for each graph.")
+    parser.add_argument("--compile_workers", type=int, default=1,
+                        help="With --stream, threads saving (for WASM, compiling and optimising) code.")
+    parser.add_argument("--execute_workers", type=int, default=1,
+                        help="With --stream, threads running tests. NB: >1 only if the backend is safe to run "
+                             "concurrently.")
+    parser.add_argument("--queue_size", type=int, default=4,
+                        help="With --stream, how many graphs can wait between stages before the earlier stage blocks.")
+    parser.add_argument("--gpu_slots", type=int, default=1,
+                        help="How many tests can use the GPU (Dawn, ShaderTrap) at once.")
+    parser.add_argument("--cpu_slots", type=int, default=None,
+                        help="How many tests can run CPU-bound tools (e.g. Node) at once. Defaults to the no. of CPUs.")
+    parser.add_argument("--memory_mb", type=int, default=None,
+                        help="Memory the tests running at once can hold between them. By default, not limited.")
+    parser.add_argument("--executor_limits", type=parse_executor_limits, default={},
+                        help="Per-backend concurrency limits, e.g. 'dawn=1,shadertrap=2,node=8'.")
     parser.add_argument("--verbose", action="store_true", help="Print results for every test")
     parser.add_argument("--tidy", type=bool, nargs='?', const=True, default=True,
                         help="Clean up after the tests. Defaults to True if not specified.")
@@ -252,15 +506,21 @@ def parse_command_line_args():
         parser.error("args.min_depth > args.max_depth")
     if args.code_type == 'header_guard':
         parser.error("The 'header_guard' code type is not fully supported yet")
+    if isinstance(args.language, WASMLang) and args.code_type == CodeType.LOCAL_ARRAY:
+        parser.error("WASM doesn't support the 'local_array' code type, use 'global_array'")
+    if args.stream and args.cfg_format == 'corpus':
+        parser.error("--stream only keeps failing CFGs, as pickles, so can't write a corpus")
+    if args.gpu_slots < 0 or (args.cpu_slots is not None and args.cpu_slots < 1) \
+            or any(limit < 1 for limit in args.executor_limits.values()):
+        parser.error("--gpu_slots must be >= 0, and --cpu_slots and --executor_limits >= 1")
+    if min(args.flesh_workers, args.compile_workers, args.execute_workers, args.queue_size) < 1:
+        parser.error("--flesh_workers, --compile_workers, --execute_workers and --queue_size must be >= 1")
 
     # Final arg assignment
     if args.output_folder is None:
         timestamp = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
         opt_level_str = f'-{args.opt_level}' if hasattr(args, 'opt_level') and args.opt_level else ''
         args.output_folder = f'./{timestamp}_{args.language}_{opt_level_str}_TEST'
-    if args.seed is not None:
-        random.seed(args.seed)
-
     return args
 
 